@@ -0,0 +1,338 @@
+import argparse
+from array import array
+import json
+import logging
+import math
+import re
+import time
+import numpy as np
+import carrierMatrix
+
+logger = logging.getLogger()
+
+# binary replacement for the finder's -vpi.json, -ipv.json, -all.json and -tout.json: one compressed .npz with
+#   samples, samples/<annotation>     sample table (sample ids, seqCenter and study)
+#   variants/CHROM|POS|REF|ALT|class   variant table, one row per carrier matrix column
+#   calls/indptr|indices|data          the carrier matrix as CSR arrays (see carrierMatrix.py)
+#   ipv/order, ipv/<key>               ipv key order and the per-variant values the finder adds to ipv
+#   tout/<class>/CHROM|POS|REF|ALT     the classified variants read from the pathogenicity file
+#   meta                               json: format version, ipv value keys and tout classes
+# -all.json is not stored; it is rebuilt from the carrier matrix.
+formatVersion = 1
+ipvSetKeys = ['heterozygous individuals', 'homozygous individuals']
+
+# per value state of an annotation column
+PRESENT, NONE, NAN, ABSENT = 0, 1, 2, 3
+
+
+class Absent(object):
+    # marks a key an ipv entry does not have
+    pass
+
+ABSENT_VALUE = Absent()
+
+
+def isNaN(value):
+    return isinstance(value, (float, np.floating)) and math.isnan(value)
+
+def columnKind(values):
+    if all(isinstance(v, (bool, np.bool_)) for v in values):
+        return 'bool'
+    elif all(isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_)) for v in values):
+        return 'int'
+    elif all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+             for v in values):
+        return 'float'
+    else:
+        return 'str'
+
+def packColumn(arrays, name, values):
+    # stores a list of python values (None, NaN and absent included) as a typed array plus a state array
+    states = np.array([ABSENT if v is ABSENT_VALUE else NONE if v is None else NAN if isNaN(v) else PRESENT
+                       for v in values], dtype=np.int8)
+    present = [v for v, s in zip(values, states) if s == PRESENT]
+    kind = columnKind(present)
+    fillers = {'bool': False, 'int': 0, 'float': 0.0, 'str': ''}
+    dtypes = {'bool': bool, 'int': np.int64, 'float': np.float64, 'str': str}
+    column = [v if s == PRESENT else fillers[kind] for v, s in zip(values, states)]
+    if kind == 'str':
+        column = [str(v) for v in column]
+    arrays[name] = np.array(column, dtype=dtypes[kind])
+    arrays[name + '/state'] = states
+
+def unpackColumn(data, name):
+    values = list()
+    for value, state in zip(data[name].tolist(), data[name + '/state']):
+        if state == PRESENT:
+            values.append(value)
+        elif state == NONE:
+            values.append(None)
+        elif state == NAN:
+            values.append(float('nan'))
+        else:
+            values.append(ABSENT_VALUE)
+    return values
+
+def packVariants(arrays, prefix, variants):
+    arrays[prefix + 'CHROM'] = np.array([str(v[0]) for v in variants], dtype=str)
+    arrays[prefix + 'POS'] = np.array([int(v[1]) for v in variants], dtype=np.int64)
+    arrays[prefix + 'REF'] = np.array([str(v[2]) for v in variants], dtype=str)
+    arrays[prefix + 'ALT'] = np.array([str(v[3]) for v in variants], dtype=str)
+
+def unpackVariants(data, prefix):
+    return list(zip(data[prefix + 'CHROM'].tolist(), data[prefix + 'POS'].tolist(), data[prefix + 'REF'].tolist(),
+                    data[prefix + 'ALT'].tolist()))
+
+
+def save(fileName, matrix, individualsPerVariant=None, variantsPerClass=None):
+    # matrix is a carrierMatrix.CarrierMatrix; individualsPerVariant the ipv dict (or view) with the values the
+    # finder added to each entry; variantsPerClass the tout dict of benign/pathogenic/vus variant sets
+    t = time.time()
+    arrays = dict()
+    meta = {'version': formatVersion, 'ipvKeys': None, 'tout': None}
+    arrays['samples'] = np.array(matrix.samples, dtype=str)
+    packColumn(arrays, 'samples/seqCenter', matrix.seqCenters)
+    packColumn(arrays, 'samples/study', matrix.studies)
+    packVariants(arrays, 'variants/', matrix.variants)
+    arrays['variants/class'] = matrix.classes
+    arrays['calls/indptr'] = matrix.csr.indptr
+    arrays['calls/indices'] = matrix.csr.indices
+    arrays['calls/data'] = matrix.csr.data
+
+    if individualsPerVariant is not None:
+        order = list()
+        keys = list()
+        for v in individualsPerVariant:
+            if v not in matrix.variantIndex:
+                raise ValueError('variant ' + v + ' is in ipv but has no carriers in vpi')
+            order.append(matrix.variantIndex[v])
+            for key in individualsPerVariant[v]:
+                if key not in ipvSetKeys and key not in keys:
+                    keys.append(key)
+        arrays['ipv/order'] = np.array(order, dtype=np.int64)
+        entries = dict()
+        for v in individualsPerVariant:
+            entries[matrix.variantIndex[v]] = individualsPerVariant[v]
+        for key in keys:
+            packColumn(arrays, 'ipv/' + key, [entries[j].get(key, ABSENT_VALUE) if j in entries else ABSENT_VALUE
+                                              for j in range(len(matrix.variants))])
+        meta['ipvKeys'] = keys
+
+    if variantsPerClass is not None:
+        meta['tout'] = list(variantsPerClass)
+        for variantClass in variantsPerClass:
+            packVariants(arrays, 'tout/' + variantClass + '/', [tuple(v) for v in variantsPerClass[variantClass]])
+
+    arrays['meta'] = np.array(json.dumps(meta))
+    np.savez_compressed(fileName, **arrays)
+    logger.info('elapsed time in carrierArchive.save() ' + str(time.time() - t))
+
+
+class CarrierArchive(object):
+    # an archive read back into memory; the methods give the artifacts in the dict shapes the JSON files had
+
+    def __init__(self, matrix, ipvOrder=None, ipvColumns=None, variantsPerClass=None):
+        self.matrix = matrix
+        self.ipvOrder = ipvOrder
+        self.ipvColumns = ipvColumns if ipvColumns is not None else dict()
+        self.toutVariants = variantsPerClass
+
+    def variantsPerIndividual(self):
+        return dict(self.matrix.variantsPerIndividual())
+
+    def individualsPerVariant(self):
+        # individuals come back as lists in sample order, as json.load() returns them
+        view = self.matrix.individualsPerVariant()
+        order = self.ipvOrder if self.ipvOrder is not None else [self.matrix.variantIndex[v] for v in view]
+        individualsPerVariant = dict()
+        for j in order:
+            v = str(self.matrix.variants[j])
+            entry = dict()
+            for key in ipvSetKeys:
+                entry[key] = sorted(view[v][key], key=lambda s: self.matrix.sampleIndex[s])
+            for key in self.ipvColumns:
+                if self.ipvColumns[key][j] is not ABSENT_VALUE:
+                    entry[key] = self.ipvColumns[key][j]
+            individualsPerVariant[v] = entry
+        return individualsPerVariant
+
+    def allVariantsPerClass(self):
+        # every call per class, individual by individual, as getAllVariantsPerClass() builds it for -all.json
+        allVariants = {'benign': list(), 'pathogenic': list(), 'vus': list()}
+        vpi = self.matrix.variantsPerIndividual()
+        for individual in vpi:
+            for variantClass in allVariants:
+                allVariants[variantClass].extend(vpi[individual][variantClass])
+        return allVariants
+
+    def variantsPerClass(self):
+        # the tout dict: benign/pathogenic/vus lists of (c, p, r, a), or None if the archive has none
+        return self.toutVariants
+
+
+def load(fileName):
+    t = time.time()
+    with np.load(fileName, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['version'] != formatVersion:
+            raise ValueError('unsupported carrier archive version ' + str(meta['version']) + ' in ' + fileName)
+        samples = data['samples'].tolist()
+        variants = unpackVariants(data, 'variants/')
+        indptr, indices, codes = data['calls/indptr'], data['calls/indices'], data['calls/data']
+        sampleIndices = np.repeat(np.arange(len(samples)), np.diff(indptr))
+        matrix = carrierMatrix.CarrierMatrix(samples, variants, data['variants/class'], sampleIndices, indices, codes,
+                                             unpackColumn(data, 'samples/seqCenter'),
+                                             unpackColumn(data, 'samples/study'))
+        ipvOrder = None
+        ipvColumns = dict()
+        if meta['ipvKeys'] is not None:
+            ipvOrder = data['ipv/order'].tolist()
+            for key in meta['ipvKeys']:
+                ipvColumns[key] = unpackColumn(data, 'ipv/' + key)
+        variantsPerClass = None
+        if meta['tout'] is not None:
+            variantsPerClass = dict()
+            for variantClass in meta['tout']:
+                variantsPerClass[variantClass] = unpackVariants(data, 'tout/' + variantClass + '/')
+    logger.info('elapsed time in carrierArchive.load() ' + str(time.time() - t))
+    return CarrierArchive(matrix, ipvOrder, ipvColumns, variantsPerClass)
+
+def isArchive(fileName):
+    return fileName.endswith('.npz')
+
+def loadVariantsPerIndividual(fileName):
+    # vpi from either a -vpi.json file or a carrier archive
+    if isArchive(fileName):
+        return load(fileName).variantsPerIndividual()
+    with open(fileName, 'r') as f:
+        vpiDict = json.load(f)
+    f.close()
+    return vpiDict
+
+def iterateItems(text):
+    # (key, value) pairs of the top-level object of a json document, decoded one value at a time, so only one
+    # value's python objects exist at once
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'[ \t\n\r]*')
+    i = whitespace.match(text, 0).end()
+    if text[i:i + 1] != '{':
+        raise ValueError('expected a json object at position ' + str(i))
+    i = whitespace.match(text, i + 1).end()
+    if text[i:i + 1] == '}':
+        return
+    while True:
+        key, i = decoder.raw_decode(text, i)
+        i = whitespace.match(text, i).end()
+        if text[i:i + 1] != ':':
+            raise ValueError('expected : at position ' + str(i))
+        value, i = decoder.raw_decode(text, whitespace.match(text, i + 1).end())
+        yield key, value
+        i = whitespace.match(text, i).end()
+        if text[i:i + 1] == '}':
+            return
+        if text[i:i + 1] != ',':
+            raise ValueError('expected , or } at position ' + str(i))
+        i = whitespace.match(text, i + 1).end()
+
+def readCarrierMatrix(fileName):
+    # the carrier matrix of a -vpi.json file, the same one CarrierMatrix.fromVariantsPerIndividual() builds from its
+    # dict, without the dict: each individual is decoded on its own and its calls appended to flat (sample index,
+    # variant index, genotype code) arrays, with a class code per variant
+    t = time.time()
+    with open(fileName, 'r') as f:
+        text = f.read()
+    f.close()
+    samples, seqCenters, studies = list(), list(), list()
+    variantIndex = dict()
+    variantClasses = list()
+    sampleIndices, variantIndices, genotypeCodes = array('i'), array('i'), array('b')
+    for individual, entry in iterateItems(text):
+        i = len(samples)
+        samples.append(individual)
+        seqCenters.append('NA')
+        studies.append('NA')
+        first = True
+        for c in range(len(carrierMatrix.variantClasses)):
+            for call in entry[carrierMatrix.variantClasses[c]]:
+                if not call:
+                    continue
+                v = tuple(call[0])
+                j = variantIndex.setdefault(v, len(variantIndex))
+                if j == len(variantClasses):
+                    variantClasses.append(c)
+                else:
+                    # a variant listed under more than one class takes the last one, as in fromVariantsPerIndividual()
+                    variantClasses[j] = c
+                sampleIndices.append(i)
+                variantIndices.append(j)
+                genotypeCodes.append(int(call[1]))
+                if first and len(call) > 3:
+                    seqCenters[i], studies[i] = call[2], call[3]
+                    first = False
+    del text
+
+    # number the variants in coordinate order
+    variants = list(variantIndex)
+    order = sorted(range(len(variants)), key=lambda j: (str(variants[j][0]), int(variants[j][1]),
+                                                        str(variants[j][2]), str(variants[j][3])))
+    renumber = np.empty(len(variants), dtype=np.int64)
+    renumber[order] = np.arange(len(variants))
+    matrix = carrierMatrix.CarrierMatrix(samples, [variants[j] for j in order], [variantClasses[j] for j in order],
+                                         np.frombuffer(sampleIndices, dtype=np.int32),
+                                         renumber[np.frombuffer(variantIndices, dtype=np.int32)],
+                                         np.frombuffer(genotypeCodes, dtype=np.int8), seqCenters, studies)
+    logger.info('elapsed time in carrierArchive.readCarrierMatrix() ' + str(time.time() - t))
+    return matrix
+
+def loadCarrierMatrix(fileName):
+    # carrier matrix from either a -vpi.json file or a carrier archive
+    if isArchive(fileName):
+        return load(fileName).matrix
+    return readCarrierMatrix(fileName)
+
+def loadIndividualsPerVariant(fileName):
+    # ipv from either a -ipv.json file or a carrier archive
+    if isArchive(fileName):
+        return load(fileName).individualsPerVariant()
+    with open(fileName, 'r') as f:
+        ipvDict = json.load(f)
+    f.close()
+    return ipvDict
+
+def convert(vpiFileName, outFileName, ipvFileName=None, toutFileName=None):
+    # one-shot conversion of existing JSON outputs to an archive
+    logger.info('reading vpi from ' + vpiFileName)
+    with open(vpiFileName, 'r') as f:
+        vpiDict = json.load(f)
+    f.close()
+    ipvDict = None
+    if ipvFileName is not None:
+        logger.info('reading ipv from ' + ipvFileName)
+        with open(ipvFileName, 'r') as f:
+            ipvDict = json.load(f)
+        f.close()
+    toutDict = None
+    if toutFileName is not None:
+        logger.info('reading tout from ' + toutFileName)
+        with open(toutFileName, 'r') as f:
+            toutDict = json.load(f)
+        f.close()
+    logger.info('saving carrier archive to ' + outFileName)
+    save(outFileName, carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpiDict), ipvDict, toutDict)
+
+def parseArgs():
+    parser = argparse.ArgumentParser(usage="carrierArchive --vpi vpi.json --out carriers.npz [options]")
+    parser.add_argument("--vpi", dest="vpi", help="vpi json file name", required=True)
+    parser.add_argument("--out", dest="out", help="output carrier archive (.npz) file name", required=True)
+    parser.add_argument("--ipv", dest="ipv", help="(optional) ipv json file name. Default=None", default=None)
+    parser.add_argument("--tout", dest="tout", help="(optional) tout json file name. Default=None", default=None)
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig()
+    logger.setLevel(logging.INFO)
+    options = parseArgs()
+    convert(options.vpi, options.out, options.ipv, options.tout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+from collections.abc import Mapping
+import numpy as np
+from scipy import sparse
+
+# pathogenicity classes, in the order they are listed per individual
+variantClasses = ['benign', 'pathogenic', 'vus']
+# genotype codes: 1 = 0|1, 2 = 1|0, 3 = 1|1 (0 = not a carrier, never stored)
+homozygousCode = 3
+
+
+class CarrierMatrix(object):
+    # samples x variants sparse matrix of genotype codes (int8), with the sample and variant index tables.
+    # only carrier calls are stored, so a rare-variant cohort costs memory in proportion to its calls, not its size.
+    # rows are kept as CSR for per-individual access and as CSC (built on first use) for per-variant access.
+
+    def __init__(self, samples, variants, classes, sampleIndices, variantIndices, genotypeCodes, seqCenters=None,
+                 studies=None):
+        # samples: sample ids; variants: (c, p, r, a) tuples; classes: index into variantClasses per variant;
+        # seqCenters/studies: per sample annotation, "NA" when not given
+        self.samples = list(samples)
+        self.variants = [tuple(v) for v in variants]
+        self.classes = np.asarray(classes, dtype=np.int8)
+        self.seqCenters = list(seqCenters) if seqCenters is not None else ['NA'] * len(self.samples)
+        self.studies = list(studies) if studies is not None else ['NA'] * len(self.samples)
+        # a (sample, variant) pair given more than once (a record repeated in the VCF) keeps its first code; the
+        # coordinate constructor would add the codes up (1 + 2 reads as homozygous, 3 + 3 as neither)
+        numSamples, numVariants = len(self.samples), len(self.variants)
+        keys = np.asarray(sampleIndices, dtype=np.int64) * numVariants + np.asarray(variantIndices, dtype=np.int64)
+        keys, first = np.unique(keys, return_index=True)
+        rows = keys // max(numVariants, 1)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=numSamples))])
+        self.csr = sparse.csr_matrix((np.asarray(genotypeCodes, dtype=np.int8)[first], keys - rows * numVariants,
+                                      indptr), shape=(numSamples, numVariants), dtype=np.int8)
+        self.csc = None
+        self.sampleIndex = dict()
+        for i in range(len(self.samples)):
+            self.sampleIndex[self.samples[i]] = i
+        self.variantIndex = dict()
+        for j in range(len(self.variants)):
+            self.variantIndex[str(self.variants[j])] = j
+
+    @classmethod
+    def fromVariantsPerIndividual(cls, variantsPerIndividual):
+        # builds the matrix from a variants per individual dict (as saved in vpi.json); variants are numbered in
+        # coordinate order, and each sample takes its seqCenter and study from its first call. a view over a matrix
+        # gives back that matrix.
+        if isinstance(variantsPerIndividual, VariantsPerIndividual):
+            return variantsPerIndividual.matrix
+        variantClass = dict()
+        for individual in variantsPerIndividual:
+            for c in range(len(variantClasses)):
+                for call in variantsPerIndividual[individual][variantClasses[c]]:
+                    if call:
+                        variantClass[tuple(call[0])] = c
+        variants = sorted(variantClass, key=lambda v: (str(v[0]), int(v[1]), str(v[2]), str(v[3])))
+        variantIndex = dict()
+        for j in range(len(variants)):
+            variantIndex[variants[j]] = j
+        samples = list(variantsPerIndividual)
+        seqCenters = ['NA'] * len(samples)
+        studies = ['NA'] * len(samples)
+        sampleIndices, variantIndices, genotypeCodes = list(), list(), list()
+        for i in range(len(samples)):
+            first = True
+            for variantClassName in variantClasses:
+                for call in variantsPerIndividual[samples[i]][variantClassName]:
+                    if not call:
+                        continue
+                    sampleIndices.append(i)
+                    variantIndices.append(variantIndex[tuple(call[0])])
+                    genotypeCodes.append(int(call[1]))
+                    if first and len(call) > 3:
+                        seqCenters[i], studies[i] = call[2], call[3]
+                        first = False
+        return cls(samples, variants, [variantClass[v] for v in variants], sampleIndices, variantIndices,
+                   genotypeCodes, seqCenters, studies)
+
+    @property
+    def shape(self):
+        return self.csr.shape
+
+    def getCSC(self):
+        if self.csc is None:
+            self.csc = self.csr.tocsc()
+            self.csc.sort_indices()
+        return self.csc
+
+    def row(self, sample):
+        # (variant indices, genotype codes) of sample's calls, in variant order
+        start, end = self.csr.indptr[sample], self.csr.indptr[sample + 1]
+        return self.csr.indices[start:end], self.csr.data[start:end]
+
+    def column(self, variant):
+        # (sample indices, genotype codes) of the carriers of variant, in sample order
+        csc = self.getCSC()
+        start, end = csc.indptr[variant], csc.indptr[variant + 1]
+        return csc.indices[start:end], csc.data[start:end]
+
+    def entryRows(self):
+        # sample index of every stored call, parallel to csr.indices and csr.data
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.csr.indptr))
+
+    def genotypeCounts(self):
+        # (heterozygous, homozygous) carrier counts per variant
+        homozygous = self.csr.data == homozygousCode
+        return (np.bincount(self.csr.indices[~homozygous], minlength=self.shape[1]),
+                np.bincount(self.csr.indices[homozygous], minlength=self.shape[1]))
+
+    def genotypeCountsPerSample(self, variantClass):
+        # (heterozygous, homozygous) call counts per sample over the variants of one class
+        inClass = self.classes[self.csr.indices] == variantClasses.index(variantClass)
+        homozygous = self.csr.data == homozygousCode
+        rows = self.entryRows()
+        return (np.bincount(rows[inClass & ~homozygous], minlength=self.shape[0]),
+                np.bincount(rows[inClass & homozygous], minlength=self.shape[0]))
+
+    def firstCarriers(self, mask=None):
+        # variant indices with at least one (masked) call, ordered by where their first call appears when the
+        # individuals are walked in order and each individual's calls are listed class by class
+        indices = self.csr.indices if mask is None else self.csr.indices[mask]
+        rows = self.entryRows() if mask is None else self.entryRows()[mask]
+        order = np.lexsort((indices, self.classes[indices], rows))
+        variants, first = np.unique(indices[order], return_index=True)
+        return variants[np.argsort(first)]
+
+    def countCooccurrences(self, geneIds, phased):
+        # n: number of carriers of each vus. k: number of (vus, pathogenic) call pairs per vus where both variants
+        # have the same geneIds entry and, when phased, the pair is in cis (vus 1|1, or 1|0 with 0|1, or 0|1 with
+        # 1|0) -- the pairs sameGeneSameParent() accepts. per gene, k is the vus carrier matrix transposed times a
+        # per-sample count of the pathogenic calls that would pair with it. both are arrays over all variants.
+        geneIds = np.asarray(geneIds)
+        vus = self.classes == variantClasses.index('vus')
+        pathogenic = self.classes == variantClasses.index('pathogenic')
+        n = np.where(vus, np.diff(self.getCSC().indptr), 0)
+        k = np.zeros(self.shape[1], dtype=np.int64)
+        for geneId in np.unique(geneIds):
+            vusColumns = np.nonzero(vus & (geneIds == geneId))[0]
+            pathogenicColumns = np.nonzero(pathogenic & (geneIds == geneId))[0]
+            if len(vusColumns) == 0 or len(pathogenicColumns) == 0:
+                continue
+            vusCalls = self.csr[:, vusColumns]
+            pathogenicCalls = self.csr[:, pathogenicColumns]
+            pathogenicPerSample = np.asarray((pathogenicCalls != 0).sum(axis=1)).ravel()
+            if not phased:
+                k[vusColumns] = (vusCalls != 0).astype(np.int64).T.dot(pathogenicPerSample)
+            else:
+                pathogenic01 = np.asarray((pathogenicCalls == 1).sum(axis=1)).ravel()
+                pathogenic10 = np.asarray((pathogenicCalls == 2).sum(axis=1)).ravel()
+                k[vusColumns] = (vusCalls == homozygousCode).astype(np.int64).T.dot(pathogenicPerSample) + \
+                                (vusCalls == 2).astype(np.int64).T.dot(pathogenic01) + \
+                                (vusCalls == 1).astype(np.int64).T.dot(pathogenic10)
+        return n, k
+
+    def cooccurringPairs(self, geneIds, phased):
+        # the (sample, vus, pathogenic) triples counted in k by countCooccurrences(), walking the individuals in
+        # order and each individual's vus x pathogenic calls in variant order. only individuals that carry both a
+        # vus and a pathogenic variant are visited.
+        vus = self.classes == variantClasses.index('vus')
+        pathogenic = self.classes == variantClasses.index('pathogenic')
+        rows = self.entryRows()
+        both = np.intersect1d(rows[vus[self.csr.indices]], rows[pathogenic[self.csr.indices]])
+        for sample in both:
+            variants, codes = self.row(sample)
+            for v, vusCode in zip(variants[vus[variants]], codes[vus[variants]]):
+                for p, pathogenicCode in zip(variants[pathogenic[variants]], codes[pathogenic[variants]]):
+                    if geneIds[v] != geneIds[p]:
+                        continue
+                    if phased and not (vusCode == homozygousCode or (vusCode == 2 and pathogenicCode == 1) or
+                                       (vusCode == 1 and pathogenicCode == 2)):
+                        continue
+                    yield sample, v, p
+
+    def variantsPerIndividual(self):
+        return VariantsPerIndividual(self)
+
+    def individualsPerVariant(self):
+        return IndividualsPerVariant(self)
+
+
+def annotate(mapping, key, values):
+    # adds values to the entry of key, in a dict of entries or in a view (where the entries are built on lookup and
+    # changing one in place would be lost)
+    if isinstance(mapping, MatrixView):
+        mapping.annotate(key, values)
+    else:
+        mapping[key].update(values)
+
+
+class MatrixView(Mapping):
+    # read-only mapping over a carrier matrix; each lookup builds a fresh entry from the matrix and nothing is kept,
+    # so a full pass (the json writer, the ipv walk) does not leave a nested dict copy of the matrix behind. values
+    # added with annotate() are kept in a dict of their own and merged into the entries they belong to
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.annotations = dict()
+
+    def __getitem__(self, key):
+        entry = self.makeEntry(self.index()[key])
+        if key in self.annotations:
+            entry.update(self.annotations[key])
+        return entry
+
+    def annotate(self, key, values):
+        if key not in self.index():
+            raise KeyError(key)
+        if key not in self.annotations:
+            self.annotations[key] = dict()
+        self.annotations[key].update(values)
+
+    def __contains__(self, key):
+        return key in self.index()
+
+    def __len__(self):
+        return len(self.index())
+
+
+class VariantsPerIndividual(MatrixView):
+    # sample id -> {'benign': [...], 'pathogenic': [...], 'vus': [...]}, each call ((c, p, r, a), code, seqCenter,
+    # study) -- the same entries the finder built per individual
+
+    def index(self):
+        return self.matrix.sampleIndex
+
+    def __iter__(self):
+        return iter(self.matrix.samples)
+
+    def makeEntry(self, sample):
+        m = self.matrix
+        entry = {'benign': list(), 'pathogenic': list(), 'vus': list()}
+        variants, codes = m.row(sample)
+        for variant, code in zip(variants, codes):
+            entry[variantClasses[m.classes[variant]]].append((m.variants[variant], str(code), m.seqCenters[sample],
+                                                              m.studies[sample]))
+        return entry
+
+
+class IndividualsPerVariant(MatrixView):
+    # str((c, p, r, a)) -> {'heterozygous individuals': set, 'homozygous individuals': set}, in the order the
+    # variants are first seen walking the individuals, as findIndividualsPerVariant() adds them
+
+    def __init__(self, matrix):
+        MatrixView.__init__(self, matrix)
+        self.order = None
+
+    def index(self):
+        return self.matrix.variantIndex
+
+    def __iter__(self):
+        if self.order is None:
+            self.order = [str(self.matrix.variants[j]) for j in self.matrix.firstCarriers()]
+        return iter(self.order)
+
+    def makeEntry(self, variant):
+        m = self.matrix
+        samples, codes = m.column(variant)
+        return {'heterozygous individuals': set(m.samples[s] for s in samples[codes != homozygousCode]),
+                'homozygous individuals': set(m.samples[s] for s in samples[codes == homozygousCode])}
@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tarfile
+import numpy as np
+import pandas as pd
+import profiling
+
+logger = logging.getLogger()
+
+# part of every stage key; bump it when a stage's output changes shape so old checkpoints are not reused
+checkpointVersion = 1
+
+
+class File(object):
+    # a stage input that is a file: it is fingerprinted by path, size and modification time, the way the genotype
+    # cache keys a VCF, instead of hashing what may be gigabytes of content
+    def __init__(self, fileName):
+        self.fileName = fileName
+
+    def fingerprint(self):
+        if self.fileName is None or self.fileName == '':
+            return 'File(None)'
+        path = os.path.abspath(self.fileName)
+        if not os.path.exists(path):
+            return 'File(' + path + ', missing)'
+        return 'File(' + path + ', ' + str(os.path.getsize(path)) + ', ' + repr(os.path.getmtime(path)) + ')'
+
+
+def fingerprint(value):
+    # text standing for a stage input. upstream stages stand for their key, frames and arrays for a hash of their
+    # content, containers for their items and anything else for its repr()
+    if isinstance(value, Stage):
+        return 'Stage(' + value.key + ')'
+    elif isinstance(value, File):
+        return value.fingerprint()
+    elif isinstance(value, pd.DataFrame):
+        digest = hashlib.sha1(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        digest.update(repr(list(value.columns)).encode('utf-8'))
+        return 'DataFrame(' + digest.hexdigest() + ')'
+    elif isinstance(value, np.ndarray):
+        return 'ndarray(' + str(value.dtype) + ', ' + str(value.shape) + ', ' + \
+               hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest() + ')'
+    elif isinstance(value, dict):
+        return '{' + ', '.join(fingerprint(k) + ': ' + fingerprint(value[k]) for k in sorted(value, key=repr)) + '}'
+    elif isinstance(value, (set, frozenset)):
+        return '{' + ', '.join(sorted(fingerprint(v) for v in value)) + '}'
+    elif isinstance(value, (list, tuple)):
+        return '[' + ', '.join(fingerprint(v) for v in value) + ']'
+    return repr(value)
+
+
+class Stage(object):
+    # one named step of a run. its key hashes the stage name and the fingerprints of its inputs, so it is known
+    # before anything is computed; get() returns the checkpointed value for that key when resuming and there is
+    # one, and otherwise calls compute() and checkpoints the result. outputs are files the stage writes itself,
+    # which must still exist for its checkpoint to be reused.
+    def __init__(self, checkpoints, name, inputs, compute, outputs=None, save=True):
+        self.checkpoints = checkpoints
+        self.name = name
+        self.compute = compute
+        self.outputs = [o for o in (outputs or list()) if o is not None and o != '']
+        self.save = save
+        text = str(checkpointVersion) + '|' + name + '|' + fingerprint(list(inputs))
+        self.key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        self.done = False
+        self.value = None
+
+    def get(self):
+        if self.done:
+            return self.value
+        with profiling.stage(self.name) as record:
+            found = False
+            if self.checkpoints.resume and all(os.path.exists(o) for o in self.outputs):
+                found, value = self.checkpoints.load(self.name, self.key)
+            if found:
+                logger.info('resuming stage ' + self.name + ' from its checkpoint')
+                record.resumed = True
+            else:
+                value = self.compute()
+                if self.save:
+                    self.checkpoints.save(self.name, self.key, value)
+        self.value = value
+        self.done = True
+        # the inputs the computation closed over are not needed any more
+        self.compute = None
+        return value
+
+
+class DigestWriter(object):
+    # a file object that keeps the sha1 of what goes through it, so a checkpoint is pickled straight to its file and
+    # digested on the way instead of being built in memory first
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha1()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.f.write(data)
+
+
+def fileDigest(fileName, blockSize=1 << 20):
+    # sha1 of a file, read a block at a time
+    digest = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            digest.update(block)
+    f.close()
+    return digest.hexdigest()
+
+
+class Checkpoints(object):
+    # a directory of <stage>-<key>.pkl checkpoints, each next to a .sha1 of its bytes so a damaged file is
+    # recomputed instead of loaded. with directory None nothing is saved or loaded and every stage is computed.
+    # archiveFileName, if given, is a tar of the directory (a single file is what e.g. Cromwell's checkpointFile
+    # runtime attribute copies off a preemptible VM): it is unpacked on start when resuming, and every new
+    # checkpoint is appended to it, so earlier checkpoints are not copied again.
+
+    def __init__(self, directory=None, resume=False, archiveFileName=None):
+        self.directory = directory
+        self.resume = resume and directory is not None
+        self.archiveFileName = archiveFileName
+        if directory is not None:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            if archiveFileName is not None:
+                if self.resume and os.path.exists(archiveFileName):
+                    self.unpackArchive()
+                else:
+                    self.writeArchive()
+
+    def unpackArchive(self):
+        # only plain files named like the checkpoints this class writes are unpacked, and only into the directory;
+        # anything else (absolute or .. paths, links, devices) is skipped. a tar cut short by a preempted append
+        # gives back the members before the cut, and a checkpoint without its .sha1 is recomputed
+        logger.info('unpacking checkpoints from ' + self.archiveFileName + ' to ' + self.directory)
+        try:
+            with tarfile.open(self.archiveFileName, 'r') as tar:
+                for member in tar:
+                    if not member.isfile() or os.path.basename(member.name) != member.name or \
+                            not member.name.endswith(('.pkl', '.pkl.sha1')):
+                        logger.warning('skipping archive member ' + member.name)
+                        continue
+                    source = tar.extractfile(member)
+                    with open(os.path.join(self.directory, member.name + '.tmp'), 'wb') as f:
+                        shutil.copyfileobj(source, f)
+                    f.close()
+                    os.replace(os.path.join(self.directory, member.name + '.tmp'),
+                               os.path.join(self.directory, member.name))
+            tar.close()
+        except (tarfile.ReadError, EOFError) as e:
+            logger.warning('checkpoint archive ' + self.archiveFileName + ' is cut short: ' + str(e))
+
+    def writeArchive(self):
+        # a new archive of the checkpoints in the directory
+        with tarfile.open(self.archiveFileName + '.tmp', 'w') as tar:
+            for other in sorted(os.listdir(self.directory)):
+                if other.endswith('.pkl') or other.endswith('.pkl.sha1'):
+                    tar.add(os.path.join(self.directory, other), arcname=other)
+        tar.close()
+        os.replace(self.archiveFileName + '.tmp', self.archiveFileName)
+
+    def stage(self, name, inputs, compute, outputs=None, save=True):
+        return Stage(self, name, inputs, compute, outputs, save)
+
+    def fileName(self, name, key):
+        return os.path.join(self.directory, name + '-' + key + '.pkl')
+
+    def load(self, name, key):
+        # (True, value) for a checkpoint whose bytes match its digest, (False, None) otherwise. the digest is
+        # checked a block at a time and the value unpickled from the file, so the bytes are never all in memory
+        if self.directory is None or not os.path.exists(self.fileName(name, key) + '.sha1'):
+            return False, None
+        with open(self.fileName(name, key) + '.sha1', 'r') as f:
+            digest = f.read().strip()
+        f.close()
+        if fileDigest(self.fileName(name, key)) != digest:
+            logger.warning('checkpoint ' + self.fileName(name, key) + ' is damaged, recomputing stage ' + name)
+            return False, None
+        with open(self.fileName(name, key), 'rb') as f:
+            value = pickle.load(f)
+        f.close()
+        return True, value
+
+    def save(self, name, key, value):
+        if self.directory is None:
+            return
+        fileName = self.fileName(name, key)
+        # written under scratch names and renamed, the digest last, so a checkpoint with a digest is complete
+        with open(fileName + '.tmp', 'wb') as f:
+            writer = DigestWriter(f)
+            pickle.dump(value, writer, protocol=pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.replace(fileName + '.tmp', fileName)
+        with open(fileName + '.sha1.tmp', 'w') as f:
+            f.write(writer.digest.hexdigest())
+        f.close()
+        os.replace(fileName + '.sha1.tmp', fileName + '.sha1')
+        # checkpoints of the same stage with other inputs are stale now
+        for other in os.listdir(self.directory):
+            if other.startswith(name + '-') and not other.startswith(os.path.basename(fileName)):
+                os.remove(os.path.join(self.directory, other))
+        logger.info('saved checkpoint ' + fileName)
+        if self.archiveFileName is not None:
+            # the checkpoint, then its digest, so a cut-short append leaves no digest for a partial checkpoint.
+            # stale checkpoints stay in the archive; unpacked, they are never loaded and the next save removes them
+            with tarfile.open(self.archiveFileName, 'a') as tar:
+                tar.add(fileName, arcname=os.path.basename(fileName))
+                tar.add(fileName + '.sha1', arcname=os.path.basename(fileName) + '.sha1')
+            tar.close()
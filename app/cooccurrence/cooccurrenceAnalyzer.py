@@ -4,16 +4,23 @@ import numpy as np
 from collections import defaultdict
 import pandas as pd
 import logging
-import time
 from multiprocessing import Process, Queue, cpu_count
-import math
 import scipy.stats as stats
-import subprocess
 import argparse
+import partition
+import carrierMatrix
+import carrierArchive
+import variantAnnotations
+import hardyWeinberg
+import zygosityCounts
+import fisherExact
+import profiling
 
 
 coordinateColumnBase = 'Genomic_Coordinate_hg'
 hgVersion = 38
+# the carrier matrix getFPI() counts, inherited by the forked worker processes
+sharedMatrix = None
 
 logging.basicConfig()
 logger = logging.getLogger()
@@ -29,6 +36,14 @@ def parse_args():
     parser.add_argument('-a', '--ancestry', help='ancestry json')
     parser.add_argument('-d', '--outputDir', help='output dir')
     parser.add_argument('-n', '--numProcs', help='number of processes')
+    parser.add_argument('-s', '--split', help='split work by samples, variants, tiles or auto (default auto)',
+                        choices=partition.splitModes, default='auto')
+    parser.add_argument('-m', '--metrics', help='(optional) json file to save per-stage wall time, cpu time, peak rss '
+                                                'and item counts to')
+    parser.add_argument('-p', '--profile', help='(optional) file to save a cProfile (or, for .html, pyinstrument) '
+                                                'profile of the run to')
+    parser.add_argument('-w', '--hwe', help='Hardy-Weinberg test: chisquare, or exact for the mid-p exact test '
+                                            '(default chisquare)', choices=hardyWeinberg.hweTests, default='chisquare')
     return parser.parse_args()
 
 def main():
@@ -41,45 +56,57 @@ def main():
     ancestriesFileName = parse_args().ancestry
     outputDir = parse_args().outputDir
     numProcesses = int(parse_args().numProcs)
+    splitMode = parse_args().split
+    metricsFileName = parse_args().metrics
+    profileFileName = parse_args().profile
+    hweTest = parse_args().hwe
     c = 0.5
 
-    logger.info('reading data from ' + vpiFileName)
-    with open(vpiFileName, 'r') as f:
-        vpiDict = json.load(f)
-    f.close()
-    vpiDF = pd.DataFrame(vpiDict)
+    if profileFileName:
+        profiling.profiler.startProfile(profileFileName)
 
-    logger.info('reading data from ' + ipvFileName)
-    with open(ipvFileName, 'r') as f:
-        ipvDict = json.load(f)
-    f.close()
+    with profiling.stage('readInputs()') as record:
+        # vpi and ipv can be the finder's json files or its carrier archive (.npz). vpi is read straight into the
+        # carrier matrix, and vpiDict is a view over it
+        logger.info('reading data from ' + vpiFileName)
+        matrix = carrierArchive.loadCarrierMatrix(vpiFileName)
+        vpiDict = matrix.variantsPerIndividual()
 
-    logger.info('finding variants from ' + brcaFileName)
-    brcaDF = findVariantsInBRCA(brcaFileName)
+        logger.info('reading data from ' + ipvFileName)
+        ipvDict = carrierArchive.loadIndividualsPerVariant(ipvFileName)
 
-    logger.info('reading variants from ' + variantsFileName)
-    with open(variantsFileName, 'r') as f:
-        variantsDict = json.load(f)
-    f.close()
+        logger.info('finding variants from ' + brcaFileName)
+        brcaDF = findVariantsInBRCA(brcaFileName)
 
-    logger.info('reading data from ' + regionsFileName)
-    with open(regionsFileName, 'r') as f:
-        regionsDict = json.load(f)
-    f.close()
+        logger.info('reading variants from ' + variantsFileName)
+        with open(variantsFileName, 'r') as f:
+            variantsDict = json.load(f)
+        f.close()
 
-    logger.info('reading data from ' + ancestriesFileName)
-    with open(ancestriesFileName, 'r') as f:
-        ancestriesDF = json.load(f)
-    f.close()
+        logger.info('reading data from ' + regionsFileName)
+        with open(regionsFileName, 'r') as f:
+            regionsDict = json.load(f)
+        f.close()
+
+        logger.info('reading data from ' + ancestriesFileName)
+        with open(ancestriesFileName, 'r') as f:
+            ancestriesDF = json.load(f)
+        f.close()
+        record.count(samples=len(vpiDict), variants=len(ipvDict), vus=len(variantsDict))
 
-    fpi = getFPI(numProcesses, vpiDF, ancestriesDF, outputDir, vpiDict)
+    with profiling.stage('getFPI()') as record:
+        fpi = getFPI(numProcesses, ancestriesDF, outputDir, vpiDict, splitMode)
+        record.count(samples=len(fpi))
 
-    plotVUSByPosition(variantsDict, outputDir)
-    plotZygosityRatiosPerIndividual(fpi, outputDir)
-    plotVUSByFrequency(variantsDict, 'maxPopFreq', outputDir)
-    plotVUSByFrequency(variantsDict, 'cohortFreq', outputDir)
+    with profiling.stage('plots'):
+        plotVUSByPosition(variantsDict, outputDir)
+        plotZygosityRatiosPerIndividual(fpi, outputDir)
+        plotVUSByFrequency(variantsDict, 'maxPopFreq', outputDir)
+        plotVUSByFrequency(variantsDict, 'cohortFreq', outputDir)
 
-    ipvDict = getHardyWeinbergStats(vpiDict, variantsDict, ipvDict, c)
+    with profiling.stage('getHardyWeinbergStats()') as record:
+        ipvDict = getHardyWeinbergStats(vpiDict, variantsDict, ipvDict, c, hweTest)
+        record.count(variants=len(ipvDict))
 
     '''iphv = findIndividualsPerHomozygousVariant(vpiDict, variantsDict, 1.0)
     iphvFileName = 'iphv.json'
@@ -88,40 +115,57 @@ def main():
         json.dump(iphv, f)
     f.close()'''
 
-    inCIdomain = findRegionPerVariant(variantsDict, regionsDict)
-    domainFileName = 'domain.json'
-    logger.info('saving to ' + outputDir + '/' + domainFileName)
-    with open(outputDir + '/' + domainFileName, 'w') as f:
-        json.dump(inCIdomain, f)
-    f.close()
-    plotRegionsPerVariant(inCIdomain, outputDir)
-
-    # write ipv dict back out now that it has f-value
-    ipvOut = ipvFileName.replace('.json', '') + '-f.json'
-    with open(ipvOut, 'w') as f:
-        json.dump(ipvDict, f)
-    f.close()
-
-def getFPI(numProcesses, vpiDF, ancestriesDF, outputDir, vpiDict):
-    logger.info('counting genotypes for variants on ' + str(numProcesses) + ' processes')
-    t = time.time()
-    q1 = Queue()
-    q2 = Queue()
-    processList = list()
-    for i in range(numProcesses):
-        p = Process(target=countTotalGenotypesForVariants,
-                    args=(q1, q2, vpiDF, ancestriesDF, i, numProcesses,))
-        p.start()
-        processList.append(p)
-    logger.info('joining results from forked threads')
-    genotypeCounts = dict()
-    frequenciesPerIndividual = dict()
-    for i in range(numProcesses):
-        genotypeCounts.update(q1.get())
-        frequenciesPerIndividual.update(q2.get())
-    for i in range(numProcesses):
-        processList[i].join()
-    logger.debug('elapsed time in countTotalGenotypesForVariants() ' + str(time.time() - t))
+    with profiling.stage('findRegionPerVariant()') as record:
+        inCIdomain = findRegionPerVariant(variantsDict, regionsDict)
+        record.count(vus=len(variantsDict))
+    with profiling.stage('writeOutputs()'):
+        domainFileName = 'domain.json'
+        logger.info('saving to ' + outputDir + '/' + domainFileName)
+        with open(outputDir + '/' + domainFileName, 'w') as f:
+            json.dump(inCIdomain, f)
+        f.close()
+        plotRegionsPerVariant(inCIdomain, outputDir)
+
+        # write ipv dict back out now that it has f-value
+        ipvOut = ipvFileName.replace('.json', '').replace('.npz', '') + '-f.json'
+        with open(ipvOut, 'w') as f:
+            json.dump(ipvDict, f)
+        f.close()
+
+    profiling.profiler.stopProfile()
+    if metricsFileName:
+        profiling.profiler.save(metricsFileName)
+
+def getFPI(numProcesses, ancestriesDF, outputDir, vpiDict, splitMode='auto'):
+    # genotype counts per class and per individual, from the zygosity counts of the carrier matrix; each process
+    # counts one tile of it. the workers inherit the matrix when they fork instead of getting a pickled copy
+    global sharedMatrix
+    matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpiDict)
+    sharedMatrix = matrix
+    tiles = partition.planTiles(matrix.shape[0], matrix.shape[1], numProcesses, splitMode)
+
+    logger.info('counting genotypes for variants on ' + str(len(tiles)) + ' processes')
+    with profiling.stage('countZygosity()') as record:
+        q = Queue()
+        processList = list()
+        for i in range(len(tiles)):
+            p = Process(target=countZygosity, args=(q, tiles[i],))
+            p.start()
+            processList.append(p)
+        logger.info('joining results from forked threads')
+        # tiles that share individuals or variants each hold part of the count, so add the partial results up
+        counts = zygosityCounts.ZygosityCounts(matrix, (0, 0, 0, 0))
+        for i in range(len(tiles)):
+            counts.add(q.get())
+        for i in range(len(tiles)):
+            processList[i].join()
+        record.count(samples=matrix.shape[0], variants=matrix.shape[1], tiles=len(tiles))
+    genotypeCounts = counts.genotypeCounts()
+    ethnicities = dict()
+    for individual in matrix.samples:
+        ethnicities[individual] = getEthnicity(ancestriesDF, individual)
+    frequenciesPerIndividual = counts.frequenciesPerIndividual(ethnicities)
+    variantCounts = counts.variantSets()
     genotypeCountsFileName = 'genotypeCounts.json'
     logger.info('saving to ' + outputDir + '/' + genotypeCountsFileName)
     with open(outputDir + '/' + genotypeCountsFileName, 'w') as f:
@@ -140,7 +184,6 @@ def getFPI(numProcesses, vpiDF, ancestriesDF, outputDir, vpiDict):
         json.dump(topmedNotGnomad)
     f.close()'''
 
-    variantCounts = countTotalVariants(vpiDict)
     print('benign counts: ' + str(len(variantCounts['benign'])))
     print('pathogenic counts: ' + str(len(variantCounts['pathogenic'])))
     print('vus counts: ' + str(len(variantCounts['vus'])))
@@ -329,19 +372,6 @@ def pearsonCorrelation(someList1, someList2):
     r =  rNum/rDen
     return r
 
-def countTotalVariants(vpiDict):
-    variants = {'benign': set(), 'pathogenic': set(), 'vus': set()}
-    for i in vpiDict:
-        for v in vpiDict[i]['benign']:
-            variants['benign'].add(tuple(v[0]))
-        for v in vpiDict[i]['pathogenic']:
-            variants['pathogenic'].add(tuple(v[0]))
-        for v in vpiDict[i]['vus']:
-            variants['vus'].add(tuple(v[0]))
-
-    return variants
-
-
 def findVariantsInBRCA(fileName):
     return pd.read_csv(fileName, sep='\t', header=0, dtype=str)
 
@@ -378,107 +408,37 @@ def getFrequenciesPerVariant(variantsDict, brcaDF, hgVersion, ethnicity1, ethnic
     return freqPerVariant
 
 def getGnomadData(brcaDF, vus, hgVersion, ethnicity):
-    # TODO write a unit test
-    # 13:g.32393468:C>CT
-    #hgString = 'chr' + str(vus[0][0]) + ':g.' + str(vus[0][1]) + ':' + str(vus[0][2]) + '>' + str(vus[0][3])
-    if type(vus) is str:
-        vus = eval(vus)
-    hgString = 'chr' + str(vus[0]) + ':g.' + str(vus[1]) + ':' + str(vus[2]) + '>' + str(vus[3])
-
-    # first, get list of columns for GnomAD allleles
-    #alleleFrequencyPrefixes = ['Allele_frequency_genome_', 'Allele_frequency_']
-    # 'Allele_count_exome_AMR_GnomAD', 'Allele_count_hemi_exome_AMR_GnomAD', 'Allele_count_hom_exome_AMR_GnomAD',
-    # 'Allele_number_exome_AMR_GnomAD', 'Allele_frequency_exome_AMR_GnomAD' ,'Allele_frequency_AMR_GnomAD'
-
-    gnomad = [v for v in list(brcaDF.columns) if 'GnomAD' in v]
-
-    # second, get frequencies across exomes and genomes to determine max
-    # return population, frequency, count, and number
-    # replace "frequency" with "count" and "number" in Allele_frequency_genome_AFR_GnomAD
-
+    # the GnomAD columns of brcaDF are parsed into a per-variant table the first time (see variantAnnotations.py),
+    # so each call is a few indexed lookups instead of a scan of the frame per population
     allDict = dict()
 
-    alleleFrequencies = [v for v in gnomad if 'Allele_frequency' in v]
-    allDict['max'] = getMaxGnomad(brcaDF, hgString, hgVersion, alleleFrequencies)
-    allDict['min'] = getMinGnomad(brcaDF, hgString, hgVersion, alleleFrequencies)
+    allDict['max'] = getMaxGnomad(brcaDF, vus, hgVersion)
+    allDict['min'] = getMinGnomad(brcaDF, vus, hgVersion)
 
     if ethnicity is not None:
-        alleleFrequencies = [v for v in gnomad if ethnicity in v]
-        x =  getPopulationGnomadData(brcaDF, hgString, hgVersion, alleleFrequencies)
+        x =  getPopulationGnomadData(brcaDF, vus, hgVersion, ethnicity)
         allDict[ethnicity] = x
     else:
         allDict['max']['frequency'] = 0.5 * (allDict['max'] + allDict['min'])
         allDict['max']['population'] = None
     return allDict
 
-def getPopulationGnomadData(brcaDF, hgString, hgVersion, alleleFrequencies):
-    ethData = dict()
-    alleleFrequencies2 = [v for v in alleleFrequencies if 'Allele_frequency' in v]
-    for af in alleleFrequencies2:
-        ethData[af] = brcaDF[brcaDF[coordinateColumnBase + str(hgVersion)] == hgString][af].tolist()
-
-    # alleleFrequencies2 = [Allele_frequency_genome_NFE_GnomAD, Allele_frequency_exome_NFE_GnomAD, Allele_frequency_NFE_GnomAD]
-    # we want just the genome which is [0] and that is a list of one element, so we want [0] of that so [0][0]
-
-    if not ethData:
+def getPopulationGnomadData(brcaDF, vus, hgVersion, ethnicity):
+    # frequency in the first allele frequency column of the population, which is the genome one
+    # (Allele_frequency_genome_NFE_GnomAD before Allele_frequency_exome_NFE_GnomAD and Allele_frequency_NFE_GnomAD)
+    annotations = variantAnnotations.getVariantAnnotations(brcaDF, hgVersion)
+    populations = [p for p in annotations.populations if ethnicity in p]
+    if not populations:
         return 0.0
+    return annotations.getFrequency(vus, populations[0])
 
-    genomeFreq = alleleFrequencies2[0]
-
-    if not ethData[genomeFreq]:
-        return 0.0
+def getMinGnomad(brcaDF, vus, hgVersion):
+    # TODO get homo and abs counts as well
+    return variantAnnotations.getVariantAnnotations(brcaDF, hgVersion).getMin(vus)
 
-    if ethData[genomeFreq][0] == math.nan or ethData[genomeFreq][0] == '-':
-        return 0.0
-    else:
-        return float(ethData[genomeFreq][0])
-    '''maxFreq = 0.0
-    for af in ethData:
-        if ethData[af][0] == math.nan or ethData[af][0] == '-':
-            continue
-        elif float(ethData[af][0]) > maxFreq:
-            maxFreq = float(ethData[af][0])
-    return maxFreq'''
-
-def getMinGnomad(brcaDF, hgString, hgVersion, alleleFrequencies):
-    minData = {'frequency': 1.1, 'population': None}
-    for af in alleleFrequencies:
-        freq = 0.0
-        alleleFreqList = brcaDF[brcaDF[coordinateColumnBase + str(hgVersion)] == hgString][af].tolist()
-        if alleleFreqList:
-            try:
-                if len(alleleFreqList) > 1:
-                    print('more than one')
-                # yes, it always returns a list of length 0
-                freq = float(alleleFreqList[0])
-            except ValueError:
-                continue
-            if freq < minData['frequency'] and freq != 0.0:
-                # TODO get homo and abs counts as well
-                minData['frequency'] = freq
-                minData['population'] = af
-    if minData['frequency'] == 1.1:
-        minData['population'] = 0.0
-    return minData
-
-def getMaxGnomad(brcaDF, hgString, hgVersion, alleleFrequencies):
-    maxData = {'frequency': 0.0, 'population': None}
-    for af in alleleFrequencies:
-        freq = 0.0
-        alleleFreqList = brcaDF[brcaDF[coordinateColumnBase + str(hgVersion)] == hgString][af].tolist()
-        if alleleFreqList:
-            try:
-                if len(alleleFreqList) > 1:
-                    print('more than one')
-                # yes, it always returns a list of length 0
-                freq = float(alleleFreqList[0])
-            except ValueError:
-                continue
-            if freq > maxData['frequency']:
-                # TODO get homo and abs counts as well
-                maxData['frequency'] = freq
-                maxData['population'] = af
-    return maxData
+def getMaxGnomad(brcaDF, vus, hgVersion):
+    # TODO get homo and abs counts as well
+    return variantAnnotations.getVariantAnnotations(brcaDF, hgVersion).getMax(vus)
 
 def getFisherExact(results, key, allValues):
     # create 2x2 contingency table
@@ -499,117 +459,74 @@ def getFisherExact(results, key, allValues):
     CI95_lower = exp(lowerBound)
     CI95_upper = exp(upperBound)'''
 
-    # use R fisher.test to get confidence interval for LOR
-    row1 = str('c(' + str(a) + ',' + str(b) + ')')
-    row2 = str('c(' + str(c) + ',' + str(d) + ')')
-    CIcmd_1 = str('/usr/bin/Rscript -e "fisher.test(rbind(' + row1 + ',' +  row2 + '))"')
-    CIcmd_2 = str('| grep -A1 confidence | sed -n "2,2 p" | xargs')
-    CIcmd = str(CIcmd_1 + CIcmd_2)
-    lb, ub = subprocess.check_output(CIcmd, shell=True).split()
-
-    # cast result = b'0.002439905 19.594803004\n' to floats
-    lb = float(lb)
-    ub = float(ub)
+    # confidence interval for the odds ratio the way R's fisher.test() computes it
+    estimate, exactPValue, (lb, ub) = fisherExact.fisherTest(a, b, c, d)
 
     # insert OR and p-value into results dict
     results[key]['OR'] = round(oddsRatio, 3)
     results[key]['P value'] =  round(pValue, 3)
     results[key]['95% CI'] = (round(lb, 2), round(ub, 2))
 
-def getHardyWeinbergStats(vpiDict, variantsDict, individualsPerVariant, c):
-    bVars, pVars, vVars = calculateZygosityFrequenciesPerVariant(vpiDict)
-    bVars, pVars, vVars = hardyWeinbergChiSquareTest(bVars, pVars, vVars, len(vpiDict), c)
-    bVars, pVars, vVars = hardyWeinbergStatistics(bVars, pVars, vVars, significance=0.01)
+def getHardyWeinbergStats(vpiDict, variantsDict, individualsPerVariant, c, test='chisquare'):
+    # the Hardy-Weinberg tests of every variant come from one hardyWeinberg.hardyWeinbergTest() call on the
+    # genotype counts of the carrier matrix; this is the bookkeeping around it. with test='exact', accepting HW
+    # is decided by the exact test and each variant also gets its 'hwe p' value
+    matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpiDict)
+    heteroCounts, homoCounts = matrix.genotypeCounts()
+    n = len(vpiDict)
+    results = hardyWeinberg.hardyWeinbergTest(n - (heteroCounts + homoCounts), heteroCounts, homoCounts, n, c,
+                                              significance=0.01, test=test)
+
     rejectHW = {'benign': 0, 'pathogenic': 0, 'vus': 0}
     acceptHW = {'benign': 0, 'pathogenic': 0, 'vus': 0}
     acceptF = {'benign': 0, 'pathogenic': 0, 'vus': 0}
     rejectF = {'benign': 0, 'pathogenic': 0, 'vus': 0}
 
-    for b in bVars:
-        if bVars[b]['accept hw'] is False:
-            rejectHW['benign'] += 1
-        else:
-            acceptHW['benign'] += 1
-        if bVars[b]['accept F'] is False:
-            rejectF['benign'] += 1
-        else:
-            acceptF['benign'] += 1
-        individualsPerVariant[str(b)]['accept F'] = bVars[b]['accept F']
-        individualsPerVariant[str(b)]['F'] = bVars[b]['F']
-        individualsPerVariant[str(b)]['Z'] = bVars[b]['Z']
-        individualsPerVariant[str(b)]['chisquare'] = bVars[b]['chisquare']
-        individualsPerVariant[str(b)]['class'] = 'benign'
-        individualsPerVariant[str(b)]['aa'] = bVars[b]['aa']
-        individualsPerVariant[str(b)]['Aa'] = bVars[b]['Aa']
-        individualsPerVariant[str(b)]['AA'] = bVars[b]['AA']
-
-    for p in pVars:
-        if pVars[p]['accept hw'] is False:
-            rejectHW['pathogenic'] += 1
-        else:
-            acceptHW['pathogenic'] += 1
-        if pVars[p]['accept F'] is False:
-            rejectF['pathogenic'] += 1
-        else:
-            rejectF['pathogenic'] += 1
-        individualsPerVariant[str(p)]['F'] = pVars[p]['F']
-        individualsPerVariant[str(p)]['Z'] = pVars[p]['Z']
-        individualsPerVariant[str(p)]['accept F'] = pVars[p]['accept F']
-        individualsPerVariant[str(p)]['class'] = 'pathogenic'
-        individualsPerVariant[str(p)]['aa'] = pVars[p]['aa']
-        individualsPerVariant[str(p)]['Aa'] = pVars[p]['Aa']
-        individualsPerVariant[str(p)]['AA'] = pVars[p]['AA']
-        individualsPerVariant[str(p)]['chisquare'] = pVars[p]['chisquare']
-
-
     rejectVUS = {'cooccurring vus': 0, 'homozygous vus': 0}
     acceptVUS = {'cooccurring vus': 0, 'homozygous vus': 0}
     rejectVUS_F = {'cooccurring vus': 0, 'homozygous vus': 0}
     acceptVUS_F = {'cooccurring vus': 0, 'homozygous vus': 0}
 
-    for v in vVars:
-        if vVars[v]['accept hw'] is False:
-            rejectHW['vus'] += 1
-            if str(v) in variantsDict['cooccurring vus']:
-                rejectVUS['cooccurring vus'] += 1
-            if str(v) in variantsDict['homozygous vus']:
-                rejectVUS['homozygous vus'] += 1
-        else:
-            acceptHW['vus'] += 1
-            if str(v) in variantsDict['cooccurring vus']:
-                acceptVUS['cooccurring vus'] += 1
-            if str(v) in variantsDict['homozygous vus']:
-                acceptVUS['homozygous vus'] += 1
-
-        if vVars[v]['accept F'] is False:
-            rejectF['vus'] += 1
-            if str(v) in variantsDict['cooccurring vus']:
-                rejectVUS_F['cooccurring vus'] += 1
-            if str(v) in variantsDict['homozygous vus']:
-                rejectVUS_F['homozygous vus'] += 1
-        else:
-            acceptF['vus'] += 1
-            if str(v) in variantsDict['cooccurring vus']:
-                acceptVUS_F['cooccurring vus'] += 1
-            if str(v) in variantsDict['homozygous vus']:
-                acceptVUS_F['homozygous vus'] += 1
-        individualsPerVariant[str(v)]['F'] = vVars[v]['F']
-        individualsPerVariant[str(v)]['Z'] = vVars[v]['Z']
-        individualsPerVariant[str(v)]['accept F'] = vVars[v]['accept F']
-        individualsPerVariant[str(v)]['class'] = 'vus'
-        individualsPerVariant[str(v)]['aa'] = vVars[v]['aa']
-        individualsPerVariant[str(v)]['Aa'] = vVars[v]['Aa']
-        individualsPerVariant[str(v)]['AA'] = vVars[v]['AA']
-        individualsPerVariant[str(v)]['chisquare'] = vVars[v]['chisquare']
-
     # check to see if 654 vus that reject HW are same vus that reject F
     vusRejectingBothHWandF = list()
-    for v in vVars:
-        if str(v) not in variantsDict['homozygous vus']:
-            continue
-        elif vVars[v]['accept hw'] == False and vVars[v]['accept F'] == False:
-            vusRejectingBothHWandF.append(v)
 
+    for j in range(matrix.shape[1]):
+        variantClass = carrierMatrix.variantClasses[matrix.classes[j]]
+        v = matrix.variants[j]
+        acceptsHW = bool(results['accept hw'][j])
+        acceptsF = bool(results['accept F'][j])
+        if acceptsHW:
+            acceptHW[variantClass] += 1
+        else:
+            rejectHW[variantClass] += 1
+        if acceptsF:
+            acceptF[variantClass] += 1
+        else:
+            rejectF[variantClass] += 1
+
+        if variantClass == 'vus':
+            for vusType in ['cooccurring vus', 'homozygous vus']:
+                if str(v) in variantsDict[vusType]:
+                    if acceptsHW:
+                        acceptVUS[vusType] += 1
+                    else:
+                        rejectVUS[vusType] += 1
+                    if acceptsF:
+                        acceptVUS_F[vusType] += 1
+                    else:
+                        rejectVUS_F[vusType] += 1
+            if str(v) in variantsDict['homozygous vus'] and not acceptsHW and not acceptsF:
+                vusRejectingBothHWandF.append(v)
+
+        variantData = individualsPerVariant[str(v)]
+        variantData.update(hardyWeinberg.getStatistics(results, j, ['F', 'Z', 'accept F']))
+        variantData['class'] = variantClass
+        variantData['aa'] = int(homoCounts[j])
+        variantData['Aa'] = int(heteroCounts[j])
+        variantData['AA'] = n - int(homoCounts[j] + heteroCounts[j])
+        variantData['chisquare'] = float(results['chisquare'][j])
+        if test == 'exact':
+            variantData['hwe p'] = float(results['hwe p'][j])
 
     print('reject HW: ' + str(rejectHW))
     print('accept HW: ' + str(acceptHW))
@@ -630,139 +547,29 @@ def getHardyWeinbergStats(vpiDict, variantsDict, individualsPerVariant, c):
     return individualsPerVariant
 
 def calculateZygosityFrequenciesPerVariant(vpiDict):
-    benignVariants = dict()
-    pathogenicVariants = dict()
-    vusVariants = dict()
-    for individual in vpiDict:
-        # if it's in list of variants for individual, then it must be one of 1|1 (3), 0|1 (1), or 1|0 (2)
-        for b in vpiDict[individual]['benign']:
-            if b:
-                if tuple(b[0]) not in benignVariants:
-                    benignVariants[tuple(b[0])] = dict()
-                    benignVariants[tuple(b[0])]['aa'] = 0
-                    benignVariants[tuple(b[0])]['Aa'] = 0
-                if b[1] == '3':
-                    benignVariants[tuple(b[0])]['aa'] += 1
-                else:
-                    benignVariants[tuple(b[0])]['Aa'] += 1
-        for p in vpiDict[individual]['pathogenic']:
-            if p:
-                if tuple(p[0]) not in pathogenicVariants:
-                    pathogenicVariants[tuple(p[0])] = dict()
-                    pathogenicVariants[tuple(p[0])]['aa'] = 0
-                    pathogenicVariants[tuple(p[0])]['Aa'] = 0
-                if p[1] == '3':
-                    pathogenicVariants[tuple(p[0])]['aa'] += 1
-                else:
-                    pathogenicVariants[tuple(p[0])]['Aa'] += 1
-        for v in vpiDict[individual]['vus']:
-            if v:
-                if tuple(v[0]) not in vusVariants:
-                    vusVariants[tuple(v[0])] = dict()
-                    vusVariants[tuple(v[0])]['aa'] = 0
-                    vusVariants[tuple(v[0])]['Aa'] = 0
-                if v[1] == '3':
-                    vusVariants[tuple(v[0])]['aa'] += 1
-                else:
-                    vusVariants[tuple(v[0])]['Aa'] += 1
+    # if it's in list of variants for individual, then it must be one of 1|1 (3), 0|1 (1), or 1|0 (2)
+    # the counts per variant are column counts of the carrier matrix
+    return zygosityCounts.getZygosityCounts(vpiDict).variantsPerClass()
 
-    n = len(vpiDict)
-    for b in benignVariants:
-        benignVariants[b]['AA'] = n - (benignVariants[b]['Aa'] + benignVariants[b]['aa'])
-    for p in pathogenicVariants:
-        pathogenicVariants[p]['AA'] = n - (pathogenicVariants[p]['Aa'] + pathogenicVariants[p]['aa'])
-    for v in vusVariants:
-        vusVariants[v]['AA'] = n - (vusVariants[v]['Aa'] + vusVariants[v]['aa'])
+def getGenotypeCounts(variants):
+    # AA, Aa and aa count arrays of a {variant: {'AA', 'Aa', 'aa'}} dict, in its order
+    return ([variants[v]['AA'] for v in variants], [variants[v]['Aa'] for v in variants],
+            [variants[v]['aa'] for v in variants])
 
-    return benignVariants, pathogenicVariants, vusVariants
+def addStatistics(variants, results, keys):
+    i = 0
+    for v in variants:
+        variants[v].update(hardyWeinberg.getStatistics(results, i, keys))
+        i += 1
 
 def hardyWeinbergStatistics(bVars, pVars, vVars, significance):
-    # https://en.wikipedia.org/wiki/Hardy Weinberg_principle
-    # degrees of freedom = 1
-    # The inbreeding coefficient, F (see also F-statistics), is one minus the observed frequency of
-    # heterozygotes over that expected from Hardy Weinberg equilibrium.
-    # F = [ E(f(Aa)) - O(f(Aa)) ] / [ E(f(Aa)) ] = 1 - O(f(Aa))/E(f(Aa))
-    # where E(f(Aa)) = 2pq
-    # For two alleles, the chi - squared goodness of fit test for Hardy Weinberg proportions is equivalent to the test
-    # for inbreeding, F = 0.
-    # The inbreeding coefficient is unstable as the expected value approaches zero, and thus not useful for rare and
-    # very common alleles. For: E = 0, O > 0, F = inf and E = 0, O = 0, F is undefined.
-
-    # from the Assortative Mating study on GALA data:
-    # Allele frequency differences between groups were calculated
-    # using standard chi-square tests. We tested for Hardy Weinberg
-    # equilibrium at marker loci by using the Z-statistic
-    # Z = (((n2 x n0) - n1^2 ) / (n2 + n1/2)(n0 + n1/2) ) N^1/2
-    # where n2 and n0 are the number of homozygotes and n1 the
-    # number of heterozygotes observed; N = n2 + n1 + n0. Under
-    # the null hypothesis of no within-locus allelic correlation, Z
-    # has a normal distribution with mean 0 and variance 1. We
-    # chose to use a one-sided test as opposed to a two-sided chisquare
-    # test because we specifically were searching for an
-    # excess of homozygotes, as predicted by assortative mating.
-
-    for b in bVars:
-        # 1. get E(f(Aa))
-        bVars[b]['E(f(Aa))'] = 2 * bVars[b]['p'] * bVars[b]['q']
-        # 2. O(f(Aa)) = bVars[b]['Aa']
-        # 3. calculate F
-        try:
-            bVars[b]['F'] = ( bVars[b]['E(f(Aa))'] - bVars[b]['Aa'] ) / ( bVars[b]['E(f(Aa))'] )
-            n0 = bVars[b]['aa']
-            n2 = bVars[b]['AA']
-            n1 = bVars[b]['Aa']
-            N = n0 + n1 + n2
-            bVars[b]['Z'] = ( (n2 * n0 - n1**2) / ((n2 + 0.5*n1) * (n0 + 0.5*n1)) ) * math.sqrt(N)
-
-
-        except Exception as e:
-            print('exception calculating F: ' + str(e))
-            continue
-        if abs(bVars[b]['F']) <= significance:
-            bVars[b]['accept F'] = True
-        else:
-            bVars[b]['accept F'] = False
-
-    for p in pVars:
-        # 1. get E(f(Aa))
-        pVars[p]['E(f(Aa))'] = 2 * pVars[p]['p'] * pVars[p]['q']
-        # 2. O(f(Aa)) = pVars[p]['Aa']
-        # 3. calculate F
-        try:
-            pVars[p]['F'] = ( pVars[p]['E(f(Aa))'] - pVars[p]['Aa'] ) / ( pVars[p]['E(f(Aa))'] )
-            n0 = pVars[p]['aa']
-            n2 = pVars[p]['AA']
-            n1 = pVars[p]['Aa']
-            N = n0 + n1 + n2
-            pVars[p]['Z'] = ((n2 * n0 - n1 ** 2) / ((n2 + 0.5 * n1) * (n0 + 0.5 * n1))) * math.sqrt(N)
-        except Exception as e:
-            print('exception calculating F: ' + str(e))
-            continue
-        if abs(pVars[p]['F']) <= significance:
-            pVars[p]['accept F'] = True
-        else:
-            pVars[p]['accept F'] = False
-
-
-    for v in vVars:
-        # 1. get E(f(Aa))
-        vVars[v]['E(f(Aa))'] = 2 * vVars[v]['p'] * vVars[v]['q']
-        # 2. O(f(Aa)) = vVars[v]['Aa']
-        # 3. calculate F
-        try:
-            vVars[v]['F'] = ( vVars[v]['E(f(Aa))'] - vVars[v]['Aa'] ) / ( vVars[v]['E(f(Aa))'] )
-            n0 = vVars[v]['aa']
-            n2 = vVars[v]['AA']
-            n1 = vVars[v]['Aa']
-            N = n0 + n1 + n2
-            vVars[v]['Z'] = ((n2 * n0 - n1 ** 2) / ((n2 + 0.5 * n1) * (n0 + 0.5 * n1))) * math.sqrt(N)
-        except Exception as e:
-            print('exception calculating F: ' + str(e))
-            vVars[v]['F'] = 0.0
-        if abs(vVars[v]['F']) <= significance:
-            vVars[v]['accept F'] = True
-        else:
-            vVars[v]['accept F'] = False
+    # F and the GALA Z-statistic per variant (see hardyWeinberg.inbreedingStatistics()), on the variant dicts of
+    # hardyWeinbergChiSquareTest()
+    for variants in [bVars, pVars, vVars]:
+        AA, Aa, aa = getGenotypeCounts(variants)
+        results = hardyWeinberg.inbreedingStatistics(AA, Aa, aa, [variants[v]['p'] for v in variants],
+                                                     [variants[v]['q'] for v in variants], significance)
+        addStatistics(variants, results, hardyWeinberg.statisticsKeys)
 
     return bVars, pVars, vVars
 
@@ -781,98 +588,11 @@ def tree_factorial(n):
 
 
 def hardyWeinbergChiSquareTest(bVars, pVars, vVars, n, c):
-    # https://en.wikipedia.org/wiki/Hardy-Weinberg_principle
-    # degrees of freedom = 1
-    criticalValue = 3.84
-
-    for b in bVars:
-        # 2. calculate p = (2 x Obs(AA) + Obs(Aa)) / (2 x (Obs(AA) + Obs(Aa) + Obs(aa))
-        bVars[b]['p'] = (2 * bVars[b]['AA'] + bVars[b]['Aa']) / ( 2 * (bVars[b]['AA'] + bVars[b]['Aa'] + bVars[b]['aa']))
-
-        # 3. calculate q = 1 - p
-        bVars[b]['q'] = 1 - bVars[b]['p']
-
-        # 4. calculate Exp(AA) = p**2 x n
-        expAA = n * bVars[b]['p'] **2
-
-        # 5. calculate Exp(Aa) = 2 x p * q * n
-        expAa = 2 * bVars[b]['p'] * bVars[b]['q'] * n
-
-        # 6. calculate Exp(aa) = q**2 x n
-        expaa = n * bVars[b]['q'] **2
-
-        # 7. calculate chi-square = sum[ (O - E)**2 / E ]
-        if expAA == 0 or expAa == 0 or expaa == 0:
-            bVars[b]['chisquare'] = 0
-        else:
-            bVars[b]['chisquare'] = (1.0/expAA) * (abs(bVars[b]['AA'] - expAA) - c)**2 + \
-                                    (1.0/expAa) * (abs(bVars[b]['Aa'] - expAa) - c)**2 + \
-                                    (1.0/expaa) * (abs(bVars[b]['aa'] - expaa) - c)**2
-
-        # 8. compare against p-value for 1 degree of freedom at 0.05 significance (3.84)
-        if bVars[b]['chisquare'] >= criticalValue:
-            bVars[b]['accept hw'] = False
-        else:
-            bVars[b]['accept hw'] = True
-
-    for p in pVars:
-        # 2. calculate p = (2 x Obs(AA) + Obs(Aa)) / (2 x (Obs(AA) + Obs(Aa) + Obs(aa))
-        pVars[p]['p'] = (2 * pVars[p]['AA'] + pVars[p]['Aa']) / ( 2 * (pVars[p]['AA'] + pVars[p]['Aa'] + pVars[p]['aa']))
-
-        # 3. calculate q = 1 - p
-        pVars[p]['q'] = 1 - pVars[p]['p']
-
-        # 4. calculate Exp(AA) = p**2 x n
-        expAA = n * pVars[p]['p'] **2
-
-        # 5. calculate Exp(Aa) = 2 x p * q * n
-        expAa = 2 * pVars[p]['p'] * pVars[p]['q'] * n
-
-        # 6. calculate Exp(aa) = q**2 x n
-        expaa = n * pVars[p]['q'] **2
-
-        # 7. calculate chi-square = sum[ (O - E)**2 / E ]
-        if expAA == 0 or expAa == 0 or expaa == 0:
-            pVars[p]['chisquare'] = 0
-        else:
-            pVars[p]['chisquare'] = 1.0/expAA * (abs(pVars[p]['AA'] - expAA) - c)**2 + \
-                                    1.0/expAa * (abs(pVars[p]['Aa'] - expAa) - c)**2 + \
-                                    1.0/expaa * (abs(pVars[p]['aa'] - expaa) - c)**2
-        # 8. compare against p-value for 1 degree of freedom at 0.05 significance (3.84)
-        if pVars[p]['chisquare'] >= criticalValue:
-            pVars[p]['accept hw'] = False
-        else:
-            pVars[p]['accept hw'] = True
-
-    for v in vVars:
-        # 2. calculate p = (2 x Obs(AA) + Obs(Aa)) / (2 x (Obs(AA) + Obs(Aa) + Obs(aa))
-        vVars[v]['p'] = (2 * vVars[v]['AA'] + vVars[v]['Aa']) / ( 2 * (vVars[v]['AA'] + vVars[v]['Aa'] + vVars[v]['aa']))
-
-        # 3. calculate q = 1 - p
-        vVars[v]['q'] = 1 - vVars[v]['p']
-
-        # 4. calculate Exp(AA) = p**2 x n
-        expAA = n * vVars[v]['p'] **2
-
-        # 5. calculate Exp(Aa) = 2 x p * q * n
-        expAa = 2 * vVars[v]['p'] * vVars[v]['q'] * n
-
-        # 6. calculate Exp(aa) = q**2 x n
-        expaa = n * vVars[v]['q'] **2
-
-        # 7. calculate chi-square = sum[ (O - E)**2 / E ]
-        if expAA == 0 or expAa == 0 or expaa == 0:
-            vVars[v]['chisquare'] = 0
-        else:
-            vVars[v]['chisquare'] = 1.0/expAA * (abs(vVars[v]['AA'] - expAA) - c)**2 + \
-                                    1.0/expAa * (abs(vVars[v]['Aa'] - expAa) - c)**2 + \
-                                    1.0/expaa * (abs(vVars[v]['aa'] - expaa) - c)**2
-
-        # 8. compare against p-value for 1 degree of freedom at 0.05 significance (3.84)
-        if vVars[v]['chisquare'] >= criticalValue:
-            vVars[v]['accept hw'] = False
-        else:
-            vVars[v]['accept hw'] = True
+    # p, q, chi-square and accept hw per variant (see hardyWeinberg.chiSquareTest()), on the variant dicts of
+    # calculateZygosityFrequenciesPerVariant()
+    for variants in [bVars, pVars, vVars]:
+        AA, Aa, aa = getGenotypeCounts(variants)
+        addStatistics(variants, hardyWeinberg.chiSquareTest(AA, Aa, aa, n, c), hardyWeinberg.chiSquareKeys)
 
     return bVars, pVars, vVars
 
@@ -1093,25 +813,6 @@ def plotGenotypeCounts(genotypeCounts, rare, outputDir):
     #plt.show()
     plt.savefig(outputDir + '/genotypeCounts.png')
 
-def divide(n, d):
-   res = list()
-   qu = int(n/d)
-   rm = n%d
-   for i in range(d):
-       if i < rm:
-           res.append(qu + 1)
-       else:
-           res.append(qu)
-   return res
-
-def getStartAndEnd(partitionSizes, threadID):
-    start = 0
-    for i in range(threadID):
-        start += partitionSizes[i]
-    end = start + partitionSizes[threadID]
-
-    return start, end
-
 def getMaxAncestry(row):
     max = 0.0
     maxAncestry = None
@@ -1124,66 +825,17 @@ def getMaxAncestry(row):
     return maxAncestry
 
 
-def countTotalGenotypesForVariants(q1, q2, vpiDF, ancestriesDF, threadID, numProcesses):
-
-    genotypeCounts = {'benign': {'homo':0, 'hetero': 0},
-                     'pathogenic': {'homo': 0, 'hetero': 0},
-                     'vus': {'homo': 0, 'hetero': 0}}
-    frequenciesPerIndividual = dict()
-    #notInGnomad = {'benign': [], 'pathogenic': [], 'vus': []}
-    individuals = list()
-    for individual in vpiDF:
-        individuals.append(individual)
-    n = len(individuals)
-    logger.info('total number of individuals = ' + str(n))
-    partitionSizes = divide(n, numProcesses)
-    start, end = getStartAndEnd(partitionSizes, threadID)
-
-    logger.info('threadID = ' + str(threadID) + ' processing from ' + str(start) + ' to ' + str(end))
-    for i in range(start, end):
-        individual = individuals[i]
-        try:
-            ethnicity = ancestriesDF[individual]['gnomadPop']
-        except Exception as e:
-            ethnicity = None
-        #ancestry = getMaxAncestry(ancestriesDF[ancestriesDF['individual'] == individual])
-        #ethnicity = hgdp_to_gnomad[ancestry]
-        logger.debug(individual)
-        frequenciesPerIndividual[individual] = {'benign': {'homo': 0, 'hetero': 0},
-                                            'pathogenic': {'homo': 0, 'hetero': 0},
-                                              'vus': {'homo': 0, 'hetero': 0},
-                                                'ethnicity': ethnicity}
-
-        for b in vpiDF[individual]['benign']:
-            if b:
-                if b[1] == '3':
-                    genotypeCounts['benign']['homo'] += 1
-                    frequenciesPerIndividual[individual]['benign']['homo'] += 1
-                else:
-                    genotypeCounts['benign']['hetero'] += 1
-                    frequenciesPerIndividual[individual]['benign']['hetero'] += 1
-        for p in vpiDF[individual]['pathogenic']:
-            if p:
-                if p[1] == '3':
-                    genotypeCounts['pathogenic']['homo'] += 1
-                    frequenciesPerIndividual[individual]['pathogenic']['homo'] += 1
-                else:
-                    genotypeCounts['pathogenic']['hetero'] += 1
-                    frequenciesPerIndividual[individual]['pathogenic']['hetero'] += 1
-        for v in vpiDF[individual]['vus']:
-            if v:
-                if v[1] == '3':
-                    genotypeCounts['vus']['homo'] += 1
-                    frequenciesPerIndividual[individual]['vus']['homo'] += 1
-
-                else:
-                    genotypeCounts['vus']['hetero'] += 1
-                    frequenciesPerIndividual[individual]['vus']['hetero'] += 1
+def getEthnicity(ancestriesDF, individual):
+    try:
+        return ancestriesDF[individual]['gnomadPop']
+    except Exception as e:
+        return None
 
-        
-    q1.put(genotypeCounts)
-    q2.put(frequenciesPerIndividual)
-    #q3.put(notInGnomad)
+def countZygosity(q, tile):
+    # tile is (individual start, individual end, variant start, variant end) from partition.planTiles(); the
+    # matrix is the one getFPI() set before forking
+    logger.info('processing tile ' + str(tile))
+    q.put(zygosityCounts.ZygosityCounts(sharedMatrix, tile))
     logger.debug('finished putting results in queue')
 
 if __name__ == "__main__":
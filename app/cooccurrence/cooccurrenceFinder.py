@@ -8,7 +8,21 @@ import numpy as np
 import os
 import argparse
 import logging
+import shutil
+import tempfile
 import allel
+import gnomadSites
+import carrierMatrix
+import carrierArchive
+import haplotypeBitsets
+import sampleAnnotations
+import variantAnnotations
+import jsonWriter
+import checkpoints
+import profiling
+import genotypeCache
+import partition
+from partition import divide, getStartAndEnd
 from multiprocessing import Process, Queue, cpu_count
 
 
@@ -40,23 +54,10 @@ classStrings = { 'Pathogenic':[ 'Pathogenic',
                               '-']}
 sigColName = 'Clinical_significance'
 coordinateColumnBase = 'Genomic_Coordinate_hg'
+# the VCF fields the finder uses
+vcfFields = ['samples', 'calldata/GT', 'variants/CHROM', 'variants/POS', 'variants/REF', 'variants/ALT']
 
 
-class NpEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, set):
-            return list(obj)
-        elif isinstance(obj, tuple):
-            return list(obj)
-        else:
-            return super(NpEncoder, self).default(obj)
-
 class NpDecoder(json.JSONDecoder):
     def default(self, obj):
         if isinstance(obj, list):
@@ -90,6 +91,34 @@ def parseArgs():
                         default='/var/tmp/pyensembl-cache')
     parser.add_argument("--spf", dest="spf", help="(optional) sample pathology input file. Default=None", default=None)
     parser.add_argument("--gf", dest="gf", help="(optional) gnomad sites vcf file name. Default=None", default=None)
+    parser.add_argument("--engine", dest="engine", help="genotype classification engine (vectorized or loop). Default=vectorized",
+                        default='vectorized')
+    parser.add_argument("--gi", dest="gi", help="(optional) gene index npz file, loaded if present and saved otherwise; in batch mode a directory of <gene>-index.npz files. Default=None",
+                        default=None)
+    parser.add_argument("--chunk", dest="chunk", help="(optional) stream the VCF this many variants at a time instead of reading it whole. Default=None",
+                        default=None)
+    parser.add_argument("--cache", dest="cache", help="(optional) genotype cache directory (see genotypeCache.py). Default=None",
+                        default=None)
+    parser.add_argument("--split", dest="split", help="split work by samples, variants, tiles or auto. Default=auto",
+                        choices=partition.splitModes, default='auto')
+    parser.add_argument("--format", dest="format", help="format of saved vpi, ipv, all and tout files: json, or npz for one carrier archive (see carrierArchive.py). Default=json",
+                        choices=['json', 'npz'], default='json')
+    parser.add_argument("--checkpoints", dest="checkpoints", help="(optional) directory the run's stages are checkpointed in (see checkpoints.py). Default=None",
+                        default=None)
+    parser.add_argument("--resume", dest="resume", help="reuse the checkpoints of stages whose inputs are unchanged (boolean). Default=False; with True and no --checkpoints, <gene>-checkpoints",
+                        default='False')
+    parser.add_argument("--cpa", dest="cpa", help="(optional) tar file the checkpoint directory is copied to after each stage and restored from on resume, e.g. a Cromwell checkpointFile. Default=None",
+                        default=None)
+    parser.add_argument("--metrics", dest="metrics", help="(optional) file the per-stage wall time, cpu time, peak rss and item counts of the run are saved to as json (see profiling.py). Default=None",
+                        default=None)
+    parser.add_argument("--profile", dest="profile", help="(optional) file a profile of the run is saved to: cProfile stats, or a pyinstrument report if it ends in .html and pyinstrument is installed. Default=None",
+                        default=None)
+    parser.add_argument("--targets", dest="targets", help="(optional) batch mode: file of chrom<tab>gene lines, or a BED of gene regions (chrom, start, end, gene). --c and --g are ignored. Default=None",
+                        default=None)
+    parser.add_argument("--jobs", dest="jobs", help="number of genes processed at once in batch mode, each with n/jobs processes. Default=min(genes, n)",
+                        default=None)
+    parser.add_argument("--summary", dest="summary", help="combined summary file name in batch mode. Default=batch-summary.json",
+                        default='batch-summary.json')
     parser.add_argument("--log", dest="logLevel", help="Logging level. Default=%s" % defaultLogLevel, default=defaultLogLevel)
     return parser.parse_args()
 
@@ -117,14 +146,9 @@ def main():
     print(options)
 
     dataDir = options.data
-    gnomadFileName = pathologyFileName = intersectionFile = annoFileName = None
+    gnomadFileName = pathologyFileName = annoFileName = None
 
     if dataDir != None:
-        outFileName = dataDir + "/" + str(options.g) + "-cooccurrences.json"
-        ipvFileName = dataDir + "/" + str(options.g) + "-ipv.json"
-        vpiFileName = dataDir + "/" + str(options.g) + "-vpi.json"
-        allFileName = dataDir + "/" + str(options.g) + "-all.json"
-        toutFileName = dataDir + "/" + str(options.g) + "-tout.json"
         vcfFileName = dataDir + "/" + options.vcf
         pathogenicityFileName = dataDir + "/" + options.vpf
         if options.anno != "" and not options.anno is None:
@@ -133,14 +157,8 @@ def main():
             gnomadFileName = dataDir + "/" + options.gf
         if options.spf != "" and not options.spf is None:
             pathologyFileName = dataDir + "/" + options.spf
-            intersectionFile = dataDir + "/" + str(options.g) + '-intersection.json'
 
     else:
-        outFileName = str(options.g) + "-cooccurrences.json"
-        ipvFileName = str(options.g) + "-ipv.json"
-        vpiFileName = str(options.g) + "-vpi.json"
-        allFileName = str(options.g) + "-all.json"
-        toutFileName = str(options.g) + "-tout.json"
         vcfFileName = options.vcf
         pathogenicityFileName =  options.vpf
         if options.anno != "" and not options.anno is None:
@@ -149,135 +167,436 @@ def main():
             gnomadFileName =  options.gf
         if options.spf != "" and not options.spf is None:
             pathologyFileName = options.spf
-            intersectionFile = str(options.g) + '-intersection.json'
+
+    outFileName, ipvFileName, vpiFileName, allFileName, toutFileName, carriersFileName, intersectionFile = \
+        getOutputFileNames(dataDir, options.g, pathologyFileName)
+
+    geneIndexFileName = None
+    if options.gi != "" and not options.gi is None:
+        if dataDir != None:
+            geneIndexFileName = dataDir + "/" + options.gi
+        else:
+            geneIndexFileName = options.gi
+
+    chunkLength = None
+    if options.chunk != "" and not options.chunk is None:
+        chunkLength = int(options.chunk)
+
+    cacheDir = None
+    if options.cache != "" and not options.cache is None:
+        cacheDir = options.cache
 
     saveFiles = str2bool(options.save)
     phased = str2bool(options.p)
     p2 = float(options.p2)
 
+    resume = str2bool(options.resume)
+    checkpointDir = None
+    if options.checkpoints != "" and not options.checkpoints is None:
+        checkpointDir = options.checkpoints
+    elif resume:
+        checkpointDir = str(options.g) + '-checkpoints'
+        if options.targets != "" and not options.targets is None:
+            checkpointDir = 'batch-checkpoints'
+    if checkpointDir is not None and dataDir != None:
+        checkpointDir = dataDir + "/" + checkpointDir
+    checkpointArchive = None
+    if options.cpa != "" and not options.cpa is None:
+        checkpointArchive = options.cpa
+
+    if options.profile != "" and not options.profile is None:
+        profiling.profiler.startProfile(options.profile)
+
+    if options.targets != "" and not options.targets is None:
+        targetsFileName = options.targets
+        summaryFileName = options.summary
+        if dataDir != None:
+            targetsFileName = dataDir + "/" + options.targets
+            summaryFileName = dataDir + "/" + options.summary
+        numJobs = None
+        if options.jobs != "" and not options.jobs is None:
+            numJobs = int(options.jobs)
+        runBatch(int(options.h), int(options.e), readTargets(targetsFileName), phased, p2, vcfFileName,
+                 int(options.n), pathogenicityFileName, options.d, dataDir, annoFileName, saveFiles,
+                 pathologyFileName, gnomadFileName, summaryFileName, options.engine, geneIndexFileName, chunkLength,
+                 cacheDir, options.split, options.format, numJobs, checkpointDir, resume)
+    else:
+        run(int(options.h), int(options.e), options.c, options.g, phased, p2, vcfFileName,
+            int(options.n), pathogenicityFileName, options.d, ipvFileName, vpiFileName, allFileName, annoFileName,
+            outFileName, toutFileName, saveFiles, pathologyFileName, intersectionFile, gnomadFileName, options.engine,
+            geneIndexFileName, chunkLength, cacheDir, options.split, options.format, carriersFileName, checkpointDir,
+            resume, checkpointArchive)
 
-    run(int(options.h), int(options.e), options.c, options.g, phased, p2, vcfFileName,
-        int(options.n), pathogenicityFileName, options.d, ipvFileName, vpiFileName, allFileName, annoFileName,
-        outFileName, toutFileName, saveFiles, pathologyFileName, intersectionFile, gnomadFileName)
+    profiling.profiler.stopProfile()
+    if options.metrics != "" and not options.metrics is None:
+        profiling.profiler.save(options.metrics)
 
 def run(hgVersion, ensemblRelease, chromosome, gene, phased, p2, vcfFileName, numProcs,
         pathogenicityFileName, pyensemblDir, ipvFileName, vpiFileName, allVariantsFileName, annoFileName,
-        outputFileName, toutFileName, saveFiles, pathologyFileName, intersectionFile, gnomadFileName):
+        outputFileName, toutFileName, saveFiles, pathologyFileName, intersectionFile, gnomadFileName,
+        engine='vectorized', geneIndexFileName=None, chunkLength=None, cacheDir=None, splitMode='auto',
+        outputFormat='json', carriersFileName=None, checkpointDir=None, resume=False, checkpointArchive=None):
 
 
     logger.info('setting pyensembl dir to ' + pyensemblDir)
     os.environ['PYENSEMBL_CACHE_DIR'] = '/var/tmp/pyensembl-cache'
 
+    # stage checkpoints (see checkpoints.py and runGene()); with checkpointDir None every stage is computed
+    stages = checkpoints.Checkpoints(checkpointDir, resume, checkpointArchive)
+
+    annoDF = readAnnotations(annoFileName)
+    df, pathogenicVariants, benignVariants, unknownVariants = \
+        stages.stage('variants', [checkpoints.File(pathogenicityFileName), hgVersion, classStrings],
+                     lambda: readVariantClasses(pathogenicityFileName, hgVersion)).get()
+
+    return runGene(hgVersion, ensemblRelease, chromosome, gene, phased, p2, vcfFileName, numProcs, annoDF, df,
+                   pathogenicVariants, benignVariants, unknownVariants, ipvFileName, vpiFileName, allVariantsFileName,
+                   outputFileName, toutFileName, saveFiles, pathologyFileName, intersectionFile, gnomadFileName, engine,
+                   geneIndexFileName, chunkLength, cacheDir, splitMode, outputFormat, carriersFileName, stages)
+
+def getOutputFileNames(dataDir, gene, pathologyFileName=None):
+    # per-gene output names: <gene>-cooccurrences.json, -ipv.json, -vpi.json, -all.json, -tout.json, -carriers.npz
+    # and, with a pathology file, -intersection.json
+    prefix = str(gene)
+    if dataDir != None:
+        prefix = dataDir + "/" + str(gene)
+    intersectionFile = None
+    if pathologyFileName != "" and not pathologyFileName is None:
+        intersectionFile = prefix + '-intersection.json'
+    return prefix + "-cooccurrences.json", prefix + "-ipv.json", prefix + "-vpi.json", prefix + "-all.json", \
+           prefix + "-tout.json", prefix + "-carriers.npz", intersectionFile
+
+def readAnnotations(annoFileName):
     if not annoFileName is None and annoFileName != '':
         logger.info('reading annotation data from ' + annoFileName)
         with open(annoFileName, 'r') as f:
             dtypeDict = {'sample.id':str}
             annoDF = pandas.read_csv(annoFileName, header=0, sep='\t',dtype=dtypeDict )
         f.close()
+        # index it now so forked workers inherit the index instead of each building one
+        getSampleAnnotations(annoDF)
     else:
         annoDF = None
+    return annoDF
 
+def readVariantClasses(pathogenicityFileName, hgVersion):
     logger.info('reading data from ' + pathogenicityFileName)
-    t = time.time()
-    df, pathogenicVariants, benignVariants, unknownVariants = findVariants(pathogenicityFileName, classStrings, hgVersion)
-    logger.info('elapsed time in findVariants() ' + str(time.time() -t))
+    with profiling.stage('findVariants()') as record:
+        df, pathogenicVariants, benignVariants, unknownVariants = findVariants(pathogenicityFileName, classStrings,
+                                                                               hgVersion)
+        record.count(rows=len(df), pathogenic=len(pathogenicVariants), benign=len(benignVariants),
+                     vus=len(unknownVariants))
 
     logger.info('number of pathogenic variants is ' + str(len(pathogenicVariants)))
     logger.info('number of benign variants is ' + str(len(benignVariants)))
     logger.info('number of vus variants is ' + str(len(unknownVariants)))
-
-    if saveFiles:
+    return df, pathogenicVariants, benignVariants, unknownVariants
+
+def runGene(hgVersion, ensemblRelease, chromosome, gene, phased, p2, vcfFileName, numProcs, annoDF, df,
+            pathogenicVariants, benignVariants, unknownVariants, ipvFileName, vpiFileName, allVariantsFileName,
+            outputFileName, toutFileName, saveFiles, pathologyFileName, intersectionFile, gnomadFileName,
+            engine='vectorized', geneIndexFileName=None, chunkLength=None, cacheDir=None, splitMode='auto',
+            outputFormat='json', carriersFileName=None, stages=None, gnomad=None):
+    # everything run() does after the inputs every gene shares (annotations, pathogenicity classes) are read.
+    # stages is the run's checkpoints.Checkpoints. gnomad is a gnomadSites.GnomadSites store of gnomadFileName
+    # already loaded for this gene (runBatch() loads one for every gene); without one, the gene region of
+    # gnomadFileName is loaded here. returns a summary of the gene's results
+    startTime = time.time()
+
+    # the json outputs are written on a background thread while the run goes on; nothing queued on it is changed
+    # afterwards, and close() at the end waits for the writes
+    writer = jsonWriter.BackgroundWriter()
+
+    if saveFiles and outputFormat == 'json':
         myTout = {'benign': benignVariants, 'pathogenic': pathogenicVariants, 'vus': unknownVariants}
         logger.info('saving all variants to ' + toutFileName)
-        with open(toutFileName, 'w') as f:
-            json.dump(myTout, f, cls=NpEncoder)
-        f.close()
-
-
-
-    logger.info('reading VCF file ' + vcfFileName)
-    t = time.time()
-    vcf = readVCFFile(vcfFileName)
-    logger.info('elapsed time in readVCFFile() ' + str(time.time() -t))
-
-    logger.info('finding variants per individual in ' + vcfFileName)
-    t = time.time()
-    q = Queue()
-    processList = list()
-    for i in range(numProcs):
-        p = Process(target=findVarsPerIndividual, args=(q, vcf, benignVariants, pathogenicVariants, chromosome, gene,
-                                                        ensemblRelease, annoDF, i, numProcs, ))
-        p.start()
-        processList.append(p)
-    logger.info('joining results from forked threads')
-    variantsPerIndividual = dict()
-    for i in range(numProcs):
-        variantsPerIndividual.update(q.get())
-    for i in range(numProcs):
-        processList[i].join()
-    logger.info('elapsed time in findVariantsPerIndividual() ' + str(time.time() -t))
+        writer.write(toutFileName, myTout)
+
+
+
+    # build (or load) the gene index once, before the worker processes fork, so every getGenesForVariant() call
+    # in this run is a lookup in the same index
+    geneIndex = getGeneIndex(ensemblRelease, gene, geneIndexFileName)
+    geneIntervals = [(c, geneIndex.starts[c], geneIndex.ends[c]) for c in sorted(geneIndex.starts)]
+
+    # only the gene region and the INFO keys the finder uses are kept from the gnomad sites file
+    geneRegion = geneIndex.region(chromosome)
+    if gnomad is None and not gnomadFileName is None and gnomadFileName != '':
+        with profiling.stage('getGnomadSites()') as record:
+            region = geneRegion
+            if region is None:
+                region = (None, None)
+            gnomad = gnomadSites.getGnomadSites(gnomadFileName, chromosome, region[0], region[1],
+                                                gnomadSites.usedInfoKeys)
+            record.count(sites=len(gnomad))
+
+    # variants outside the gene are dropped by getGenesForVariant() anyway, so only read the gene region
+    vcfRegion = getVCFRegion(vcfFileName, chromosome, geneRegion)
+
+    # the run is a chain of stages (see checkpoints.py); each is keyed by its inputs, upstream stages included, and
+    # with --resume a stage whose key has a checkpoint is loaded instead of computed. stages are only computed
+    # when something downstream needs them, so a resumed run past genotypes never reads the VCF.
+    if stages is None:
+        stages = checkpoints.Checkpoints()
+    # frames are fingerprinted by content, once
+    classes = checkpoints.fingerprint([df, classStrings])
+    annotations = checkpoints.fingerprint(annoDF)
+
+    # the parsed VCF is never checkpointed: its calldata/GT is the largest thing in the run, the genotypes stage
+    # checkpoints what is derived from it, and the genotype cache is a checkpoint of the parse already
+    vcfStage = stages.stage('vcf', [checkpoints.File(vcfFileName), vcfRegion, cacheDir],
+                            lambda: parseVCF(vcfFileName, vcfRegion, cacheDir), save=False)
+
+    def findGenotypes():
+        if chunkLength is not None and cacheDir is None:
+            logger.info('finding variants per individual in ' + vcfFileName + ' region ' + str(vcfRegion) +
+                        ' in chunks of ' + str(chunkLength) + ' variants')
+            with profiling.stage('findVarsPerIndividualChunked()'):
+                variantsPerIndividual, vcf = findVarsPerIndividualChunked(vcfFileName, vcfRegion, chunkLength,
+                                                                          benignVariants, pathogenicVariants,
+                                                                          chromosome, gene, ensemblRelease, annoDF)
+        else:
+            vcf = vcfStage.get()
+            variantsPerIndividual = classifyVCF(vcf, benignVariants, pathogenicVariants, chromosome, gene,
+                                                ensemblRelease, annoDF, numProcs, engine, splitMode)
+        # only the variant columns of the vcf are used past this stage
+        return variantsPerIndividual, getVariantColumns(vcf)
+
+    genotypesStage = stages.stage('genotypes', [vcfStage, chunkLength, engine, chromosome, gene, ensemblRelease,
+                                                geneIntervals, classes, annotations], findGenotypes)
+
+    def findIPV():
+        variantsPerIndividual, vcf = genotypesStage.get()
+        cohortSize = len(variantsPerIndividual)
+        logger.info('number of samples is ' + str(cohortSize))
+        individualsPerVariant = findIndividualsPerVariant(variantsPerIndividual, vcf, chromosome,df, hgVersion,
+                                                          ensemblRelease, cohortSize, gnomad)
+        logger.info('number of records is ' + str(len(individualsPerVariant)))
+        return individualsPerVariant
 
-    t = time.time()
+    ipvStage = stages.stage('ipv', [genotypesStage, classes, hgVersion, ensemblRelease,
+                                    checkpoints.File(gnomadFileName)], findIPV)
+
+    homozygousStage = stages.stage('homozygous', [genotypesStage, classes, hgVersion, ensemblRelease, gene,
+                                                  checkpoints.File(gnomadFileName)],
+                                   lambda: countHomozygousPerVus(genotypesStage.get()[0], df, hgVersion,
+                                                                 ensemblRelease, gene, gnomad))
+
+    cooccurrenceStage = stages.stage('cooccurrence', [genotypesStage, ensemblRelease, phased, gene, geneIntervals],
+                                     lambda: findIndividualsPerCooccurrence(genotypesStage.get()[0], ensemblRelease,
+                                                                            phased, gene))
+
+    def findLikelihood():
+        variantsPerIndividual = genotypesStage.get()[0]
+        individualsPerPathogenicCooccurrence, n, k = cooccurrenceStage.get()
+        cohortSize = len(variantsPerIndividual)
+        # TODO check this math!
+        logger.info('calculating p1')
+        # p1 = P(VUS is benign and patient carries a path variant in trans) = 0.5 * overall freq of path muts in cohort
+        # calculate total number of benign, pathogenic, and vus variants in cohort
+        logger.info('getting all variants for cohort')
+        allVariants = getAllVariantsPerClass(variantsPerIndividual)
+        numPathogenic = len(set(allVariants['pathogenic']))
+        p1 =  0.5 * numPathogenic / cohortSize
+
+        logger.info('putting all the data together per vus')
+        dataPerVus = calculateLikelihood(individualsPerPathogenicCooccurrence, p1, p2, n, k, df, hgVersion, cohortSize,
+                                         gnomad)
+        return allVariants, dataPerVus
+
+    likelihoodStage = stages.stage('likelihood', [genotypesStage, cooccurrenceStage, p2, classes, hgVersion,
+                                                  checkpoints.File(gnomadFileName)], findLikelihood)
+
+    pathologyStage = stages.stage('pathology', [likelihoodStage, homozygousStage, ipvStage,
+                                                checkpoints.File(pathologyFileName), intersectionFile],
+                                  lambda: intersectPathology(pathologyFileName,
+                                                             {"cooccurring vus": likelihoodStage.get()[1],
+                                                              "homozygous vus": homozygousStage.get()},
+                                                             ipvStage.get(), intersectionFile),
+                                  outputs=[intersectionFile])
+
+    variantsPerIndividual, vcf = genotypesStage.get()
     cohortSize = len(variantsPerIndividual)
-    logger.info('number of samples is ' + str(cohortSize))
-    individualsPerVariant = findIndividualsPerVariant(variantsPerIndividual, vcf, chromosome,df, hgVersion,
-                                                        ensemblRelease, cohortSize, gnomadFileName)
-    logger.info('number of records is ' + str(len(individualsPerVariant)))
-    logger.info('elapsed time in updateIndividualsPerVariant() ' + str(time.time() -t))
-
-    if saveFiles:
+    profiling.profiler.get('genotypes').count(samples=cohortSize, variants=len(vcf['variants/POS']))
+    individualsPerVariant = ipvStage.get()
+    profiling.profiler.get('ipv').count(variants=len(individualsPerVariant))
+
+    if saveFiles and outputFormat == 'npz':
+        # the archive holds vpi, ipv and tout; -all.json is rebuilt from it on load
+        logger.info('saving vpi, ipv and tout to ' + carriersFileName)
+        carrierArchive.save(carriersFileName,
+                            carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(variantsPerIndividual),
+                            individualsPerVariant,
+                            {'benign': benignVariants, 'pathogenic': pathogenicVariants, 'vus': unknownVariants})
+    elif saveFiles:
         logger.info('saving vpi to ' + vpiFileName)
-        with open(vpiFileName, 'w') as f:
-            json.dump(variantsPerIndividual, f, cls=NpEncoder)
-        f.close()
+        writer.write(vpiFileName, variantsPerIndividual)
 
         logger.info('saving ipv to ' + ipvFileName)
-        with open(ipvFileName, 'w') as f:
-            json.dump(individualsPerVariant, f, cls=NpEncoder)
-        f.close()
+        writer.write(ipvFileName, individualsPerVariant)
 
     logger.info('finding homozygous individuals per vus')
-    t = time.time()
-    homozygousPerVus = countHomozygousPerVus(variantsPerIndividual, df, hgVersion, ensemblRelease, gene, gnomadFileName)
-    logger.info('elapsed time in countHomozygousPerVus() ' + str(time.time() -t))
+    homozygousPerVus = homozygousStage.get()
+    profiling.profiler.get('homozygous').count(vus=len(homozygousPerVus))
 
     logger.info('finding individuals per cooc')
-    t = time.time()
-    individualsPerPathogenicCooccurrence, n, k = findIndividualsPerCooccurrence(variantsPerIndividual, ensemblRelease,
-                                                                                phased, gene)
-    logger.info('elapsed time in findIndividualsPerCooccurrence() ' + str(time.time() -t))
-
-
-    # TODO check this math!
-    logger.info('calculating p1')
-    # p1 = P(VUS is benign and patient carries a path variant in trans) = 0.5 * overall freq of path muts in cohort
-    # calculate total number of benign, pathogenic, and vus variants in cohort
-    logger.info('getting all variants for cohort')
-    allVariants = getAllVariantsPerClass(variantsPerIndividual)
+    individualsPerPathogenicCooccurrence, n, k = cooccurrenceStage.get()
+    profiling.profiler.get('cooccurrence').count(vus=len(n), pairs=len(individualsPerPathogenicCooccurrence),
+                                                 cooccurrences=sum(k.values()))
+
+    allVariants, dataPerVus = likelihoodStage.get()
     numPathogenic = len(set(allVariants['pathogenic']))
-    p1 =  0.5 * numPathogenic / cohortSize
+    profiling.profiler.get('likelihood').count(vus=len(dataPerVus))
 
-    if saveFiles:
+    if saveFiles and outputFormat == 'json':
         logger.info('saving all variants to ' + allVariantsFileName)
-        json_dump = json.dumps(allVariants, cls=NpEncoder)
-        with open(allVariantsFileName, 'w') as f:
-            f.write(json_dump)
-        f.close()
-
-    logger.info('putting all the data together per vus')
-    dataPerVus = calculateLikelihood(individualsPerPathogenicCooccurrence, p1, p2, n, k, df, hgVersion, cohortSize, gnomadFileName)
+        writer.write(allVariantsFileName, allVariants)
 
     data_set = {"cooccurring vus": dataPerVus, "homozygous vus": homozygousPerVus}
-    json_dump = json.dumps(data_set, cls=NpEncoder)
 
     logger.info('saving final VUS data  to ' + outputFileName)
-    with open(outputFileName, 'w') as f:
-        f.write(json_dump)
-    f.close()
+    writer.write(outputFileName, data_set)
 
     if pathologyFileName != "" and not pathologyFileName is None:
         logger.info('intersecting variants with pathology data in file ' + str(pathologyFileName))
-        intersectPathology(pathologyFileName, data_set, individualsPerVariant, intersectionFile )
+        pathologyStage.get()
+
+    writer.close()
+
+    return {'chromosome': str(chromosome), 'samples': cohortSize,
+            'benign variants': len(set(allVariants['benign'])), 'pathogenic variants': numPathogenic,
+            'vus': len(set(allVariants['vus'])), 'cooccurring vus': len(dataPerVus),
+            'homozygous vus': len(homozygousPerVus), 'output': outputFileName,
+            'elapsed time': time.time() - startTime}
+
+def readTargets(fileName):
+    # batch targets as [(chrom, gene, intervals)], in file order. a line is either "chrom<tab>gene", whose gene
+    # region comes from ensembl, or a BED record "chrom<tab>start<tab>end<tab>gene"; BED intervals are 0-based,
+    # half-open, and every interval of a gene is kept as a 1-based, inclusive (start, end)
+    targets = list()
+    intervalsPerGene = dict()
+    with open(fileName, 'r') as f:
+        for line in f:
+            if line.strip() == '' or line.startswith('#') or line.startswith('track') or line.startswith('browser'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 4:
+                chrom, gene = GeneIndex.normalizeContig(fields[0]), fields[3]
+                interval = (int(fields[1]) + 1, int(fields[2]))
+            elif len(fields) == 2:
+                chrom, gene = GeneIndex.normalizeContig(fields[0]), fields[1]
+                interval = None
+            else:
+                raise ValueError('target line is neither chrom<tab>gene nor BED: ' + line)
+            if gene not in intervalsPerGene:
+                intervalsPerGene[gene] = list()
+                targets.append((chrom, gene, intervalsPerGene[gene]))
+            elif targets[[t[1] for t in targets].index(gene)][0] != chrom:
+                raise ValueError('gene ' + gene + ' is listed on more than one chromosome')
+            if interval is not None:
+                intervalsPerGene[gene].append(interval)
+    f.close()
+    return targets
+
+def runBatch(hgVersion, ensemblRelease, targets, phased, p2, vcfFileName, numProcs, pathogenicityFileName,
+             pyensemblDir, dataDir, annoFileName, saveFiles, pathologyFileName, gnomadFileName, summaryFileName,
+             engine='vectorized', geneIndexDir=None, chunkLength=None, cacheDir=None, splitMode='auto',
+             outputFormat='json', numJobs=None, checkpointDir=None, resume=False):
+    # run() for every (chrom, gene, intervals) target of readTargets(). the annotations, pathogenicity classes,
+    # gene indexes and gnomad sites are loaded once, then numJobs genes at a time run in forked processes that
+    # inherit them, each writing the usual <gene>-* outputs. the per-gene summaries go to summaryFileName.
+    # geneIndexDir, if given, holds a <gene>-index.npz per ensembl gene. with checkpointDir, the shared stages are
+    # checkpointed there and each gene's stages in a <gene> directory under it.
+    logger.info('setting pyensembl dir to ' + pyensemblDir)
+    os.environ['PYENSEMBL_CACHE_DIR'] = '/var/tmp/pyensembl-cache'
+
+    stages = checkpoints.Checkpoints(checkpointDir, resume)
+
+    annoDF = readAnnotations(annoFileName)
+    df, pathogenicVariants, benignVariants, unknownVariants = \
+        stages.stage('variants', [checkpoints.File(pathogenicityFileName), hgVersion, classStrings],
+                     lambda: readVariantClasses(pathogenicityFileName, hgVersion)).get()
+
+    with profiling.stage('getGeneIndex()') as record:
+        regions = getBatchRegions(targets, ensemblRelease, geneIndexDir)
+        record.count(genes=len(targets))
+
+    # one store for every gene's region, inherited by the gene processes
+    gnomad = None
+    if not gnomadFileName is None and gnomadFileName != '':
+        with profiling.stage('getGnomadSitesForRegions()') as record:
+            gnomad = gnomadSites.getGnomadSitesForRegions(gnomadFileName, regions, gnomadSites.usedInfoKeys)
+            record.count(sites=len(gnomad))
+
+    if numJobs is None:
+        numJobs = numProcs
+    numJobs = max(1, min(numJobs, len(targets)))
+    procsPerGene = max(1, numProcs // numJobs)
+    logger.info('running ' + str(len(targets)) + ' genes, ' + str(numJobs) + ' at a time with ' +
+                str(procsPerGene) + ' processes each')
+
+    q = Queue()
+    pending = list(targets)
+    running = dict()
+    summaries = dict()
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < numJobs:
+            chrom, gene, intervals = pending.pop(0)
+            outFileName, ipvFileName, vpiFileName, allFileName, toutFileName, carriersFileName, intersectionFile = \
+                getOutputFileNames(dataDir, gene, pathologyFileName)
+            geneStages = checkpoints.Checkpoints()
+            if checkpointDir is not None:
+                geneStages = checkpoints.Checkpoints(os.path.join(checkpointDir, gene), resume)
+            p = Process(target=runBatchGene, args=(q, gene, hgVersion, ensemblRelease, chrom, gene, phased, p2,
+                                                   vcfFileName, procsPerGene, annoDF, df, pathogenicVariants,
+                                                   benignVariants, unknownVariants, ipvFileName, vpiFileName,
+                                                   allFileName, outFileName, toutFileName, saveFiles,
+                                                   pathologyFileName, intersectionFile, gnomadFileName, engine,
+                                                   None, chunkLength, cacheDir, splitMode, outputFormat,
+                                                   carriersFileName, geneStages, gnomad, ))
+            p.start()
+            running[gene] = p
+        gene, summary = q.get()
+        running.pop(gene).join()
+        summaries[gene] = summary
+        logger.info('finished ' + gene + ': ' + str(summary))
+
+    logger.info('saving batch summary to ' + summaryFileName)
+    jsonWriter.writeJSON(summaryFileName, {gene: summaries[gene] for chrom, gene, intervals in targets})
+
+    failed = [gene for chrom, gene, intervals in targets if 'error' in summaries[gene]]
+    if len(failed) > 0:
+        raise RuntimeError('batch failed for genes ' + ', '.join(failed))
+    return summaries
+
+def getBatchRegions(targets, ensemblRelease, geneIndexDir=None):
+    # builds the gene index of every target and returns the (chrom, start, end) region of each one that has one
+    regions = list()
+    for chrom, gene, intervals in targets:
+        if len(intervals) > 0:
+            # the BED intervals are the gene
+            geneIndexes[(ensemblRelease, gene)] = GeneIndex(gene, [chrom] * len(intervals),
+                                                            [i[0] for i in intervals], [i[1] for i in intervals])
+        elif geneIndexDir is not None:
+            getGeneIndex(ensemblRelease, gene, os.path.join(geneIndexDir, gene + '-index.npz'))
+        else:
+            getGeneIndex(ensemblRelease, gene)
+        region = geneIndexes[(ensemblRelease, gene)].region(chrom)
+        if region is not None:
+            regions.append((chrom, region[0], region[1]))
+    return regions
+
+def runBatchGene(q, name, *args):
+    # one batch gene in its own process; the summary, or the error, always goes back on q so runBatch() never waits
+    # on a gene that died. the gene's stage metrics go back in the summary
+    profiling.profiler.reset()
+    try:
+        summary = runGene(*args)
+    except Exception as e:
+        logger.error('exception in gene ' + name + ': ' + str(e))
+        summary = {'chromosome': str(args[2]), 'error': str(e)}
+    summary['stages'] = profiling.profiler.metrics()['stages']
+    q.put((name, summary))
 
 def intersectPathology(pathologyFile, data_set, ipvDF, intersectFile):
     logger.info('reading data from ' + pathologyFile)
@@ -366,7 +685,14 @@ def intersectPathology(pathologyFile, data_set, ipvDF, intersectFile):
         f.write(json_dump)
     f.close()
 
-def findIndividualsPerVariant(variantsPerIndividual, vcf, chromosome, df, hgVersion, ensemblRelease, cohortSize, gnomadFileName):
+def findIndividualsPerVariant(variantsPerIndividual, vcf, chromosome, df, hgVersion, ensemblRelease, cohortSize, gnomad):
+    if isinstance(variantsPerIndividual, carrierMatrix.VariantsPerIndividual):
+        # transposing the carrier matrix gives the same entries without walking every call
+        individualsPerVariant = variantsPerIndividual.matrix.individualsPerVariant()
+        if not gnomad is None:
+            individualsPerVariant = addVariantInfo(individualsPerVariant, vcf, chromosome, ['FIBC_I', 'FIBC_P'], df,
+                                                   hgVersion, cohortSize, ensemblRelease, gnomad)
+        return individualsPerVariant
     individualsPerVariant = dict()
     for individual in variantsPerIndividual:
         for b in variantsPerIndividual[individual]['benign']:
@@ -402,15 +728,15 @@ def findIndividualsPerVariant(variantsPerIndividual, vcf, chromosome, df, hgVers
                 individualsPerVariant[v]['homozygous individuals'].add(individual)
             else:
                 logger.warning('hmm - didnt add this vus ' + v)
-    if not gnomadFileName is None and gnomadFileName != "":
+    if not gnomad is None:
         individualsPerVariant = addVariantInfo(individualsPerVariant, vcf, chromosome, ['FIBC_I', 'FIBC_P'], df,
-                                           hgVersion, cohortSize, ensemblRelease, gnomadFileName)
+                                           hgVersion, cohortSize, ensemblRelease, gnomad)
 
     return individualsPerVariant
 
 
 def isExonic(ensemblRelease, chrom, pos):
-    ensembl = pyensembl.EnsemblRelease(release=ensemblRelease)
+    ensembl = getEnsemblRelease(ensemblRelease)
     try:
         exons = ensembl.exons_at_locus(contig=int(chrom), position=int(pos))
     except Exception as e:
@@ -418,16 +744,12 @@ def isExonic(ensemblRelease, chrom, pos):
         return None
     return len(exons) > 0
 
-def addVariantInfo(individualsPerVariant, vcf, chromosome, infoList, df, hgVersion, cohortSize, ensemblRelease, gnomadFileName):
+def addVariantInfo(individualsPerVariant, vcf, chromosome, infoList, df, hgVersion, cohortSize, ensemblRelease, gnomad):
     # add infoList stuff from INFO field
     # do getAFFromGnomadSites inline
-    if gnomadFileName is None or gnomadFileName == "":
+    if gnomad is None:
         return individualsPerVariant
-    gnomad = pandas.read_csv(gnomadFileName, header=None, sep='\t', comment='#')
-    # CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
-    columns = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
-    gnomad.columns = columns
-    for variant in range(len(vcf['calldata/GT'])):
+    for variant in range(len(vcf['variants/POS'])):
         c = str(vcf['variants/CHROM'][variant].replace('chr', ''))
         if c != str(chromosome):
             continue
@@ -440,36 +762,15 @@ def addVariantInfo(individualsPerVariant, vcf, chromosome, infoList, df, hgVersi
             individualsPerVariant[v][info] = vcf['variants/' + info][variant]'''
         #maxPop, maxFreq, minPop, minFreq, allPopFreq = getGnomadData(df, eval(v), hgVersion)
         if v in individualsPerVariant:
-            individualsPerVariant[v]['cohortFreq'] = float(len(individualsPerVariant[v]['homozygous individuals']) + \
-                                                           len(individualsPerVariant[v][
-                                                                   'heterozygous individuals'])) / float(cohortSize)
-            chrom = 'chr' + str(c)
-            info = gnomad[gnomad['#CHROM'] == chrom][gnomad['POS'] == p][gnomad['REF'] == r][gnomad["ALT"] == a]['INFO']
-
-            #maxPop, maxFreq, allPopFreq = getAFFromGnomadSites(gnomadFileName, eval(v))
-            popmax = np.nan
-            faf95 = np.nan
-            af = np.nan
-            if len(info) == 1:
-                infoArray = info.iloc[0].split(';')
-                varValDict = dict()
-                for varVal in infoArray:
-                    varValArray = varVal.split('=')
-                    if len(varValArray) == 1:
-                        continue
-                    _var = varVal.split('=')[0]
-                    _val = varVal.split('=')[1]
-                    varValDict[_var] = _val
-                if 'popmax' in varValDict:
-                    popmax = varValDict['popmax']
-                if 'faf95_popmax' in varValDict:
-                    faf95 = varValDict['faf95_popmax']
-                if 'AF' in varValDict:
-                    af = varValDict['AF']
-            individualsPerVariant[v]['maxPop'] = popmax
-            individualsPerVariant[v]['maxFreq'] = af
-            individualsPerVariant[v]['faf95'] = faf95
-            individualsPerVariant[v]['exonic'] = isExonic(ensemblRelease, c, p)
+            entry = individualsPerVariant[v]
+            cohortFreq = float(len(entry['homozygous individuals']) + len(entry['heterozygous individuals'])) / \
+                         float(cohortSize)
+            #maxPop, maxFreq, allPopFreq = getAFFromGnomadSites(gnomad, eval(v))
+            popmax, faf95, af = gnomad.getAF((c, p, r, a), missing=np.nan) or (np.nan, np.nan, np.nan)
+            # through annotate(), since the entries of a carrier matrix view are built on each lookup
+            carrierMatrix.annotate(individualsPerVariant, v, {'cohortFreq': cohortFreq, 'maxPop': popmax,
+                                                              'maxFreq': af, 'faf95': faf95,
+                                                              'exonic': isExonic(ensemblRelease, c, p)})
         else:
             logger.warning('variant ' + str(v) + ' not in ipv dict?')
     return individualsPerVariant
@@ -491,118 +792,48 @@ def getAllVariantsPerClass(vpi):
     return allVariants
 
 def findVariants(fileName, classStrings, hgVersion):
+    # the TSV is parsed a column at a time: the Genomic_Coordinate_hgXX strings (chr13:g.32972575:G>T) are split
+    # into chrom, pos, ref and alt with one regex, and the significance column is matched against classStrings
+    # with isin(). the returned df is indexed by (CHROM, POS, REF, ALT) and sorted, so a variant's rows are a
+    # keyed df.loc[variant] lookup; rows of the same variant keep their file order.
     df = pandas.read_csv(fileName, sep='\t', header=0, dtype=str)
-    # Genomic_Coordinate_hg37
-    # chr13:g.32972575:G>T
-    pathVars = set()
-    benignVars = set()
-    vusVars = set()
-    for i in range(len(df)):
-        # TODO use HGVS? problem is indel representation
-        # TODO VCF has standard of using left-most pos where HGVS has standard of using right-most pos for indel
-        # if cDNA (3' side or 5'?) => standard is using 5' strand
-        logger.debug(df.loc[i, coordinateColumnBase + str(hgVersion)])
-        coord = df.loc[i, coordinateColumnBase + str(hgVersion)].split(':')
-        if 'chr' in coord[0]:
-            chrom = str(coord[0].split('chr')[1])
-        else:
-            chrom = str(coord[0])
-        if 'g.' in coord[1]:
-            pos = int(coord[1].split('g.')[1])
-        else:
-            pos = int(coord[1])
-        ref, alt = coord[2].split('>')
-        var = (chrom, pos, ref, alt)
-        if str(df.loc[i, sigColName]) in classStrings['Pathogenic']:
-            pathVars.add(var)
-        elif str(df.loc[i, sigColName]) in classStrings['Benign']:
-            benignVars.add(var)
-        elif str(df.loc[i, sigColName]) in classStrings['Unknown']:
-            vusVars.add(var)
-        else:
-            continue
+    variants = variantAnnotations.parseCoordinates(df[coordinateColumnBase + str(hgVersion)])
+    parsed = variants['POS'].notna()
+    if not parsed.all():
+        logger.warning('skipping ' + str(int((~parsed).sum())) + ' rows without a parseable ' +
+                       coordinateColumnBase + str(hgVersion))
+        df = df[parsed.values]
+        variants = variants[parsed.values]
+    df.index = pandas.MultiIndex.from_frame(variants)
+    df = df.sort_index(kind='stable')
+
+    significance = df[sigColName].astype(str).values
+    keys = list(df.index)
+    classSets = list()
+    for c in ['Pathogenic', 'Benign', 'Unknown']:
+        inClass = np.isin(significance, classStrings[c])
+        classSets.append(set(itertools.compress(keys, inClass)))
+    pathVars, benignVars, vusVars = classSets
 
     return df, pathVars, benignVars, vusVars
 
-def getAFFromGnomadSites(fileName, vus):
-    if not str(vus[0]).startswith("chr"):
-        _chrom="chr" + str(vus[0])
-    else:
-        _chrom=vus[0]
-    _pos = vus[1]
-    _ref = str(vus[2])
-    _alt = str(vus[3])
-    gnomad = pandas.read_csv(fileName, header=None, sep='\t', comment='#')
-    # CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
-    columns = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
-    gnomad.columns = columns
-    info = gnomad[gnomad['#CHROM'] == _chrom][gnomad['POS'] == _pos][gnomad['REF'] == _ref][gnomad["ALT"] == _alt]['INFO']
-    '''chromQuery = '#CHROM == ' + "\"" + _chrom + "\""
-    posQuery = 'POS == ' + _pos
-    refQuery = 'REF == ' + "\"" + _ref + "\""
-    altQuery = 'ALT == ' + "\"" + _alt + "\""
-    query = "\'" + chromQuery + "\'  and  \'" + posQuery + "\'  and  \'" + refQuery + "\'  and  \'" + altQuery + "\'"
-    logger.info(query)
-    info = gnomad.query(query)['INFO']'''
-
-    if len(info) == 1:
-        infoArray = info.iloc[0].split(';')
-        varValDict = dict()
-        for varVal in infoArray:
-            varValArray = varVal.split('=')
-            if len(varValArray) == 1:
-                continue
-            _var = varVal.split('=')[0]
-            _val = varVal.split('=')[1]
-            varValDict[_var] = _val
-        popmax = None
-        faf95 = None
-        af = None
-        if 'popmax' in varValDict:
-            popmax = varValDict['popmax']
-        if 'faf95_popmax' in varValDict:
-            faf95 = varValDict['faf95_popmax']
-        if 'AF' in varValDict:
-            af = varValDict['AF']
-    else:
-        logger.error('malformed VCF file has more than one record for same (chr, pos, ref, alt) tuple')
+def getAFFromGnomadSites(gnomad, vus):
+    # gnomad is the run's gnomadSites.GnomadSites store, keyed by (chrom, pos, ref, alt); this is a dict lookup
+    af = gnomad.getAF(vus)
+    if af is None:
+        logger.error('gnomad sites file does not have exactly one record for ' + str(tuple(vus)))
         return None, None, None
-    return (popmax, faf95, af)
+    return af
 
 
 def getGnomadData(df, vus, hgVersion):
-    # TODO write a unit test
-    # 13:g.32393468:C>CT
-    #hgString = 'chr' + str(vus[0][0]) + ':g.' + str(vus[0][1]) + ':' + str(vus[0][2]) + '>' + str(vus[0][3])
-    hgString = 'chr' + str(vus[0]) + ':g.' + str(vus[1]) + ':' + str(vus[2]) + '>' + str(vus[3])
-
-    # first, get list of columns for GnomAD allleles
-    gnomad = [v for v in list(df.columns) if 'GnomAD' in v]
-    alleleFrequencies = [v for v in gnomad if 'Allele_frequency' in v]
-
-    # second, get frequencies across exomes and genomes to determine max
-    # return population, frequency, count, and number
-    # replace "frequency" with "count" and "number" in Allele_frequency_genome_AFR_GnomAD
-
-    maxFrequency = 0.0
-    maxPopulation = None
-    allPopFreq = dict()
-    for af in alleleFrequencies:
-        freq=0.0
-        alleleFreqList = df[df[coordinateColumnBase + str(hgVersion)] == hgString][af].tolist()
-        if alleleFreqList:
-            try:
-                freq = float(alleleFreqList[0])
-            except ValueError:
-                continue
-            if freq > maxFrequency:
-                maxFrequency = freq
-                maxPopulation = af
-            allPopFreq[af] = freq
+    # max population and frequency, and every population frequency, of the vus from the GnomAD columns of the
+    # pathogenicity file; the columns are parsed into a per-variant table once per file (see variantAnnotations.py)
+    annotations = variantAnnotations.getVariantAnnotations(df, hgVersion)
+    maxData = annotations.getMax(vus)
+    return (maxData['population'], maxData['frequency'], annotations.getFrequencies(vus))
 
-    return (maxPopulation, maxFrequency, allPopFreq)
-
-def countHomozygousPerBenign(variantsPerIndividual, df, hgVersion, ensemblRelease, geneOfInterest, gnomadFileName):
+def countHomozygousPerBenign(variantsPerIndividual, df, hgVersion, ensemblRelease, geneOfInterest, gnomad):
     homozygousPerBenign = dict()
 
     for individual in variantsPerIndividual:
@@ -612,8 +843,8 @@ def countHomozygousPerBenign(variantsPerIndividual, df, hgVersion, ensemblReleas
                     homozygousPerBenign[str(ben[0])] = dict()
                     homozygousPerBenign[str(ben[0])]['count'] = 0
                     #maxPop, maxPopFreq, minPop, minPopFreq, allPopFreq = getGnomadData(df, ben[0], hgVersion)
-                    if not gnomadFileName is None and gnomadFileName != '':
-                        maxPop, maxPopFreq, allPopFreq = getAFFromGnomadSites(gnomadFileName, ben[0])
+                    if not gnomad is None:
+                        maxPop, maxPopFreq, allPopFreq = getAFFromGnomadSites(gnomad, ben[0])
                         homozygousPerBenign[str(ben[0])]['maxPop'] = maxPop
                         homozygousPerBenign[str(ben[0])]['maxPopFreq'] = maxPopFreq
                 homozygousPerBenign[str(ben[0])]['count'] += 1
@@ -627,26 +858,41 @@ def countHomozygousPerBenign(variantsPerIndividual, df, hgVersion, ensemblReleas
     return homozygousPerBenign
 
 
-def countHomozygousPerVus(variantsPerIndividual, df, hgVersion, ensemblRelease, geneOfInterest, gnomadFileName):
+def countHomozygousPerVus(variantsPerIndividual, df, hgVersion, ensemblRelease, geneOfInterest, gnomad):
     homozygousPerVus = dict()
 
-    for individual in variantsPerIndividual:
-        for vus in variantsPerIndividual[individual]['vus']:
-            if (vus[1] == '3') and (getGenesForVariant(vus[0], ensemblRelease, geneOfInterest)):
-                if str(vus[0]) not in homozygousPerVus:
-                    homozygousPerVus[str(vus[0])] = dict()
-                    homozygousPerVus[str(vus[0])]['count'] = 0
-                    #maxPop, maxPopFreq, minPop, minPopFreq, allPopFreq = getGnomadData(df, vus[0], hgVersion)
-                    if not gnomadFileName is None and gnomadFileName != '':
-                        maxPop, maxPopFreq, allPopFreq = getAFFromGnomadSites(gnomadFileName, vus[0])
-                        homozygousPerVus[str(vus[0])]['maxPop'] = maxPop
-                        homozygousPerVus[str(vus[0])]['maxPopFreq'] = maxPopFreq
-                homozygousPerVus[str(vus[0])]['count'] += 1
+    if isinstance(variantsPerIndividual, carrierMatrix.VariantsPerIndividual):
+        # homozygous calls per vus column of the carrier matrix; its variants already passed getGenesForVariant()
+        m = variantsPerIndividual.matrix
+        mask = (m.csr.data == carrierMatrix.homozygousCode) & \
+               (m.classes[m.csr.indices] == carrierMatrix.variantClasses.index('vus'))
+        homozygousCounts = np.bincount(m.csr.indices[mask], minlength=m.shape[1])
+        for variant in m.firstCarriers(mask):
+            vus = m.variants[variant]
+            homozygousPerVus[str(vus)] = dict()
+            homozygousPerVus[str(vus)]['count'] = int(homozygousCounts[variant])
+            if not gnomad is None:
+                maxPop, maxPopFreq, allPopFreq = getAFFromGnomadSites(gnomad, vus)
+                homozygousPerVus[str(vus)]['maxPop'] = maxPop
+                homozygousPerVus[str(vus)]['maxPopFreq'] = maxPopFreq
+    else:
+        for individual in variantsPerIndividual:
+            for vus in variantsPerIndividual[individual]['vus']:
+                if (vus[1] == '3') and (getGenesForVariant(vus[0], ensemblRelease, geneOfInterest)):
+                    if str(vus[0]) not in homozygousPerVus:
+                        homozygousPerVus[str(vus[0])] = dict()
+                        homozygousPerVus[str(vus[0])]['count'] = 0
+                        #maxPop, maxPopFreq, minPop, minPopFreq, allPopFreq = getGnomadData(df, vus[0], hgVersion)
+                        if not gnomad is None:
+                            maxPop, maxPopFreq, allPopFreq = getAFFromGnomadSites(gnomad, vus[0])
+                            homozygousPerVus[str(vus[0])]['maxPop'] = maxPop
+                            homozygousPerVus[str(vus[0])]['maxPopFreq'] = maxPopFreq
+                    homozygousPerVus[str(vus[0])]['count'] += 1
 
     cohortSize = len(variantsPerIndividual)
     for vus in homozygousPerVus:
         #maxPopFreq = homoZygousPerVus[vus][1][1]
-        if not gnomadFileName is None and gnomadFileName != '':
+        if not gnomad is None:
             maxPopFreq = homozygousPerVus[vus]['maxPopFreq']
         cohortFreq = float(homozygousPerVus[vus]['count'])/ float(cohortSize)
         homozygousPerVus[vus]['cohortFreq'] = float(cohortFreq)
@@ -654,7 +900,7 @@ def countHomozygousPerVus(variantsPerIndividual, df, hgVersion, ensemblRelease,
 
     return homozygousPerVus
 
-def calculateLikelihood(pathCoocs, p1, p2, n, k, df, hgVersion, cohortSize, gnomadFileName):
+def calculateLikelihood(pathCoocs, p1, p2, n, k, df, hgVersion, cohortSize, gnomad):
 
     # vus coocs data: {(vus1, vus2):[individuals]}
     # "([10, 89624243, 'A', 'G'], [10, 89624304, 'C', 'T')]": ["0000057940", "0000057950"],
@@ -694,8 +940,8 @@ def calculateLikelihood(pathCoocs, p1, p2, n, k, df, hgVersion, cohortSize, gnom
     dataPerVus = dict()
     for vus in likelihoodRatios:
         #maxPop, maxPopFreq, minPop, minPopFreq, allPopFreq = getGnomadData(df, vus, hgVersion)
-        if not gnomadFileName is None and gnomadFileName != '':
-            maxPop, maxPopFreq, allPopFreq = getAFFromGnomadSites(gnomadFileName, vus)
+        if not gnomad is None:
+            maxPop, maxPopFreq, allPopFreq = getAFFromGnomadSites(gnomad, vus)
         else:
             maxPop = maxPopFreq = np.nan
         cohortFreq = float(n[vus]) / float(cohortSize)
@@ -708,29 +954,77 @@ def calculateLikelihood(pathCoocs, p1, p2, n, k, df, hgVersion, cohortSize, gnom
 
     return dataPerVus
 
-def readVCFFile(vcfFileName):
-    return allel.read_vcf(vcfFileName, fields=['samples', 'calldata/GT', 'variants/ALT', 'variants/CHROM',
-                                               'variants/FILTER_PASS', 'variants/ID', 'variants/POS', 'variants/QUAL',
-                                               'variants/REF', 'variants/INFO'])
-
-def divide(n, d):
-   res = list()
-   qu = int(n/d)
-   rm = n%d
-   for i in range(d):
-       if i < rm:
-           res.append(qu + 1)
-       else:
-           res.append(qu)
-   return res
-
-def getStartAndEnd(partitionSizes, threadID):
-    start = 0
-    for i in range(threadID):
-        start += partitionSizes[i]
-    end = start + partitionSizes[threadID]
-
-    return start, end
+def readVCFFile(vcfFileName, region=None):
+    vcf = allel.read_vcf(vcfFileName, fields=vcfFields, region=region)
+    if vcf is None:
+        logger.info('no variants in ' + vcfFileName + ' region ' + str(region))
+        vcf = genotypeCache.emptyVCF(vcfFileName)
+    return vcf
+
+def parseVCF(vcfFileName, vcfRegion, cacheDir=None):
+    with profiling.stage('readVCFFile()') as record:
+        if cacheDir is not None:
+            # memory-mapped arrays from an earlier parse of the same VCF and region, built on first use
+            vcf = genotypeCache.getCachedVCF(cacheDir, vcfFileName, vcfRegion)
+        else:
+            logger.info('reading VCF file ' + vcfFileName + ' region ' + str(vcfRegion))
+            vcf = readVCFFile(vcfFileName, vcfRegion)
+        record.count(variants=vcf['calldata/GT'].shape[0], samples=vcf['calldata/GT'].shape[1])
+    return vcf
+
+def getVariantColumns(vcf):
+    # the variants/* arrays of a vcf dict, read into memory
+    return {field: np.array(vcf[field]) for field in vcf if field.startswith('variants/')}
+
+def classifyVCF(vcf, benignVariants, pathogenicVariants, chromosome, gene, ensemblRelease, annoDF, numProcs,
+                engine='vectorized', splitMode='auto'):
+    logger.info('finding variants per individual with ' + engine + ' engine')
+    with profiling.stage('findVariantsPerIndividual()') as record:
+        variantsPerIndividual = findVarsPerIndividualWithEngine(vcf, benignVariants, pathogenicVariants, chromosome,
+                                                                gene, ensemblRelease, annoDF, numProcs, engine,
+                                                                splitMode)
+        record.count(samples=len(variantsPerIndividual), variants=len(vcf['variants/POS']), processes=numProcs)
+    return variantsPerIndividual
+
+def findVarsPerIndividualWithEngine(vcf, benignVariants, pathogenicVariants, chromosome, gene, ensemblRelease, annoDF,
+                                    numProcs, engine, splitMode):
+    # every engine gives the same calls; a record repeated in the VCF gives a sample one call, with the first
+    # record's code (a carrier matrix holds one call per sample and variant)
+    if engine == 'loop':
+        q = Queue()
+        processList = list()
+        for i in range(numProcs):
+            p = Process(target=findVarsPerIndividual, args=(q, vcf, benignVariants, pathogenicVariants,
+                                                            chromosome, gene, ensemblRelease, annoDF, i,
+                                                            numProcs, ))
+            p.start()
+            processList.append(p)
+        logger.info('joining results from forked threads')
+        variantsPerIndividual = dict()
+        for i in range(numProcs):
+            variantsPerIndividual.update(q.get())
+        for i in range(numProcs):
+            processList[i].join()
+    elif engine == 'vectorized':
+        variantsPerIndividual = findVarsPerIndividualShared(vcf, benignVariants, pathogenicVariants, chromosome,
+                                                            gene, ensemblRelease, annoDF, numProcs, splitMode)
+    else:
+        raise ValueError('unknown genotype engine: ' + str(engine))
+    return variantsPerIndividual
+
+def getVCFRegion(vcfFileName, chromosome, geneRegion):
+    # allel region string for the gene, using the contig naming of the VCF ('chr13' or '13')
+    if geneRegion is None:
+        return None
+    contig = str(chromosome).replace('chr', '')
+    with gnomadSites.openVCF(vcfFileName) as f:
+        for line in f:
+            if not line.startswith('#'):
+                if line.startswith('chr'):
+                    contig = 'chr' + contig
+                break
+    f.close()
+    return contig + ':' + str(geneRegion[0]) + '-' + str(geneRegion[1])
 
 def findVarsPerIndividual(q, vcf, benignVariants, pathogenicVariants, chromosome, gene, ensemblRelease, annoDF,
                           threadID, numProcesses):
@@ -753,6 +1047,8 @@ def findVarsPerIndividual(q, vcf, benignVariants, pathogenicVariants, chromosome
         variantsPerIndividual[individuals[i]]['benign'] = list()
         variantsPerIndividual[individuals[i]]['pathogenic'] = list()
         variantsPerIndividual[individuals[i]]['vus'] = list()
+        # a record repeated in the VCF gives the individual one call, with the first record's genotype
+        seen = set()
 
         for variant in range(len(vcf['calldata/GT'])):
             if str(vcf['variants/CHROM'][variant].replace('chr', '')) != str(chromosome):
@@ -774,21 +1070,10 @@ def findVarsPerIndividual(q, vcf, benignVariants, pathogenicVariants, chromosome
                     genotype = str(int(str(int(calls[0]>0)) + str(int(calls[1]>0)), 2))
                 except:
                 	logger.warning('Genotype error {} c{} p{} r{} a{} i{}'.format(vcf['calldata/GT'][variant][i],c,p,r,a,i))
-                seqCenter = "NA"
-                study = "NA"
-                if not annoDF is None:
-                    try:
-                        if 'CENTER' in annoDF.columns:
-                            seqCenter = annoDF[annoDF['sample.id'] == individuals[i]]['CENTER'].iloc[0]
-                        elif 'seq_center' in annoDF.columns:
-                            seqCenter = annoDF[annoDF['sample.id'] == individuals[i]]['seq_center'].iloc[0]
-                    except Exception as e:
-                        seqCenter = "NA"
-                    try:
-                        if 'study' in annoDF.columns:
-                            study = annoDF[annoDF['sample.id'] == individuals[i]]['study'].iloc[0]
-                    except Exception as e:
-                        study = "NA"
+                if (c, p, r, a) in seen:
+                    continue
+                seen.add((c, p, r, a))
+                seqCenter, study = getSeqCenterAndStudy(annoDF, individuals[i])
                 if (c, p, r, a) in benignVariants:
                     variantsPerIndividual[individuals[i]]['benign'].append(((c, p, r, a), genotype, seqCenter, study))
                 elif (c, p, r, a) in pathogenicVariants:
@@ -799,49 +1084,388 @@ def findVarsPerIndividual(q, vcf, benignVariants, pathogenicVariants, chromosome
 
     q.put(variantsPerIndividual)
 
-def getGenesForVariant(variant, ensemblRelease, geneOfInterest):
-    ensembl = pyensembl.EnsemblRelease(release=ensemblRelease)
-    chrom = variant[0]
-    if type(chrom) is str and 'chr' in chrom:
-        chrom = chrom.split('chr')[1]
-    pos = variant[1]
+def classifyGenotypes(gt):
+    # gt is the (variants x samples x ploidy) calldata/GT array from scikit-allel
+    # a call is a carrier call if it has the ALT allele 1 on either haplotype (same test as '1 in calls' in the loop)
+    # genotype code is the 2-bit number (first haplotype, second haplotype): 1 = 0|1, 2 = 1|0, 3 = 1|1
+    # returns parallel arrays of variant index, sample index and genotype code, ordered by sample then variant
+    gt = np.asarray(gt)
+    carriers = (gt == 1).any(axis=2)
+    sampleIndices, variantIndices = np.nonzero(carriers.T)
+    calls = gt[variantIndices, sampleIndices]
+    genotypeCodes = 2 * (calls[:, 0] > 0).astype(np.int8) + (calls[:, 1] > 0).astype(np.int8)
+    return variantIndices, sampleIndices, genotypeCodes
+
+def getSeqCenterAndStudy(annoDF, individual):
+    if annoDF is None:
+        return "NA", "NA"
+    return getSampleAnnotations(annoDF).get(individual)
+
+# sample annotation index per annotation frame, built on first use (see sampleAnnotations.py). the frame is kept
+# with its index so its id() cannot be reused while the entry exists.
+sampleAnnotationsPerFrame = dict()
+
+def getSampleAnnotations(annoDF):
+    if id(annoDF) not in sampleAnnotationsPerFrame:
+        logger.info('indexing sample annotations')
+        sampleAnnotationsPerFrame[id(annoDF)] = (annoDF, sampleAnnotations.SampleAnnotations.fromDataFrame(annoDF))
+    return sampleAnnotationsPerFrame[id(annoDF)][1]
+
+def shareGenotypes(gt):
+    # returns the name of an .npy file holding calldata/GT that worker processes can memory-map, and the scratch
+    # directory to remove afterwards (None when gt is already memory-mapped from the genotype cache)
+    if isinstance(gt, np.memmap) and gt.filename is not None:
+        return gt.filename, None
+    tmpDir = tempfile.mkdtemp(prefix='cooccurrence-')
+    gtFileName = os.path.join(tmpDir, 'GT.npy')
+    np.save(gtFileName, gt)
+    return gtFileName, tmpDir
+
+def findCallsPerPartition(q, gtFileName, threadID, tile):
+    # worker: zero-copy view of its (samples x variants) tile of calldata/GT, and only the carrier calls sent back
+    sampleStart, sampleEnd, variantStart, variantEnd = tile
+    gt = np.load(gtFileName, mmap_mode='r')
+    logger.info('threadID = ' + str(threadID) + ' processing samples ' + str(sampleStart) + ' to ' + str(sampleEnd) +
+                ', variants ' + str(variantStart) + ' to ' + str(variantEnd))
+    variantIndices, sampleIndices, genotypeCodes = classifyGenotypes(gt[variantStart:variantEnd, sampleStart:sampleEnd])
+    q.put((threadID, (sampleIndices + sampleStart).astype(np.int32), (variantIndices + variantStart).astype(np.int32),
+           genotypeCodes))
+
+def findVarsPerIndividualShared(vcf, benignVariants, pathogenicVariants, chromosome, gene, ensemblRelease, annoDF,
+                                numProcesses, splitMode='auto'):
+    # the vectorized engine: the same contract as findVarsPerIndividual() over every sample, with the carrier calls
+    # found with array operations on calldata/GT instead of one (variant, sample) cell at a time. the workers get a
+    # file name instead of a pickled copy of the vcf dict and return compact call arrays, so the fan-out cost does
+    # not grow with the number of processes.
+    # the work is split by sample blocks, variant blocks or 2-D tiles (see partition.planTiles()).
+    # classification, annotation and the carrier matrix are done once, in this process. returns the variants per
+    # individual as a view over the matrix (see carrierMatrix.py).
+    individuals = list(vcf['samples'])
+    gtFileName, tmpDir = shareGenotypes(vcf['calldata/GT'])
+    numVariants, numSamples = vcf['calldata/GT'].shape[0], vcf['calldata/GT'].shape[1]
+    tiles = partition.planTiles(numSamples, numVariants, numProcesses, splitMode)
+    logger.info('splitting ' + str(numSamples) + ' samples x ' + str(numVariants) + ' variants into ' +
+                str(len(tiles)) + ' tiles')
+    callsPerThread = dict()
     try:
-        #exons = ensembl.exons_at_locus(contig=int(chrom), position=int(pos))
-        genes = ensembl.gene_names_at_locus(contig=chrom, position=int(pos))
-        g_of_i = set()
-        g_of_i.add(geneOfInterest)
-        g = set(genes)
-        intersectingGenes = g_of_i.intersection(g)
-        if len(intersectingGenes) != 1:
-            return None
+        q = Queue()
+        processList = list()
+        for i in range(len(tiles)):
+            p = Process(target=findCallsPerPartition, args=(q, gtFileName, i, tiles[i], ))
+            p.start()
+            processList.append(p)
+        logger.info('joining results from forked threads')
+        for i in range(len(tiles)):
+            threadID, sampleIndices, variantIndices, genotypeCodes = q.get()
+            callsPerThread[threadID] = (variantIndices, sampleIndices, genotypeCodes)
+        for i in range(len(tiles)):
+            processList[i].join()
+    finally:
+        if tmpDir is not None:
+            shutil.rmtree(tmpDir)
+
+    # tiles from different variant blocks interleave, so put the calls back in sample, then variant order
+    variantIndices = np.concatenate([callsPerThread[i][0] for i in range(len(tiles))])
+    sampleIndices = np.concatenate([callsPerThread[i][1] for i in range(len(tiles))])
+    genotypeCodes = np.concatenate([callsPerThread[i][2] for i in range(len(tiles))])
+    order = np.lexsort((variantIndices, sampleIndices))
+    variantIndices, sampleIndices, genotypeCodes = variantIndices[order], sampleIndices[order], genotypeCodes[order]
+
+    variantInfo = resolveVariants(vcf, np.unique(variantIndices), benignVariants, pathogenicVariants, chromosome,
+                                  gene, ensemblRelease)
+
+    matrix = buildCarrierMatrix(individuals, variantInfo, variantIndices, sampleIndices, genotypeCodes, annoDF)
+    logger.info('carrier matrix has ' + str(matrix.csr.nnz) + ' calls for ' + str(matrix.shape[0]) + ' samples x ' +
+                str(matrix.shape[1]) + ' variants')
+    return matrix.variantsPerIndividual()
+
+def buildCarrierMatrix(individuals, variantInfo, variantIndices, sampleIndices, genotypeCodes, annoDF):
+    # keeps the calls on variants that resolveVariants() did not skip; the matrix columns are those variants in
+    # VCF order, so each individual's calls come out of the matrix in the same order as from the loop. records of
+    # the same (c, p, r, a) share a column, and a sample's call on it takes the code of the first record, as in
+    # the other engines
+    resolved = np.array(sorted(v for v in variantInfo if variantInfo[v] is not None), dtype=np.int64)
+    keep = np.isin(variantIndices, resolved)
+    order = np.argsort(variantIndices[keep], kind='stable')
+    variantIndices, sampleIndices, genotypeCodes = variantIndices[keep][order], sampleIndices[keep][order], \
+                                                   genotypeCodes[keep][order]
+    columnPerVariant = dict()
+    columns = np.empty(len(resolved), dtype=np.int64)
+    for r in range(len(resolved)):
+        columns[r] = columnPerVariant.setdefault(variantInfo[resolved[r]][0], len(columnPerVariant))
+    variants = list(columnPerVariant)
+    if annoDF is None:
+        seqCenters = studies = None
+    else:
+        seqCenters, studies = getSampleAnnotations(annoDF).join(individuals)
+    return carrierMatrix.CarrierMatrix(individuals, variants,
+                                       [carrierMatrix.variantClasses.index(variantInfo[resolved[r]][1])
+                                        for r in np.unique(columns, return_index=True)[1]],
+                                       sampleIndices, columns[np.searchsorted(resolved, variantIndices)],
+                                       genotypeCodes, seqCenters, studies)
+
+def resolveVariants(vcf, variantIndices, benignVariants, pathogenicVariants, chromosome, gene, ensemblRelease):
+    # resolve chromosome, gene and pathogenicity class once per variant rather than once per call
+    # returns {variant index: ((c, p, r, a), class)}, with None for variants that are skipped
+    variantInfo = dict()
+    for variant in variantIndices:
+        c = str(vcf['variants/CHROM'][variant].replace('chr', ''))
+        if c != str(chromosome):
+            logger.warning('wrong chromosome?')
+            variantInfo[variant] = None
+            continue
+        p = int(vcf['variants/POS'][variant])
+        r = str(vcf['variants/REF'][variant])
+        a = str(vcf['variants/ALT'][variant][0])
+        if getGenesForVariant([c, p, r, a], ensemblRelease, gene) is None:
+            logger.warning('no gene for variant? ' + str([c, p, r, a]))
+            variantInfo[variant] = None
+            continue
+        if (c, p, r, a) in benignVariants:
+            variantClass = 'benign'
+        elif (c, p, r, a) in pathogenicVariants:
+            variantClass = 'pathogenic'
+        # if not a known VUS, it is a VUS now
         else:
-            # this is pythonic way of returning member of singleton set
-            return (intersectingGenes,)
-    except Exception as e:
-        logger.error('exception: ' + str(e))
+            variantClass = 'vus'
+        variantInfo[variant] = ((c, p, r, a), variantClass)
+    return variantInfo
+
+def addCallsPerIndividual(variantsPerIndividual, individuals, variantInfo, variantIndices, sampleIndices,
+                          genotypeCodes, annoDF, annotations, seen):
+    # append the classified calls to each individual's benign/pathogenic/vus lists, in the order given
+    # annotations caches (seqCenter, study) per individual across calls. seen holds the (individual, variant) calls
+    # added so far, so a record repeated in the VCF adds no second call
+    for variant, sample, genotypeCode in zip(variantIndices, sampleIndices, genotypeCodes):
+        info = variantInfo[variant]
+        if info is None:
+            continue
+        individual = individuals[sample]
+        if (individual, info[0]) in seen:
+            continue
+        seen.add((individual, info[0]))
+        if individual not in annotations:
+            annotations[individual] = getSeqCenterAndStudy(annoDF, individual)
+        seqCenter, study = annotations[individual]
+        variantsPerIndividual[individual][info[1]].append((info[0], str(genotypeCode), seqCenter, study))
+
+def findVarsPerIndividualChunked(vcfFileName, region, chunkLength, benignVariants, pathogenicVariants, chromosome,
+                                 gene, ensemblRelease, annoDF):
+    # streams the VCF chunkLength variants at a time and classifies each chunk as it arrives, so only one chunk of
+    # calldata/GT is in memory at once. returns the variants per individual and the variant columns of the VCF
+    # (no calldata/GT), which is all that findIndividualsPerVariant() needs afterwards.
+    # samples come back separately from iter_vcf_chunks(), so they are not a chunk field
+    chunkFields = [field for field in vcfFields if field != 'samples']
+    fields, samples, headers, chunks = allel.iter_vcf_chunks(vcfFileName, fields=chunkFields, region=region,
+                                                             chunk_length=chunkLength)
+    individuals = list(samples)
+    variantsPerIndividual = dict()
+    for individual in individuals:
+        variantsPerIndividual[individual] = {'benign': list(), 'pathogenic': list(), 'vus': list()}
+
+    variantColumns = defaultdict(list)
+    annotations = dict()
+    seen = set()
+    numChunks = 0
+    for chunk, length, chrom, pos in chunks:
+        numChunks += 1
+        logger.debug('classifying chunk ' + str(numChunks) + ' of ' + str(length) + ' variants at ' +
+                     str(chrom) + ':' + str(pos))
+        variantIndices, sampleIndices, genotypeCodes = classifyGenotypes(chunk['calldata/GT'])
+        variantInfo = resolveVariants(chunk, np.unique(variantIndices), benignVariants, pathogenicVariants,
+                                      chromosome, gene, ensemblRelease)
+        addCallsPerIndividual(variantsPerIndividual, individuals, variantInfo, variantIndices, sampleIndices,
+                              genotypeCodes, annoDF, annotations, seen)
+        for field in chunk:
+            if field.startswith('variants/'):
+                variantColumns[field].append(chunk[field])
+
+    vcf = {'samples': samples}
+    if numChunks == 0:
+        # no records in the region: the empty variant columns of an empty callset
+        emptyVCF = genotypeCache.emptyVCF(vcfFileName)
+        for field in emptyVCF:
+            if field.startswith('variants/'):
+                variantColumns[field].append(emptyVCF[field])
+    for field in variantColumns:
+        vcf[field] = np.concatenate(variantColumns[field])
+    logger.info('classified ' + str(numChunks) + ' chunks from ' + vcfFileName)
+    return variantsPerIndividual, vcf
+
+class GeneIndex(object):
+    # sorted start/end arrays for the intervals of one gene on each contig, so "is (chrom, pos) in the gene of
+    # interest" is a binary search instead of a pyensembl query. plain numpy arrays, so it pickles to worker
+    # processes and saves to / loads from an .npz file.
+    def __init__(self, gene, contigs, starts, ends):
+        self.gene = gene
+        self.starts = dict()
+        self.ends = dict()
+        self.maxEnds = dict()
+        contigs = np.asarray(contigs, dtype=str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        for contig in np.unique(contigs):
+            order = np.argsort(starts[contigs == contig], kind='stable')
+            self.starts[str(contig)] = starts[contigs == contig][order]
+            self.ends[str(contig)] = ends[contigs == contig][order]
+            # running max of ends lets one lookup answer "any interval starting at or before pos that covers pos"
+            self.maxEnds[str(contig)] = np.maximum.accumulate(self.ends[str(contig)])
+
+    @staticmethod
+    def normalizeContig(chrom):
+        chrom = str(chrom)
+        if 'chr' in chrom:
+            chrom = chrom.split('chr')[1]
+        return chrom
+
+    @classmethod
+    def fromEnsembl(cls, ensemblRelease, gene):
+        contigs = list()
+        starts = list()
+        ends = list()
+        try:
+            for g in getEnsemblRelease(ensemblRelease).genes_by_name(gene):
+                contigs.append(cls.normalizeContig(g.contig))
+                starts.append(g.start)
+                ends.append(g.end)
+        except Exception as e:
+            logger.error('exception: ' + str(e))
+        return cls(gene, contigs, starts, ends)
+
+    @classmethod
+    def load(cls, fileName):
+        with np.load(fileName) as data:
+            return cls(str(data['gene']), data['contigs'], data['starts'], data['ends'])
+
+    def save(self, fileName):
+        contigs = list()
+        starts = list()
+        ends = list()
+        for contig in self.starts:
+            contigs.extend([contig] * len(self.starts[contig]))
+            starts.extend(self.starts[contig])
+            ends.extend(self.ends[contig])
+        with open(fileName, 'wb') as f:
+            np.savez(f, gene=self.gene, contigs=np.array(contigs, dtype=str), starts=np.array(starts, dtype=np.int64),
+                     ends=np.array(ends, dtype=np.int64))
+        f.close()
+
+    def region(self, chrom):
+        # (start, end) spanning every interval of the gene on chrom, or None if the gene is not on chrom
+        contig = self.normalizeContig(chrom)
+        if contig not in self.starts or len(self.starts[contig]) == 0:
+            return None
+        return int(self.starts[contig][0]), int(self.maxEnds[contig][-1])
+
+    def contains(self, chrom, pos):
+        contig = self.normalizeContig(chrom)
+        if contig not in self.starts:
+            return False
+        i = np.searchsorted(self.starts[contig], int(pos), side='right') - 1
+        return bool(i >= 0 and self.maxEnds[contig][i] >= int(pos))
+
+# one EnsemblRelease per release and one gene index per (ensembl release, gene), built once per run and
+# inherited by the forked worker processes
+ensemblReleases = dict()
+geneIndexes = dict()
+
+def getEnsemblRelease(ensemblRelease):
+    if ensemblRelease not in ensemblReleases:
+        ensemblReleases[ensemblRelease] = pyensembl.EnsemblRelease(release=ensemblRelease)
+    return ensemblReleases[ensemblRelease]
+
+def getGeneIndex(ensemblRelease, gene, geneIndexFileName=None):
+    if (ensemblRelease, gene) in geneIndexes:
+        return geneIndexes[(ensemblRelease, gene)]
+    if geneIndexFileName is not None and os.path.exists(geneIndexFileName):
+        logger.info('loading gene index from ' + geneIndexFileName)
+        geneIndex = GeneIndex.load(geneIndexFileName)
+    else:
+        logger.info('building gene index for ' + str(gene) + ' from ensembl release ' + str(ensemblRelease))
+        geneIndex = GeneIndex.fromEnsembl(ensemblRelease, gene)
+        if geneIndexFileName is not None:
+            logger.info('saving gene index to ' + geneIndexFileName)
+            geneIndex.save(geneIndexFileName)
+    geneIndexes[(ensemblRelease, gene)] = geneIndex
+    return geneIndex
+
+def getGenesForVariant(variant, ensemblRelease, geneOfInterest):
+    if getGeneIndex(ensemblRelease, geneOfInterest).contains(variant[0], variant[1]):
+        # same shape as before: singleton set of the gene of interest wrapped in a tuple
+        return ({geneOfInterest},)
+    else:
         return None
 
-def findIndividualsPerCooccurrence(variantsPerIndividual, ensemblRelease, phased, gene):
+def findIndividualsPerCooccurrence(variantsPerIndividual, ensemblRelease, phased, gene, withIndividuals=True):
+    # n counts the carriers of each vus; k the (vus, pathogenic) pairs an individual carries that pass
+    # sameGeneSameParent(). the gene of each variant is looked up once, and n and k come from sparse products
+    # over the carrier matrix (see CarrierMatrix.countCooccurrences()) instead of a product per individual.
+    # withIndividuals=False skips building the {(vus, path): [individuals]} mapping and returns an empty one.
+    matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(variantsPerIndividual)
+    geneIds = getGeneIds(matrix.variants, ensemblRelease, gene)
 
     individualsPerPathogenicCooccurrence = defaultdict(list)
     n = defaultdict(int)
     k = defaultdict(int)
 
-    for individual in variantsPerIndividual:
-        vusVarList = list(variantsPerIndividual[individual]['vus'])
-        pathVarList = list(variantsPerIndividual[individual]['pathogenic'])
-
-        for v in vusVarList:
-            n[tuple(v[0])] += 1
-
-        vusCrossPath = list(itertools.product(vusVarList, pathVarList))
-        for cross in vusCrossPath:
-            if sameGeneSameParent(cross[0], cross[1], phased, ensemblRelease, gene):
-                k[tuple(cross[0][0])] += 1
-                individualsPerPathogenicCooccurrence[(tuple(cross[0][0]), tuple(cross[1][0]))].append(individual)
+    if phased:
+        # phased pairs come from the haplotype bitsets, pair by pair over the whole cohort
+        vusCounts, pairCounts, pairs = findPhasedCooccurrences(matrix, geneIds)
+    else:
+        vusCounts, pairCounts = matrix.countCooccurrences(geneIds, phased)
+    vusMask = matrix.classes[matrix.csr.indices] == carrierMatrix.variantClasses.index('vus')
+    for variant in matrix.firstCarriers(vusMask):
+        n[matrix.variants[variant]] = int(vusCounts[variant])
+        if pairCounts[variant] > 0:
+            k[matrix.variants[variant]] = int(pairCounts[variant])
+
+    if withIndividuals and phased:
+        # keys in the order the pairs are first seen walking the individuals, as the pairwise loop added them
+        for vus, path, samples in sorted(pairs, key=lambda pair: (pair[2][0], pair[0], pair[1])):
+            individualsPerPathogenicCooccurrence[(matrix.variants[vus], matrix.variants[path])] = \
+                [matrix.samples[sample] for sample in samples]
+    elif withIndividuals:
+        for sample, vus, path in matrix.cooccurringPairs(geneIds, phased):
+            individualsPerPathogenicCooccurrence[(matrix.variants[vus], matrix.variants[path])].append(
+                matrix.samples[sample])
 
     return individualsPerPathogenicCooccurrence, n, k
 
+def findPhasedCooccurrences(matrix, geneIds):
+    # returns carriers per vus, phased (vus, pathogenic) pairs per vus, and (vus, pathogenic, sample indices) for
+    # every pair carried by at least one sample; only variants in the same gene are paired
+    bitsets = haplotypeBitsets.HaplotypeBitsets.fromCarrierMatrix(matrix)
+    logger.info('haplotype bitsets use ' + str(bitsets.nbytes) + ' bytes for ' + str(matrix.shape[0]) +
+                ' samples x ' + str(matrix.shape[1]) + ' variants')
+    vus = matrix.classes == carrierMatrix.variantClasses.index('vus')
+    pathogenic = matrix.classes == carrierMatrix.variantClasses.index('pathogenic')
+    vusCounts = np.zeros(matrix.shape[1], dtype=np.int64)
+    vusCounts[vus] = haplotypeBitsets.popcount(bitsets.carriers(np.nonzero(vus)[0]))
+    pairCounts = np.zeros(matrix.shape[1], dtype=np.int64)
+    pairs = list()
+    for geneId in np.unique(geneIds):
+        vusColumns = np.nonzero(vus & (geneIds == geneId))[0]
+        pathogenicColumns = np.nonzero(pathogenic & (geneIds == geneId))[0]
+        if len(vusColumns) == 0 or len(pathogenicColumns) == 0:
+            continue
+        counts = bitsets.cooccurrenceCounts(vusColumns, pathogenicColumns)
+        pairCounts[vusColumns] = counts.sum(axis=1)
+        for i, j in zip(*np.nonzero(counts)):
+            pairs.append((vusColumns[i], pathogenicColumns[j],
+                          bitsets.pairSamples(vusColumns[i], pathogenicColumns[j])))
+    return vusCounts, pairCounts, pairs
+
+def getGeneIds(variants, ensemblRelease, gene):
+    # one getGenesForVariant() call per variant; variants with equal results get the same id
+    genes = list()
+    geneIds = np.zeros(len(variants), dtype=np.int64)
+    for j in range(len(variants)):
+        genesForVariant = getGenesForVariant(variants[j], ensemblRelease, gene)
+        if genesForVariant not in genes:
+            genes.append(genesForVariant)
+        geneIds[j] = genes.index(genesForVariant)
+    return geneIds
+
 def sameGeneSameParent(vus, path, phased, ensemblRelease, gene):
 
     if not phased:
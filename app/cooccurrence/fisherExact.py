@@ -0,0 +1,157 @@
+import functools
+import sys
+import numpy as np
+from scipy.stats import hypergeom
+
+# relative tolerance R's fisher.test() counts tables as likely as the observed one with
+relativeError = 1 + 1e-7
+# R's uniroot() defaults
+rootTolerance = sys.float_info.epsilon ** 0.25
+maxIterations = 1000
+
+
+def uniroot(f, lower, upper, tol=rootTolerance, maxiter=maxIterations):
+    # Brent's zeroin the way R's uniroot() runs it (R_zeroin2 in R's src/library/stats/src/zeroin.c), so the roots
+    # fisher.test() reports to uniroot()'s tolerance come out the same here and not just within that tolerance
+    a, b = float(lower), float(upper)
+    fa, fb = f(a), f(b)
+    if fa == 0.0:
+        return a
+    if fb == 0.0:
+        return b
+    c, fc = a, fa
+    for i in range(maxiter + 1):
+        previousStep = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+        tolerance = 2 * sys.float_info.epsilon * abs(b) + tol / 2
+        newStep = (c - b) / 2
+        if abs(newStep) <= tolerance or fb == 0.0:
+            return b
+        # interpolation if the previous step was large enough and in the right direction
+        if abs(previousStep) >= tolerance and abs(fa) > abs(fb):
+            cb = c - b
+            if a == c:
+                # linear interpolation
+                t1 = fb / fa
+                p = cb * t1
+                q = 1.0 - t1
+            else:
+                # inverse quadratic interpolation
+                q = fa / fc
+                t1 = fb / fc
+                t2 = fb / fa
+                p = t2 * (cb * q * (q - t1) - (b - a) * (t1 - 1.0))
+                q = (q - 1.0) * (t1 - 1.0) * (t2 - 1.0)
+            if p > 0:
+                q = -q
+            else:
+                p = -p
+            if p < (0.75 * cb * q - abs(tolerance * q) / 2) and p < abs(previousStep * q / 2):
+                newStep = p / q
+        if abs(newStep) < tolerance:
+            newStep = tolerance if newStep > 0 else -tolerance
+        a, fa = b, fb
+        b += newStep
+        fb = f(b)
+        if (fb > 0 and fc > 0) or (fb < 0 and fc < 0):
+            c, fc = a, fa
+    raise RuntimeError('no root found in ' + str(maxiter) + ' iterations')
+
+
+class NoncentralHypergeometric(object):
+    # the distribution of a (the top left count of a 2x2 table [[a, b], [c, d]]) given its margins, under odds ratio
+    # ncp (Fisher's noncentral hypergeometric distribution), the way R's fisher.test() computes it
+    def __init__(self, a, b, c, d):
+        self.x = a
+        m = a + c
+        n = b + d
+        k = a + b
+        self.lo = max(0, k - n)
+        self.hi = min(k, m)
+        self.support = np.arange(self.lo, self.hi + 1)
+        self.logdc = hypergeom.logpmf(self.support, m + n, m, k)
+
+    def density(self, ncp):
+        d = self.logdc + np.log(ncp) * self.support
+        d = np.exp(d - d.max())
+        return d / d.sum()
+
+    def mean(self, ncp):
+        if ncp == 0:
+            return self.lo
+        if ncp == np.inf:
+            return self.hi
+        return float(np.dot(self.support, self.density(ncp)))
+
+    def cdf(self, q, ncp, upperTail=False):
+        # P(X <= q), or P(X >= q) for the upper tail
+        if ncp == 0:
+            return float(q <= self.lo if upperTail else q >= self.lo)
+        if ncp == np.inf:
+            return float(q <= self.hi if upperTail else q >= self.hi)
+        d = self.density(ncp)
+        return float(d[self.support >= q].sum() if upperTail else d[self.support <= q].sum())
+
+    def pValue(self):
+        # two-sided: the probability of every table at most as likely as the observed one, under odds ratio 1
+        d = self.density(1.0)
+        return min(1.0, float(d[d <= d[self.x - self.lo] * relativeError].sum()))
+
+    def estimate(self):
+        # conditional maximum likelihood estimate of the odds ratio
+        if self.x == self.lo:
+            return 0.0
+        if self.x == self.hi:
+            return np.inf
+        mu = self.mean(1.0)
+        if mu > self.x:
+            return uniroot(lambda t: self.mean(t) - self.x, 0, 1)
+        elif mu < self.x:
+            return 1 / uniroot(lambda t: self.mean(1 / t) - self.x, sys.float_info.epsilon, 1)
+        return 1.0
+
+    def upperLimit(self, alpha):
+        if self.x == self.hi:
+            return np.inf
+        p = self.cdf(self.x, 1.0)
+        if p < alpha:
+            return uniroot(lambda t: self.cdf(self.x, t) - alpha, 0, 1)
+        elif p > alpha:
+            return 1 / uniroot(lambda t: self.cdf(self.x, 1 / t) - alpha, sys.float_info.epsilon, 1)
+        return 1.0
+
+    def lowerLimit(self, alpha):
+        if self.x == self.lo:
+            return 0.0
+        p = self.cdf(self.x, 1.0, upperTail=True)
+        if p > alpha:
+            return uniroot(lambda t: self.cdf(self.x, t, upperTail=True) - alpha, 0, 1)
+        elif p < alpha:
+            return 1 / uniroot(lambda t: self.cdf(self.x, 1 / t, upperTail=True) - alpha, sys.float_info.epsilon, 1)
+        return 1.0
+
+
+@functools.lru_cache(maxsize=65536)
+def fisherTest(a, b, c, d, confLevel=0.95):
+    # R's fisher.test(rbind(c(a, b), c(c, d))) for a 2x2 table: the conditional MLE of the odds ratio, the two-sided
+    # p-value and the confidence interval of the odds ratio, without starting an R interpreter. results are cached
+    # per table, so repeated tables (common with small counts) are computed once
+    if a + b + c + d == 0:
+        # an empty table says nothing about the odds ratio; R and scipy report p = 1
+        return 0.0, 1.0, (0.0, np.inf)
+    distribution = NoncentralHypergeometric(int(a), int(b), int(c), int(d))
+    alpha = (1 - confLevel) / 2
+    return distribution.estimate(), distribution.pValue(), (distribution.lowerLimit(alpha),
+                                                            distribution.upperLimit(alpha))
+
+def fisherTests(tables, confLevel=0.95):
+    # fisherTest() of every (a, b, c, d) table in tables, as lists of odds ratios, p-values and confidence intervals
+    oddsRatios, pValues, intervals = list(), list(), list()
+    for a, b, c, d in tables:
+        oddsRatio, pValue, interval = fisherTest(int(a), int(b), int(c), int(d), confLevel)
+        oddsRatios.append(oddsRatio)
+        pValues.append(pValue)
+        intervals.append(interval)
+    return oddsRatios, pValues, intervals
@@ -0,0 +1,155 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import numpy as np
+import allel
+
+logger = logging.getLogger()
+
+# the VCF fields the finder uses, and the .npy file each one is cached in
+cachedFields = {'samples': 'samples.npy',
+                'calldata/GT': 'GT.npy',
+                'variants/CHROM': 'CHROM.npy',
+                'variants/POS': 'POS.npy',
+                'variants/REF': 'REF.npy',
+                'variants/ALT': 'ALT.npy'}
+metadataFileName = 'meta.json'
+
+
+def emptyVCF(vcfFileName):
+    # the vcf dict allel.read_vcf() would return for a region with no records (it returns None instead), so a gene
+    # with no calls in the VCF runs through to empty outputs
+    samples = np.array(allel.read_vcf_headers(vcfFileName).samples, dtype=object)
+    return {'samples': samples,
+            'calldata/GT': np.zeros((0, len(samples), 2), dtype='i1'),
+            'variants/CHROM': np.zeros(0, dtype=object),
+            'variants/POS': np.zeros(0, dtype=np.int32),
+            'variants/REF': np.zeros(0, dtype=object),
+            'variants/ALT': np.zeros((0, 3), dtype=object)}
+
+def cacheKey(vcfFileName, region):
+    # a cache entry is specific to the VCF path, its modification time and the region it was read with
+    vcfPath = os.path.abspath(vcfFileName)
+    mtime = os.path.getmtime(vcfPath)
+    return hashlib.sha1((vcfPath + '|' + repr(mtime) + '|' + str(region)).encode('utf-8')).hexdigest()
+
+def cacheEntryDir(cacheDir, vcfFileName, region):
+    return os.path.join(cacheDir, cacheKey(vcfFileName, region))
+
+def buildCache(cacheDir, vcfFileName, region=None):
+    entryDir = cacheEntryDir(cacheDir, vcfFileName, region)
+    logger.info('caching genotypes from ' + vcfFileName + ' region ' + str(region) + ' in ' + entryDir)
+    t = time.time()
+    vcf = allel.read_vcf(vcfFileName, fields=list(cachedFields.keys()), region=region)
+    if vcf is None:
+        logger.info('no variants in ' + vcfFileName + ' region ' + str(region))
+        vcf = emptyVCF(vcfFileName)
+    # write to a scratch directory and rename, so a half-written entry is never opened
+    tmpDir = entryDir + '.tmp'
+    if os.path.exists(tmpDir):
+        shutil.rmtree(tmpDir)
+    os.makedirs(tmpDir)
+    for field in cachedFields:
+        array = vcf[field]
+        # object (string) arrays are stored as fixed-width unicode so they can be memory-mapped too
+        if array.dtype == object:
+            array = array.astype(str)
+        np.save(os.path.join(tmpDir, cachedFields[field]), array)
+    metadata = {'vcf': os.path.abspath(vcfFileName), 'mtime': os.path.getmtime(vcfFileName), 'region': region,
+                'numVariants': int(vcf['calldata/GT'].shape[0]), 'numSamples': int(vcf['calldata/GT'].shape[1]),
+                'created': time.strftime('%Y-%m-%d %H:%M:%S')}
+    with open(os.path.join(tmpDir, metadataFileName), 'w') as f:
+        json.dump(metadata, f)
+    f.close()
+    if os.path.exists(entryDir):
+        shutil.rmtree(entryDir)
+    os.rename(tmpDir, entryDir)
+    logger.info('elapsed time in buildCache() ' + str(time.time() - t))
+    return entryDir
+
+def openCache(cacheDir, vcfFileName, region=None):
+    # returns a vcf dict like allel.read_vcf() whose arrays are read-only memory maps, or None if not cached
+    entryDir = cacheEntryDir(cacheDir, vcfFileName, region)
+    if not os.path.exists(os.path.join(entryDir, metadataFileName)):
+        return None
+    logger.info('opening cached genotypes for ' + vcfFileName + ' in ' + entryDir)
+    vcf = dict()
+    for field in cachedFields:
+        vcf[field] = np.load(os.path.join(entryDir, cachedFields[field]), mmap_mode='r')
+    return vcf
+
+def getCachedVCF(cacheDir, vcfFileName, region=None):
+    vcf = openCache(cacheDir, vcfFileName, region)
+    if vcf is None:
+        buildCache(cacheDir, vcfFileName, region)
+        vcf = openCache(cacheDir, vcfFileName, region)
+    return vcf
+
+def listCache(cacheDir):
+    entries = list()
+    if not os.path.isdir(cacheDir):
+        return entries
+    for key in sorted(os.listdir(cacheDir)):
+        metadataPath = os.path.join(cacheDir, key, metadataFileName)
+        if not os.path.exists(metadataPath):
+            continue
+        with open(metadataPath, 'r') as f:
+            metadata = json.load(f)
+        f.close()
+        metadata['key'] = key
+        metadata['bytes'] = sum(os.path.getsize(os.path.join(cacheDir, key, fileName))
+                                for fileName in os.listdir(os.path.join(cacheDir, key)))
+        metadata['stale'] = not os.path.exists(metadata['vcf']) or os.path.getmtime(metadata['vcf']) != metadata['mtime']
+        entries.append(metadata)
+    return entries
+
+def invalidateCache(cacheDir, vcfFileName=None, staleOnly=False):
+    # removes every entry (or the entries for vcfFileName), or only those whose VCF changed or is gone
+    removed = list()
+    for entry in listCache(cacheDir):
+        if vcfFileName is not None and entry['vcf'] != os.path.abspath(vcfFileName):
+            continue
+        if staleOnly and not entry['stale']:
+            continue
+        logger.info('removing cache entry ' + entry['key'] + ' for ' + entry['vcf'])
+        shutil.rmtree(os.path.join(cacheDir, entry['key']))
+        removed.append(entry['key'])
+    return removed
+
+def parseArgs():
+    parser = argparse.ArgumentParser(usage="genotypeCache build|inspect|invalidate --cache dir [options]")
+    parser.add_argument("command", help="build, inspect or invalidate")
+    parser.add_argument("--cache", dest="cache", help="genotype cache directory", required=True)
+    parser.add_argument("--vcf", dest="vcf", help="vcf file name, default=None", default=None)
+    parser.add_argument("--r", dest="r", help="(optional) region, e.g. chr13:32315474-32400266. Default=None",
+                        default=None)
+    parser.add_argument("--stale", dest="stale", help="invalidate only stale entries. Default=False",
+                        action='store_true')
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig()
+    logger.setLevel(logging.INFO)
+    options = parseArgs()
+    if options.command == 'build':
+        if options.vcf is None:
+            print('build needs --vcf')
+            sys.exit(1)
+        print(buildCache(options.cache, options.vcf, options.r))
+    elif options.command == 'inspect':
+        for entry in listCache(options.cache):
+            print(json.dumps(entry))
+    elif options.command == 'invalidate':
+        for key in invalidateCache(options.cache, options.vcf, options.stale):
+            print('removed ' + key)
+    else:
+        print('unknown command: ' + options.command)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import gzip
+import logging
+import os
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+logger = logging.getLogger()
+
+# INFO keys the finder reads from the sites file; a trailing '*' matches every key with that prefix, which picks up
+# the per-population AC_<pop> and AN_<pop> counts
+usedInfoKeys = ['AF', 'popmax', 'faf95_popmax', 'AC', 'AN', 'AC_*', 'AN_*']
+
+
+def normalizeChrom(chrom):
+    chrom = str(chrom)
+    if chrom.startswith('chr'):
+        chrom = chrom[3:]
+    return chrom
+
+def parseInfo(info):
+    # INFO is "key=value;flag;key=value" -- flags without a value are dropped
+    varValDict = dict()
+    for varVal in info.split(';'):
+        varValArray = varVal.split('=')
+        if len(varValArray) == 1:
+            continue
+        varValDict[varValArray[0]] = varValArray[1]
+    return varValDict
+
+def keepInfoKeys(info, infoKeys):
+    keys = set(k for k in infoKeys if not k.endswith('*'))
+    prefixes = tuple(k[:-1] for k in infoKeys if k.endswith('*'))
+    return ';'.join(varVal for varVal in info.split(';')
+                    if varVal.split('=')[0] in keys or varVal.split('=')[0].startswith(prefixes))
+
+def findIndex(fileName):
+    for suffix in ['.tbi', '.csi']:
+        if os.path.exists(fileName + suffix):
+            return fileName + suffix
+    return None
+
+def openVCF(fileName):
+    if fileName.endswith('.gz') or fileName.endswith('.bgz'):
+        return gzip.open(fileName, 'rt')
+    else:
+        return open(fileName, 'r')
+
+
+class GnomadSites(object):
+    # gnomAD sites VCF records keyed by (chrom, pos, ref, alt), chrom without the 'chr' prefix.
+    # the INFO column is kept as the raw string and only parsed the first time a variant is looked up.
+    # a key that appears on more than one record is kept as ambiguous and never returns INFO.
+
+    def __init__(self):
+        self.info = dict()
+        self.parsedInfo = dict()
+        self.duplicates = set()
+
+    @classmethod
+    def fromVCF(cls, fileName, chrom=None, start=None, end=None, infoKeys=None):
+        # chrom/start/end (1-based, inclusive) restrict the store to the records overlapping that region, and
+        # infoKeys to those INFO keys. a bgzipped file with a .tbi/.csi index is read with a tabix query when
+        # pysam is installed; otherwise the file is streamed once and filtered line by line.
+        sites = cls()
+        if chrom is not None and findIndex(fileName) is not None and pysam is not None:
+            lines = cls.fetchRegion(fileName, findIndex(fileName), chrom, start, end)
+        else:
+            lines = cls.scanRegion(fileName, chrom, start, end)
+        for fields in lines:
+            info = fields[7]
+            if infoKeys is not None:
+                info = keepInfoKeys(info, infoKeys)
+            sites.add(fields[0], fields[1], fields[3], fields[4], info)
+        logger.info('read ' + str(len(sites)) + ' gnomad sites from ' + fileName)
+        return sites
+
+    @classmethod
+    def fromVCFRegions(cls, fileName, regions, infoKeys=None):
+        # one store for several (chrom, start, end) regions, e.g. the genes of a batch run. overlapping or adjacent
+        # regions on a chrom are merged first, and a record a later region returns again (a long REF reaching
+        # into it) is not counted as a duplicate
+        merged = list()
+        for chrom, start, end in sorted((normalizeChrom(r[0]), int(r[1]), int(r[2])) for r in regions):
+            if len(merged) > 0 and merged[-1][0] == chrom and start <= merged[-1][2] + 1:
+                merged[-1] = (chrom, merged[-1][1], max(end, merged[-1][2]))
+            else:
+                merged.append((chrom, start, end))
+        sites = cls()
+        for chrom, start, end in merged:
+            regionSites = cls.fromVCF(fileName, chrom, start, end, infoKeys)
+            for key in regionSites.info:
+                if key in regionSites.duplicates or (key in sites.info and sites.info[key] != regionSites.info[key]):
+                    sites.duplicates.add(key)
+                sites.info[key] = regionSites.info[key]
+        return sites
+
+    @staticmethod
+    def fetchRegion(fileName, indexFileName, chrom, start, end):
+        logger.info('querying ' + fileName + ' with index ' + indexFileName)
+        tbx = pysam.TabixFile(fileName, index=indexFileName)
+        contig = normalizeChrom(chrom)
+        if contig not in tbx.contigs:
+            contig = 'chr' + contig
+        if contig not in tbx.contigs:
+            tbx.close()
+            return
+        # pysam regions are 0-based, half-open
+        for line in tbx.fetch(contig, None if start is None else int(start) - 1, None if end is None else int(end)):
+            yield line.split('\t', 8)
+        tbx.close()
+
+    @staticmethod
+    def scanRegion(fileName, chrom, start, end):
+        contig = None if chrom is None else normalizeChrom(chrom)
+        with openVCF(fileName) as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                # CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+                fields = line.rstrip('\n').split('\t', 8)
+                if contig is not None and normalizeChrom(fields[0]) != contig:
+                    continue
+                pos = int(fields[1])
+                if (start is not None and pos + len(fields[3]) - 1 < int(start)) or (end is not None and pos > int(end)):
+                    continue
+                yield fields
+        f.close()
+
+    def __len__(self):
+        return len(self.info)
+
+    def __contains__(self, variant):
+        return self.key(variant) in self.info
+
+    @staticmethod
+    def key(variant):
+        return (normalizeChrom(variant[0]), int(variant[1]), str(variant[2]), str(variant[3]))
+
+    def add(self, chrom, pos, ref, alt, info):
+        key = self.key((chrom, pos, ref, alt))
+        if key in self.info:
+            self.duplicates.add(key)
+        self.info[key] = info
+
+    def getInfo(self, variant):
+        # returns the parsed INFO dict for the variant, or None if there is not exactly one record for it
+        key = self.key(variant)
+        if key not in self.info or key in self.duplicates:
+            return None
+        if key not in self.parsedInfo:
+            self.parsedInfo[key] = parseInfo(self.info[key])
+        return self.parsedInfo[key]
+
+    def getAF(self, variant, missing=None):
+        # returns (popmax, faf95_popmax, AF) as strings from the INFO field, with missing in place of absent keys
+        varValDict = self.getInfo(variant)
+        if varValDict is None:
+            return None
+        return (varValDict.get('popmax', missing), varValDict.get('faf95_popmax', missing),
+                varValDict.get('AF', missing))
+
+
+# stores loaded so far, keyed by the sites file (path and modification time), the region(s) and the INFO keys they
+# were read with, so a run for another gene or with other keys loads its own store instead of reusing the first one.
+# callers hold on to the store they loaded and look variants up in it.
+gnomadSitesPerFile = dict()
+
+def cacheKey(fileName, regions, infoKeys):
+    path = os.path.abspath(fileName)
+    return (path, os.path.getmtime(path), tuple(tuple(r) for r in regions),
+            tuple(infoKeys) if infoKeys is not None else None)
+
+def getGnomadSites(fileName, chrom=None, start=None, end=None, infoKeys=None):
+    key = cacheKey(fileName, [(chrom, start, end)], infoKeys)
+    if key not in gnomadSitesPerFile:
+        logger.info('reading gnomad sites from ' + fileName + ' in region ' + str((chrom, start, end)))
+        gnomadSitesPerFile[key] = GnomadSites.fromVCF(fileName, chrom, start, end, infoKeys)
+    return gnomadSitesPerFile[key]
+
+def getGnomadSitesForRegions(fileName, regions, infoKeys=None):
+    # one store for fileName from several regions (e.g. every gene of a batch)
+    key = cacheKey(fileName, regions, infoKeys)
+    if key not in gnomadSitesPerFile:
+        logger.info('reading gnomad sites from ' + fileName + ' in regions ' + str(regions))
+        gnomadSitesPerFile[key] = GnomadSites.fromVCFRegions(fileName, regions, infoKeys)
+    return gnomadSitesPerFile[key]
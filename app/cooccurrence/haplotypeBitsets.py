@@ -0,0 +1,72 @@
+import numpy as np
+
+# number of set bits in each byte value
+popcountTable = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+# largest (vus x pathogenic x bytes) intermediate cooccurrenceCounts() builds at once
+maxBlockBytes = 1 << 26
+
+
+def popcount(bits, axis=-1):
+    return popcountTable[bits].sum(axis=axis, dtype=np.int64)
+
+
+class HaplotypeBitsets(object):
+    # phased genotypes as two bitsets per variant, one bit per sample on each haplotype, packed 8 samples to a
+    # byte in numpy.packbits order. genotype code 2 (1|0) sets the first haplotype bit, 1 (0|1) the second and
+    # 3 (1|1) both, so cis/trans questions over a whole cohort are ANDs and popcounts of two rows.
+
+    def __init__(self, numSamples, first, second):
+        self.numSamples = numSamples
+        self.first = first
+        self.second = second
+
+    @classmethod
+    def fromCarrierMatrix(cls, matrix):
+        # bits are set straight from the matrix's stored calls, without a dense samples x variants intermediate
+        numSamples, numVariants = matrix.shape
+        numBytes = (numSamples + 7) // 8
+        first = np.zeros((numVariants, numBytes), dtype=np.uint8)
+        second = np.zeros((numVariants, numBytes), dtype=np.uint8)
+        samples = matrix.entryRows()
+        variants = matrix.csr.indices
+        codes = matrix.csr.data
+        bits = (0x80 >> (samples & 7)).astype(np.uint8)
+        onFirst = (codes & 2) > 0
+        onSecond = (codes & 1) > 0
+        np.bitwise_or.at(first, (variants[onFirst], samples[onFirst] >> 3), bits[onFirst])
+        np.bitwise_or.at(second, (variants[onSecond], samples[onSecond] >> 3), bits[onSecond])
+        return cls(numSamples, first, second)
+
+    @property
+    def nbytes(self):
+        return self.first.nbytes + self.second.nbytes
+
+    def carriers(self, variants):
+        return self.first[variants] | self.second[variants]
+
+    def phasedPairs(self, vus, pathogenic):
+        # bits of the samples where vus and pathogenic pair the way sameGeneSameParent() accepts when phased:
+        # vus on both haplotypes, or vus and pathogenic each heterozygous on opposite haplotypes.
+        # vus and pathogenic are index arrays; the result broadcasts to (len(vus), len(pathogenic), bytes)
+        vusFirst, vusSecond = self.first[vus][:, None, :], self.second[vus][:, None, :]
+        pathogenicFirst, pathogenicSecond = self.first[pathogenic][None, :, :], self.second[pathogenic][None, :, :]
+        return (vusFirst & vusSecond & (pathogenicFirst | pathogenicSecond)) | \
+               (vusFirst & ~vusSecond & pathogenicSecond & ~pathogenicFirst) | \
+               (vusSecond & ~vusFirst & pathogenicFirst & ~pathogenicSecond)
+
+    def cooccurrenceCounts(self, vusColumns, pathogenicColumns):
+        # (len(vusColumns) x len(pathogenicColumns)) number of samples carrying each vus/pathogenic phased pair,
+        # computed in blocks of vus so the intermediate bitsets stay under maxBlockBytes
+        vusColumns = np.asarray(vusColumns)
+        pathogenicColumns = np.asarray(pathogenicColumns)
+        counts = np.zeros((len(vusColumns), len(pathogenicColumns)), dtype=np.int64)
+        blockSize = max(1, maxBlockBytes // max(1, len(pathogenicColumns) * self.first.shape[1]))
+        for start in range(0, len(vusColumns), blockSize):
+            block = vusColumns[start:start + blockSize]
+            counts[start:start + len(block)] = popcount(self.phasedPairs(block, pathogenicColumns))
+        return counts
+
+    def pairSamples(self, vus, pathogenic):
+        # sample indices, in order, where vus and pathogenic are a phased pair
+        bits = self.phasedPairs(np.array([vus]), np.array([pathogenic]))[0, 0]
+        return np.nonzero(np.unpackbits(bits)[:self.numSamples])[0]
@@ -0,0 +1,129 @@
+import functools
+import numpy as np
+from scipy.special import gammaln
+
+# chi-square with 1 degree of freedom at 0.05 significance
+criticalValue = 3.84
+# p-value under which the exact test rejects HW
+exactSignificance = 0.05
+# het count probabilities within this relative difference are ties for the exact p-values
+tieTolerance = 1e-7
+
+hweTests = ['chisquare', 'exact']
+
+# the per-variant statistics, under the keys the analyzer stores them as
+chiSquareKeys = ['p', 'q', 'chisquare', 'accept hw']
+statisticsKeys = ['E(f(Aa))', 'F', 'Z', 'accept F']
+
+
+def countArrays(AA, Aa, aa):
+    return (np.asarray(AA, dtype=np.int64), np.asarray(Aa, dtype=np.int64), np.asarray(aa, dtype=np.int64))
+
+def chiSquareTest(AA, Aa, aa, n, c, critical=criticalValue):
+    # Yates-corrected chi-square test for Hardy-Weinberg proportions of every variant at once, from arrays of
+    # homozygous reference (AA), heterozygous (Aa) and homozygous alternate (aa) counts in a cohort of n.
+    # https://en.wikipedia.org/wiki/Hardy-Weinberg_principle
+    # a variant with a zero expected count (monomorphic) has chisquare 0 and accepts HW.
+    AA, Aa, aa = countArrays(AA, Aa, aa)
+    # p = (2 x Obs(AA) + Obs(Aa)) / (2 x (Obs(AA) + Obs(Aa) + Obs(aa)), q = 1 - p
+    p = (2 * AA + Aa) / (2.0 * (AA + Aa + aa))
+    q = 1 - p
+    # Exp(AA) = p**2 x n, Exp(Aa) = 2 x p * q * n, Exp(aa) = q**2 x n
+    expAA = n * p ** 2
+    expAa = 2 * p * q * n
+    expaa = n * q ** 2
+    # chi-square = sum[ (|O - E| - c)**2 / E ]
+    tested = (expAA != 0) & (expAa != 0) & (expaa != 0)
+    chisquare = np.zeros(len(p))
+    chisquare[tested] = (1.0 / expAA[tested]) * (np.abs(AA[tested] - expAA[tested]) - c) ** 2 + \
+                        (1.0 / expAa[tested]) * (np.abs(Aa[tested] - expAa[tested]) - c) ** 2 + \
+                        (1.0 / expaa[tested]) * (np.abs(aa[tested] - expaa[tested]) - c) ** 2
+    return {'p': p, 'q': q, 'chisquare': chisquare, 'accept hw': chisquare < critical}
+
+def inbreedingStatistics(AA, Aa, aa, p, q, significance):
+    # inbreeding coefficient F = [ E(f(Aa)) - O(f(Aa)) ] / [ E(f(Aa)) ] with E(f(Aa)) = 2pq, and the Z-statistic
+    # of the Assortative Mating study on GALA data,
+    # Z = (((n2 x n0) - n1^2 ) / (n2 + n1/2)(n0 + n1/2) ) N^1/2
+    # with n2 and n0 the homozygote and n1 the heterozygote counts, N = n2 + n1 + n0. F and Z are undefined for
+    # a monomorphic variant (E = 0); it gets F = Z = 0 and accepts F.
+    AA, Aa, aa = countArrays(AA, Aa, aa)
+    p = np.asarray(p, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    expected = 2 * p * q
+    n0 = aa
+    n1 = Aa
+    n2 = AA
+    denominator = (n2 + 0.5 * n1) * (n0 + 0.5 * n1)
+    defined = (expected != 0) & (denominator != 0)
+    F = np.zeros(len(p))
+    Z = np.zeros(len(p))
+    F[defined] = (expected[defined] - Aa[defined]) / expected[defined]
+    Z[defined] = ((n2[defined] * n0[defined] - n1[defined] ** 2) / denominator[defined]) * \
+                 np.sqrt(n0[defined] + n1[defined] + n2[defined])
+    return {'E(f(Aa))': expected, 'F': F, 'Z': Z, 'accept F': np.abs(F) <= significance}
+
+@functools.lru_cache(maxsize=4096)
+def getExactTables(numSamples, minorAlleleCount):
+    # exact test p-values (plain and mid-p) and the expected heterozygote frequency for numSamples samples carrying
+    # minorAlleleCount minor alleles, from the Levene-Haldane distribution of the heterozygote count (Wigginton et
+    # al. 2005). the p-value tables are indexed by the observed het count; counts of the wrong parity are NaN.
+    # every variant with the same (n, minor allele count) shares one table
+    hets = np.arange(minorAlleleCount % 2, minorAlleleCount + 1, 2)
+    rareHomozygotes = (minorAlleleCount - hets) // 2
+    commonHomozygotes = numSamples - hets - rareHomozygotes
+    # P(h) is proportional to 2^h / (h! rareHomozygotes! commonHomozygotes!)
+    logProbabilities = hets * np.log(2.0) - gammaln(hets + 1) - gammaln(rareHomozygotes + 1) - \
+                       gammaln(commonHomozygotes + 1)
+    probabilities = np.exp(logProbabilities - logProbabilities.max())
+    probabilities /= probabilities.sum()
+    # p-value of h: the probability of every het count at most as likely as h; mid-p counts the ties with h half
+    ordered = np.sort(probabilities)
+    cumulative = np.concatenate([[0.0], np.cumsum(ordered)])
+    lessLikely = cumulative[np.searchsorted(ordered, probabilities * (1 - tieTolerance), side='left')]
+    asLikely = cumulative[np.searchsorted(ordered, probabilities * (1 + tieTolerance), side='right')] - lessLikely
+    pValues = np.full(minorAlleleCount + 1, np.nan)
+    midPValues = np.full(minorAlleleCount + 1, np.nan)
+    pValues[hets] = np.minimum(1.0, lessLikely + asLikely)
+    midPValues[hets] = np.minimum(1.0, lessLikely + 0.5 * asLikely)
+    hetFrequency = float(np.dot(hets, probabilities)) / numSamples if numSamples > 0 else 0.0
+    return pValues, midPValues, hetFrequency
+
+def exactTest(AA, Aa, aa, midP=True):
+    # exact test for Hardy-Weinberg proportions of every variant at once (the test hail's hardy_weinberg_test()
+    # does, mid-p by default): the 'hwe p' value and the expected heterozygote frequency under HW
+    # ('het freq hwe'). variants are grouped by (n, minor allele count) so each table is computed once
+    AA, Aa, aa = countArrays(AA, Aa, aa)
+    n = AA + Aa + aa
+    minorAlleleCounts = np.minimum(2 * AA + Aa, 2 * aa + Aa)
+    pValues = np.ones(len(n))
+    hetFrequencies = np.zeros(len(n))
+    order = np.lexsort((minorAlleleCounts, n))
+    groupStarts = np.concatenate([[0], np.nonzero((np.diff(n[order]) != 0) |
+                                                  (np.diff(minorAlleleCounts[order]) != 0))[0] + 1])
+    for group in np.split(order, groupStarts[1:]):
+        if len(group) == 0:
+            continue
+        plain, mid, hetFrequency = getExactTables(int(n[group[0]]), int(minorAlleleCounts[group[0]]))
+        pValues[group] = (mid if midP else plain)[Aa[group]]
+        hetFrequencies[group] = hetFrequency
+    return {'hwe p': pValues, 'het freq hwe': hetFrequencies}
+
+def hardyWeinbergTest(AA, Aa, aa, n, c, significance, critical=criticalValue, test='chisquare'):
+    # chiSquareTest() and inbreedingStatistics() together. with test='exact', accept hw comes from the mid-p exact
+    # test instead of the chi-square, whose fixed critical value is unreliable for rare variants
+    results = chiSquareTest(AA, Aa, aa, n, c, critical)
+    if test == 'exact':
+        results.update(exactTest(AA, Aa, aa))
+        results['accept hw'] = results['hwe p'] >= exactSignificance
+    elif test != 'chisquare':
+        raise ValueError('unknown Hardy-Weinberg test: ' + str(test))
+    results.update(inbreedingStatistics(AA, Aa, aa, results['p'], results['q'], significance))
+    return results
+
+def getStatistics(results, i, keys):
+    # {key: python value} of variant i, for the per-variant dicts and json outputs
+    statistics = dict()
+    for key in keys:
+        value = results[key][i]
+        statistics[key] = bool(value) if results[key].dtype == np.bool_ else float(value)
+    return statistics
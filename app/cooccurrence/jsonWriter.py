@@ -0,0 +1,109 @@
+from collections.abc import Mapping
+import json
+import logging
+import queue
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger()
+
+# encoded records are collected and written this many characters at a time
+chunkSize = 1 << 20
+
+
+def jsonDefault(obj):
+    # the types json does not know: numpy scalars and arrays, sets, and mappings such as the carrier matrix views
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, (set, frozenset)):
+        return list(obj)
+    elif isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError('Object of type ' + type(obj).__name__ + ' is not JSON serializable')
+
+encoder = json.JSONEncoder(default=jsonDefault, check_circular=False)
+
+def jsonKey(key):
+    # json turns non-string keys into strings this way
+    if isinstance(key, str):
+        return key
+    elif key is True:
+        return 'true'
+    elif key is False:
+        return 'false'
+    elif key is None:
+        return 'null'
+    elif isinstance(key, (int, float)):
+        return encoder.encode(key)
+    raise TypeError('keys must be str, int, float, bool or None, not ' + type(key).__name__)
+
+def iterEncode(obj):
+    # a mapping is encoded one top-level record at a time, so the whole document is never one string in memory.
+    # the text is the same as json.dump(obj, f) writes.
+    if not isinstance(obj, Mapping):
+        yield encoder.encode(obj)
+        return
+    yield '{'
+    first = True
+    for key in obj:
+        if not first:
+            yield ', '
+        first = False
+        yield encoder.encode(jsonKey(key)) + ': ' + encoder.encode(obj[key])
+    yield '}'
+
+def writeJSON(fileName, obj):
+    with open(fileName, 'w') as f:
+        chunk = list()
+        length = 0
+        for text in iterEncode(obj):
+            chunk.append(text)
+            length += len(text)
+            if length >= chunkSize:
+                f.write(''.join(chunk))
+                chunk = list()
+                length = 0
+        f.write(''.join(chunk))
+    f.close()
+
+
+class BackgroundWriter(object):
+    # writes JSON files on a background thread: write() queues the object and returns at once, close() waits
+    # for the queued files and raises the first error a write hit. objects must not be changed after they are
+    # queued.
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.errors = list()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, fileName, obj):
+        self.queue.put((fileName, obj))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            fileName, obj = item
+            try:
+                t = time.time()
+                writeJSON(fileName, obj)
+                logger.info('wrote ' + fileName + ' in ' + str(time.time() - t))
+            except Exception as e:
+                logger.error('failed to write ' + fileName + ': ' + str(e))
+                self.errors.append(e)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.errors:
+            raise self.errors[0]
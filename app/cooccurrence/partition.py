@@ -0,0 +1,77 @@
+import math
+
+# how the (samples x variants) work is split between processes:
+#   samples  - one block of samples per process, all variants (the original split)
+#   variants - one block of variants per process, all samples
+#   tiles    - a 2-D grid of sample blocks x variant blocks
+#   auto     - whichever of the above has the smallest largest tile for this shape and process count
+splitModes = ['auto', 'samples', 'variants', 'tiles']
+
+
+def divide(n, d):
+   res = list()
+   qu = int(n/d)
+   rm = n%d
+   for i in range(d):
+       if i < rm:
+           res.append(qu + 1)
+       else:
+           res.append(qu)
+   return res
+
+def getStartAndEnd(partitionSizes, threadID):
+    start = 0
+    for i in range(threadID):
+        start += partitionSizes[i]
+    end = start + partitionSizes[threadID]
+
+    return start, end
+
+def getGrids(numSamples, numVariants, numProcesses, mode):
+    # candidate (sample blocks, variant blocks) grids for mode
+    numProcesses = max(1, int(numProcesses))
+    if mode == 'samples':
+        return [(numProcesses, 1)]
+    elif mode == 'variants':
+        return [(1, numProcesses)]
+    grids = [(r, numProcesses // r) for r in range(1, numProcesses + 1) if numProcesses % r == 0]
+    if mode == 'tiles':
+        twoD = [g for g in grids if g[0] > 1 and g[1] > 1]
+        # a prime process count has no 2-D grid with every core busy; fall back to the best 1-D grid
+        return twoD if twoD else grids
+    elif mode == 'auto':
+        return grids
+    else:
+        raise ValueError('unknown split mode: ' + str(mode))
+
+def planTiles(numSamples, numVariants, numProcesses, mode='auto'):
+    # returns one (sampleStart, sampleEnd, variantStart, variantEnd) tile per process. grids are scored by the size
+    # of their largest tile, so a small cohort over a wide region gets split along variants and a large cohort over
+    # a narrow region along samples. ties go to the grid with more sample blocks, which needs the least merging.
+    best = None
+    for sampleBlocks, variantBlocks in getGrids(numSamples, numVariants, numProcesses, mode):
+        largestTile = math.ceil(numSamples / sampleBlocks) * math.ceil(numVariants / variantBlocks)
+        if best is None or largestTile <= best[0]:
+            best = (largestTile, sampleBlocks, variantBlocks)
+    sampleBlocks, variantBlocks = best[1], best[2]
+    sampleSizes = divide(numSamples, sampleBlocks)
+    variantSizes = divide(numVariants, variantBlocks)
+    tiles = list()
+    for i in range(sampleBlocks):
+        sampleStart, sampleEnd = getStartAndEnd(sampleSizes, i)
+        for j in range(variantBlocks):
+            variantStart, variantEnd = getStartAndEnd(variantSizes, j)
+            tiles.append((sampleStart, sampleEnd, variantStart, variantEnd))
+    return tiles
+
+def addCounts(total, partial):
+    # merges a partial result into total: numbers in matching (nested) dict entries are summed, anything else is
+    # taken from whichever result has it. used for counters that span more than one tile.
+    for key in partial:
+        if key not in total:
+            total[key] = partial[key]
+        elif isinstance(partial[key], dict):
+            addCounts(total[key], partial[key])
+        elif isinstance(partial[key], (int, float)) and not isinstance(partial[key], bool):
+            total[key] += partial[key]
+    return total
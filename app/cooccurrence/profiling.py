@@ -0,0 +1,147 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger()
+
+
+def peakRSS(who):
+    # peak resident set size in MB of this process (who='self') or of its largest finished child ('children')
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return usage.ru_maxrss / float(1 << 20)
+    return usage.ru_maxrss / float(1 << 10)
+
+def childrenCPUTime():
+    # user + system seconds of the finished children, e.g. the forked genotype workers
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageMetrics(object):
+    # what one stage cost: wall and CPU seconds (this process, and the children it waited for), peak RSS after the
+    # stage, and item counts the stage reports (variants, samples, pairs, ...)
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.counts = dict()
+        self.resumed = False
+        self.wallTime = None
+        self.cpuTime = None
+        self.childrenCPUTime = None
+        self.peakRSS = None
+        self.childrenPeakRSS = None
+
+    def count(self, **counts):
+        for key in counts:
+            self.counts[key] = int(counts[key])
+
+    def toDict(self):
+        return {'name': self.name, 'parent': self.parent, 'wall time': self.wallTime, 'cpu time': self.cpuTime,
+                'children cpu time': self.childrenCPUTime, 'peak rss mb': self.peakRSS,
+                'children peak rss mb': self.childrenPeakRSS, 'resumed': self.resumed, 'counts': self.counts}
+
+
+class Profiler(object):
+    # stage metrics for one run, in the order the stages finish. stages nest: a stage started inside another
+    # records it as its parent, and its time is part of the parent's as well.
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stages = list()
+        self.open = list()
+        self.startTime = time.time()
+        self.profile = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = StageMetrics(name, self.open[-1].name if self.open else None)
+        self.open.append(record)
+        wall, cpu, children = time.time(), time.process_time(), childrenCPUTime()
+        try:
+            yield record
+        finally:
+            record.wallTime = time.time() - wall
+            record.cpuTime = time.process_time() - cpu
+            record.childrenCPUTime = childrenCPUTime() - children
+            record.peakRSS = peakRSS('self')
+            record.childrenPeakRSS = peakRSS('children')
+            self.open.pop()
+            self.stages.append(record)
+            logger.info('elapsed time in ' + name + ' ' + str(record.wallTime))
+
+    def get(self, name):
+        # the last finished stage called name, or None
+        for record in reversed(self.stages):
+            if record.name == name:
+                return record
+        return None
+
+    def metrics(self):
+        return {'run': {'argv': sys.argv, 'python': platform.python_version(), 'platform': platform.platform(),
+                        'pid': os.getpid(), 'start': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.startTime)),
+                        'wall time': time.time() - self.startTime, 'peak rss mb': peakRSS('self'),
+                        'children peak rss mb': peakRSS('children')},
+                'stages': [record.toDict() for record in self.stages]}
+
+    def save(self, fileName):
+        logger.info('saving run metrics to ' + fileName)
+        with open(fileName, 'w') as f:
+            json.dump(self.metrics(), f, indent=4)
+        f.close()
+
+    def startProfile(self, fileName):
+        # a .html profile is a pyinstrument report when pyinstrument is installed; anything else is cProfile stats
+        # (read them with pstats or snakeviz)
+        if fileName.endswith('.html') and pyinstrument is not None:
+            profile = pyinstrument.Profiler()
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+        self.profile = (fileName, profile)
+
+    def stopProfile(self):
+        if self.profile is None:
+            return
+        fileName, profile = self.profile
+        self.profile = None
+        logger.info('saving profile to ' + fileName)
+        if isinstance(profile, cProfile.Profile):
+            profile.disable()
+            profile.dump_stats(fileName)
+        else:
+            profile.stop()
+            with open(fileName, 'w') as f:
+                f.write(profile.output_html())
+            f.close()
+
+
+# the profiler of this process; forked workers start with a copy of it
+profiler = Profiler()
+
+def stage(name):
+    return profiler.stage(name)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# value returned for samples that are not in the annotation file
+missingValue = 'NA'
+
+
+def factorize(values):
+    # categorical codes and categories for values; NaN gets a category of its own so it comes back as NaN
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    categories = list(uniques)
+    if (codes == -1).any():
+        codes[codes == -1] = len(categories)
+        categories.append(np.nan)
+    return codes.astype(np.int32), categories
+
+
+class SampleAnnotations(object):
+    # the sample annotation file indexed by sample id, with seqCenter and study held as categorical codes, so a
+    # lookup is a dict hit and an array index instead of a scan of the annotation frame. seqCenter is the CENTER
+    # column, or seq_center if there is no CENTER; a sample listed twice takes its first row.
+
+    def __init__(self, sampleIds, seqCenters, studies):
+        self.sampleIndex = dict()
+        for i in range(len(sampleIds)):
+            if sampleIds[i] not in self.sampleIndex:
+                self.sampleIndex[sampleIds[i]] = i
+        self.centerCodes, self.centerCategories = factorize(seqCenters)
+        self.studyCodes, self.studyCategories = factorize(studies)
+
+    @classmethod
+    def fromDataFrame(cls, annoDF):
+        sampleIds = list(annoDF['sample.id'])
+        if 'CENTER' in annoDF.columns:
+            seqCenters = list(annoDF['CENTER'])
+        elif 'seq_center' in annoDF.columns:
+            seqCenters = list(annoDF['seq_center'])
+        else:
+            seqCenters = [missingValue] * len(sampleIds)
+        if 'study' in annoDF.columns:
+            studies = list(annoDF['study'])
+        else:
+            studies = [missingValue] * len(sampleIds)
+        return cls(sampleIds, seqCenters, studies)
+
+    @classmethod
+    def fromFile(cls, annoFileName):
+        return cls.fromDataFrame(pd.read_csv(annoFileName, header=0, sep='\t', dtype={'sample.id': str}))
+
+    def __len__(self):
+        return len(self.sampleIndex)
+
+    def __contains__(self, sample):
+        return sample in self.sampleIndex
+
+    def get(self, sample):
+        # (seqCenter, study) for one sample, 'NA' for both if it is not annotated
+        if sample not in self.sampleIndex:
+            return missingValue, missingValue
+        i = self.sampleIndex[sample]
+        return self.centerCategories[self.centerCodes[i]], self.studyCategories[self.studyCodes[i]]
+
+    def join(self, samples):
+        # seqCenter and study lists aligned to samples, e.g. the samples of a VCF
+        if len(self.sampleIndex) == 0:
+            return [missingValue] * len(samples), [missingValue] * len(samples)
+        rows = np.array([self.sampleIndex.get(sample, -1) for sample in samples], dtype=np.int64)
+        centerCategories = self.centerCategories + [missingValue]
+        studyCategories = self.studyCategories + [missingValue]
+        centerCodes = np.where(rows >= 0, self.centerCodes[rows], len(self.centerCategories))
+        studyCodes = np.where(rows >= 0, self.studyCodes[rows], len(self.studyCategories))
+        return [centerCategories[c] for c in centerCodes], [studyCategories[c] for c in studyCodes]
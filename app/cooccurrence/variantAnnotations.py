@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+coordinateColumnBase = 'Genomic_Coordinate_hg'
+# the per-population allele frequency columns of a BRCA Exchange variants file, e.g.
+# Allele_frequency_genome_AFR_GnomAD
+gnomadColumnTag = 'GnomAD'
+frequencyColumnTag = 'Allele_frequency'
+# min frequency and population reported when no population has a non-zero frequency (as getMinGnomad() did)
+noMinFrequency = 1.1
+noMinPopulation = 0.0
+
+
+def parseCoordinates(coordinates):
+    # CHROM, POS, REF, ALT columns for 'chr13:g.32972575:G>T' strings ('chr' and 'g.' optional); POS is a python
+    # int, and all four are None where the string does not parse
+    parts = coordinates.str.extract(r'^(?:chr)?([^:]*):(?:g\.)?(\d+):([^:>]*)>([^:>]*)(?::|$)').astype(object)
+    parts.columns = ['CHROM', 'POS', 'REF', 'ALT']
+    parts[parts['POS'].isna()] = None
+    parts['POS'] = pd.Series([None if p is None else int(p) for p in parts['POS']], index=parts.index, dtype=object)
+    return parts
+
+def variantKey(variant):
+    # (chrom, pos, ref, alt) for a variant tuple, list or its str(), chrom without 'chr'
+    if isinstance(variant, str):
+        variant = eval(variant)
+    return str(variant[0]).replace('chr', ''), int(variant[1]), str(variant[2]), str(variant[3])
+
+def toFloat(values):
+    # float column for strings; '-', blanks and anything else that is not a number become NaN
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').values.astype(np.float64)
+
+
+class VariantAnnotations(object):
+    # the GnomAD allele frequencies of a pathogenicity file, one row per (chrom, pos, ref, alt), with each
+    # population's frequency as a float column and the max and min population and frequency worked out once.
+    # a variant listed on more than one row takes its first row, as the frame filters did.
+
+    def __init__(self, variants, populations, frequencies):
+        self.variants = list(variants)
+        self.populations = list(populations)
+        self.frequencies = np.asarray(frequencies, dtype=np.float64).reshape(len(self.variants),
+                                                                             len(self.populations))
+        self.rowIndex = dict()
+        for i in range(len(self.variants)):
+            if self.variants[i] not in self.rowIndex:
+                self.rowIndex[self.variants[i]] = i
+
+        # max: the first population with the largest frequency above 0
+        maxFrequencies = np.where(np.isnan(self.frequencies), -np.inf, self.frequencies)
+        self.maxColumns = np.argmax(maxFrequencies, axis=1) if len(self.populations) else \
+            np.zeros(len(self.variants), dtype=np.int64)
+        self.maxFrequencies = maxFrequencies.max(axis=1, initial=0.0)
+        self.hasMax = self.maxFrequencies > 0.0
+        self.maxFrequencies[~self.hasMax] = 0.0
+        # min: the first population with the smallest non-zero frequency under noMinFrequency
+        minFrequencies = np.where(np.isnan(self.frequencies) | (self.frequencies == 0.0) |
+                                  (self.frequencies >= noMinFrequency), np.inf, self.frequencies)
+        self.minColumns = np.argmin(minFrequencies, axis=1) if len(self.populations) else \
+            np.zeros(len(self.variants), dtype=np.int64)
+        self.minFrequencies = minFrequencies.min(axis=1, initial=np.inf)
+        self.hasMin = np.isfinite(self.minFrequencies)
+        self.minFrequencies[~self.hasMin] = noMinFrequency
+
+    @classmethod
+    def fromDataFrame(cls, df, hgVersion):
+        variants = parseCoordinates(df[coordinateColumnBase + str(hgVersion)].reset_index(drop=True))
+        parsed = variants['POS'].notna().values
+        keys = [(str(c), p, str(r), str(a)) for c, p, r, a in
+                zip(variants['CHROM'][parsed], variants['POS'][parsed], variants['REF'][parsed],
+                    variants['ALT'][parsed])]
+        populations = [c for c in df.columns if gnomadColumnTag in c and frequencyColumnTag in c]
+        frequencies = np.empty((len(keys), len(populations)), dtype=np.float64)
+        for j in range(len(populations)):
+            frequencies[:, j] = toFloat(df[populations[j]].values[parsed])
+        return cls(keys, populations, frequencies)
+
+    @classmethod
+    def fromFile(cls, fileName, hgVersion):
+        return cls.fromDataFrame(pd.read_csv(fileName, sep='\t', header=0, dtype=str), hgVersion)
+
+    def __len__(self):
+        return len(self.rowIndex)
+
+    def __contains__(self, variant):
+        return variantKey(variant) in self.rowIndex
+
+    def row(self, variant):
+        return self.rowIndex.get(variantKey(variant))
+
+    def table(self):
+        # the annotations as a frame indexed by (CHROM, POS, REF, ALT), first row per variant
+        rows = sorted(self.rowIndex.values())
+        table = pd.DataFrame(self.frequencies[rows], columns=self.populations,
+                             index=pd.MultiIndex.from_tuples([self.variants[i] for i in rows],
+                                                             names=['CHROM', 'POS', 'REF', 'ALT']))
+        table.insert(0, 'maxPopulation', [self.populations[self.maxColumns[i]] if self.hasMax[i] else None
+                                          for i in rows])
+        table.insert(1, 'maxFrequency', self.maxFrequencies[rows])
+        table.insert(2, 'minPopulation', [self.populations[self.minColumns[i]] if self.hasMin[i] else noMinPopulation
+                                          for i in rows])
+        table.insert(3, 'minFrequency', self.minFrequencies[rows])
+        return table
+
+    def getMax(self, variant):
+        # {'frequency', 'population'} of the population with the highest frequency; 0.0 and None if none is above 0
+        i = self.row(variant)
+        if i is None or not self.hasMax[i]:
+            return {'frequency': 0.0, 'population': None}
+        return {'frequency': float(self.maxFrequencies[i]), 'population': self.populations[self.maxColumns[i]]}
+
+    def getMin(self, variant):
+        # {'frequency', 'population'} of the population with the lowest non-zero frequency; 1.1 and 0.0 if none
+        i = self.row(variant)
+        if i is None or not self.hasMin[i]:
+            return {'frequency': noMinFrequency, 'population': noMinPopulation}
+        return {'frequency': float(self.minFrequencies[i]), 'population': self.populations[self.minColumns[i]]}
+
+    def getFrequencies(self, variant, populations=None):
+        # {population: frequency} for the populations (default all) that have a frequency for the variant
+        i = self.row(variant)
+        if i is None:
+            return dict()
+        frequencies = dict()
+        for j in range(len(self.populations)):
+            if (populations is None or self.populations[j] in populations) and not np.isnan(self.frequencies[i, j]):
+                frequencies[self.populations[j]] = float(self.frequencies[i, j])
+        return frequencies
+
+    def getFrequency(self, variant, population, missing=0.0):
+        i = self.row(variant)
+        if i is None or population not in self.populations:
+            return missing
+        frequency = self.frequencies[i, self.populations.index(population)]
+        if np.isnan(frequency):
+            return missing
+        return float(frequency)
+
+
+# annotations per pathogenicity frame and hg version, built on first use. the frame is kept with its annotations
+# so its id() cannot be reused while the entry exists.
+annotationsPerFrame = dict()
+
+def getVariantAnnotations(df, hgVersion):
+    if (id(df), hgVersion) not in annotationsPerFrame:
+        annotationsPerFrame[(id(df), hgVersion)] = (df, VariantAnnotations.fromDataFrame(df, hgVersion))
+    return annotationsPerFrame[(id(df), hgVersion)][1]
@@ -0,0 +1,149 @@
+import numpy as np
+import carrierMatrix
+from carrierMatrix import variantClasses, homozygousCode
+
+# zygosity index of the count arrays
+hetero = 0
+homo = 1
+
+
+class ZygosityCounts(object):
+    # heterozygous and homozygous call counts of a carrier matrix per variant, per individual and class, per class,
+    # per sequencing center and per study, all from one pass (a few bincounts) over the matrix's stored calls, so
+    # the analyzer and report scripts that each used to walk the whole vpi dict share one scan. tile is a
+    # (sampleStart, sampleEnd, variantStart, variantEnd) block from partition.planTiles(); counts outside it are 0.
+    # seqCenters and studies, one per sample, replace the matrix's (e.g. from a sample annotation file).
+
+    def __init__(self, matrix, tile=None, seqCenters=None, studies=None):
+        self.matrix = matrix
+        numSamples, numVariants = matrix.shape
+        if tile is None:
+            tile = (0, numSamples, 0, numVariants)
+        sampleStart, sampleEnd, variantStart, variantEnd = tile
+        self.tile = tile
+        # the calls of the tile's samples are one slice of the CSR arrays
+        first, last = matrix.csr.indptr[sampleStart], matrix.csr.indptr[sampleEnd]
+        rows = np.repeat(np.arange(sampleStart, sampleEnd), np.diff(matrix.csr.indptr[sampleStart:sampleEnd + 1]))
+        columns = matrix.csr.indices[first:last]
+        zygosity = (matrix.csr.data[first:last] == homozygousCode).astype(np.int64)
+        inTile = (columns >= variantStart) & (columns < variantEnd)
+        rows, columns, zygosity = rows[inTile], columns[inTile], zygosity[inTile]
+        classes = matrix.classes[columns].astype(np.int64)
+
+        # variants x [hetero, homo] and samples x classes x [hetero, homo]
+        self.perVariant = np.bincount(columns * 2 + zygosity, minlength=2 * numVariants).reshape(numVariants, 2)
+        self.perSample = np.bincount((rows * len(variantClasses) + classes) * 2 + zygosity,
+                                     minlength=2 * len(variantClasses) * numSamples).reshape(
+            numSamples, len(variantClasses), 2)
+        self.samples = np.zeros(numSamples, dtype=bool)
+        self.samples[sampleStart:sampleEnd] = True
+        self.seqCenters = list(seqCenters) if seqCenters is not None else matrix.seqCenters
+        self.studies = list(studies) if studies is not None else matrix.studies
+        homozygous = zygosity == 1
+        self.homozygousRows = rows[homozygous]
+        self.homozygousColumns = columns[homozygous]
+
+    def __getstate__(self):
+        # only the counts are pickled (e.g. on their way back from a worker process); the matrix and annotations stay
+        # with the caller, which add()s the counts into its own ZygosityCounts
+        state = dict(self.__dict__)
+        for key in ['matrix', 'seqCenters', 'studies']:
+            state[key] = None
+        return state
+
+    def add(self, other):
+        # adds the counts of another tile of the same matrix
+        self.perVariant += other.perVariant
+        self.perSample += other.perSample
+        self.samples |= other.samples
+        self.homozygousRows = np.concatenate([self.homozygousRows, other.homozygousRows])
+        self.homozygousColumns = np.concatenate([self.homozygousColumns, other.homozygousColumns])
+        return self
+
+    def calledVariants(self):
+        # indices of the variants with at least one call, in matrix (coordinate) order
+        return np.nonzero(self.perVariant.sum(axis=1) > 0)[0]
+
+    def genotypeCounts(self):
+        # {class: {'homo': calls, 'hetero': calls}}
+        perClass = self.perSample.sum(axis=0)
+        return {variantClasses[c]: {'homo': int(perClass[c][homo]), 'hetero': int(perClass[c][hetero])}
+                for c in range(len(variantClasses))}
+
+    def frequenciesPerIndividual(self, ethnicities=None):
+        # {individual: {class: {'homo', 'hetero'}, 'ethnicity'}} of the individuals in the tile(s), the fpi the
+        # analyzer saves; ethnicities maps an individual to its gnomad population
+        frequenciesPerIndividual = dict()
+        for i in np.nonzero(self.samples)[0]:
+            individual = self.matrix.samples[i]
+            entry = dict()
+            for c in range(len(variantClasses)):
+                entry[variantClasses[c]] = {'homo': int(self.perSample[i][c][homo]),
+                                            'hetero': int(self.perSample[i][c][hetero])}
+            entry['ethnicity'] = ethnicities.get(individual) if ethnicities is not None else None
+            frequenciesPerIndividual[individual] = entry
+        return frequenciesPerIndividual
+
+    def variantsPerClass(self):
+        # ({variant: {'aa', 'Aa', 'AA'}} of the benign, pathogenic and vus variants), AA counting every other sample
+        numSamples = self.matrix.shape[0]
+        variantsPerClass = {'benign': dict(), 'pathogenic': dict(), 'vus': dict()}
+        for j in self.calledVariants():
+            heteroCount, homoCount = int(self.perVariant[j][hetero]), int(self.perVariant[j][homo])
+            variantsPerClass[variantClasses[self.matrix.classes[j]]][self.matrix.variants[j]] = \
+                {'aa': homoCount, 'Aa': heteroCount, 'AA': numSamples - (homoCount + heteroCount)}
+        return variantsPerClass['benign'], variantsPerClass['pathogenic'], variantsPerClass['vus']
+
+    def variantSets(self):
+        # {class: set of (c, p, r, a)} of the variants with a call
+        variants = {'benign': set(), 'pathogenic': set(), 'vus': set()}
+        for j in self.calledVariants():
+            variants[variantClasses[self.matrix.classes[j]]].add(self.matrix.variants[j])
+        return variants
+
+    def countsPer(self, groups):
+        # {group: {class: {'homo', 'hetero'}}} summed over the samples of each group (seqCenters or studies, one per
+        # sample), for the groups with at least one call, in the order the groups first appear
+        groupIndex = dict()
+        names = list()
+        codes = np.zeros(len(groups), dtype=np.int64)
+        for i in range(len(groups)):
+            # str() so NaN (an unannotated sample) is one group
+            key = str(groups[i])
+            if key not in groupIndex:
+                groupIndex[key] = len(names)
+                names.append(groups[i])
+            codes[i] = groupIndex[key]
+        totals = np.zeros((len(names), len(variantClasses), 2), dtype=np.int64)
+        np.add.at(totals, codes[self.samples], self.perSample[self.samples])
+        counts = dict()
+        for code in range(len(names)):
+            if totals[code].sum() == 0:
+                continue
+            counts[names[code]] = {variantClasses[c]: {'homo': int(totals[code][c][homo]),
+                                                       'hetero': int(totals[code][c][hetero])}
+                                   for c in range(len(variantClasses))}
+        return counts
+
+    def countsPerCenter(self):
+        return self.countsPer(self.seqCenters)
+
+    def countsPerStudy(self):
+        return self.countsPer(self.studies)
+
+    def homozygousCalls(self):
+        # (individual, (c, p, r, a), class, seqCenter, study) of every homozygous call, in individual order
+        order = np.lexsort((self.homozygousColumns, self.homozygousRows))
+        for i, j in zip(self.homozygousRows[order], self.homozygousColumns[order]):
+            yield (self.matrix.samples[i], self.matrix.variants[j], variantClasses[self.matrix.classes[j]],
+                   self.seqCenters[i], self.studies[i])
+
+
+def getZygosityCounts(variantsPerIndividual, sampleAnnotations=None):
+    # ZygosityCounts of a vpi dict (or of the view of a carrier matrix, which is not scanned again), with seqCenter
+    # and study taken from sampleAnnotations (a SampleAnnotations index) when one is given
+    matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(variantsPerIndividual)
+    if sampleAnnotations is None:
+        return ZygosityCounts(matrix)
+    seqCenters, studies = sampleAnnotations.join(matrix.samples)
+    return ZygosityCounts(matrix, seqCenters=seqCenters, studies=studies)
@@ -1,11 +1,12 @@
 import json
 import pandas as pd
 import logging
-import hail as hl
 import argparse
 import sys, os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from utils.coord2hgvs import coordinateMapper
+from cooccurrence.sampleAnnotations import SampleAnnotations
+from cooccurrence import hardyWeinberg
 
 logging.basicConfig()
 logger = logging.getLogger()
@@ -20,6 +21,7 @@ def parse_args():
 	parser.add_argument('-s', '--sites', help='variants sites file')
 	parser.add_argument('-o', '--output', help='output file')
 	parser.add_argument('-m', '--map', help='boolean map hgvs coords')
+	parser.add_argument('-a', '--anno', help='(optional) sample annotation file for study and center', default=None)
 	return parser.parse_args()
 
 def main():
@@ -59,8 +61,14 @@ def main():
 
 	mapHgvs = bool(int(parse_args().map))
 
+	sampleAnnotations = None
+	annoFileName = parse_args().anno
+	if not annoFileName is None:
+		logger.info('reading data from ' + annoFileName)
+		sampleAnnotations = SampleAnnotations.fromFile(annoFileName)
+
 	# get batch effect info
-	studyPerVariant, centersPerHomoVus = getStudyAndCenter(vpiDict)
+	studyPerVariant, centersPerHomoVus = getStudyAndCenter(vpiDict, sampleAnnotations)
 
 	variantsDict = getVariantStats(ipvDict, studyPerVariant, centersPerHomoVus, inList, outList)
 
@@ -118,7 +126,8 @@ def getVariantStats(ipvDict, studyPerVariant, centersPerHomoVus, inList, outList
 		variantsDict[v]['aa'] = aa
 		variantsDict[v]['Aa'] = Aa
 		variantsDict[v]['AA'] = AA
-		variantsDict[v]['hail_hweafp'] = hl.eval(hl.hardy_weinberg_test(int(AA),int(Aa),int(aa))).p_value
+		# the mid-p exact test hail's hardy_weinberg_test() does, under the key modelInGnomad.py reads
+		variantsDict[v]['hail_hweafp'] = float(hardyWeinberg.exactTest([int(AA)], [int(Aa)], [int(aa)])['hwe p'][0])
 		variantsDict[v]['F'] = F
 		variantsDict[v]['Z'] = Z
 		variantsDict[v]['p'] = p
@@ -130,36 +139,43 @@ def getVariantStats(ipvDict, studyPerVariant, centersPerHomoVus, inList, outList
 
 	return variantsDict
 
-def getStudyAndCenter(vpiDict):
+def getStudyAndCenter(vpiDict, sampleAnnotations=None):
 	# get batch effect info
+	# study and center come from each call in vpi, or from sampleAnnotations (a SampleAnnotations index of the
+	# sample annotation file) when one is given
 	centersPerHomoVus = dict()
 	studyPerVariant = dict()
 
 	for individual in vpiDict:
+		if sampleAnnotations is not None:
+			seqCenter, study = sampleAnnotations.get(individual)
 		for vus in vpiDict[individual]['benign']:
 			variant = vus[0]
-			seqCenter = vus[2]
+			if sampleAnnotations is None:
+				seqCenter, study = vus[2], vus[3]
 			v = str(tuple(variant)).replace("'", "").replace(" ", "")
 			if not v in centersPerHomoVus:
 				centersPerHomoVus[v] = set()
 			centersPerHomoVus[v].add(seqCenter)
-			studyPerVariant[v] = vus[3]
+			studyPerVariant[v] = study
 		for vus in vpiDict[individual]['pathogenic']:
 			variant = vus[0]
-			seqCenter = vus[2]
+			if sampleAnnotations is None:
+				seqCenter, study = vus[2], vus[3]
 			v = str(tuple(variant)).replace("'", "").replace(" ", "")
 			if not v in centersPerHomoVus:
 				centersPerHomoVus[v] = set()
 			centersPerHomoVus[v].add(seqCenter)
-			studyPerVariant[v] = vus[3]
+			studyPerVariant[v] = study
 		for vus in vpiDict[individual]['vus']:
 			variant = vus[0]
-			seqCenter = vus[2]
+			if sampleAnnotations is None:
+				seqCenter, study = vus[2], vus[3]
 			v = str(tuple(variant)).replace("'", "").replace(" ", "")
 			if not v in centersPerHomoVus:
 				centersPerHomoVus[v] = set()
 			centersPerHomoVus[v].add(seqCenter)
-			studyPerVariant[v] = vus[3]
+			studyPerVariant[v] = study
 
 	return studyPerVariant, centersPerHomoVus
 
@@ -1,8 +1,12 @@
 import json
 import logging
-import sys
+import sys, os
 from collections import defaultdict
 import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'cooccurrence'))
+from cooccurrence.sampleAnnotations import SampleAnnotations
+import zygosityCounts
 
 logging.basicConfig()
 logger = logging.getLogger()
@@ -28,101 +32,61 @@ class NpEncoder(json.JSONEncoder):
         else:
             return super(NpEncoder, self).default(obj)
 
-def findBatch(vpiDict, outDict):
-
-    for individual in vpiDict:
-        for vus in vpiDict[individual]['vus']:
-            variant = vus[0]
-            genotype = vus[1]
-            seqCenter = vus[2]
-            study = vus[3]
-            varStr = str(tuple(variant))
-            if not seqCenter in countsPerCenter:
-                countsPerCenter[seqCenter] = {'homoVUS': 0, 'heteroVUS': 0,
-                                              'homoBen': 0, 'heteroBen': 0,
-                                              'totalHomo': 0, 'totalHetero': 0,
-                                              'homoVUS_0': 0,
-                                              'homoVUS_0.1': 0, 'homoVUS_0.01': 0,
-                                              'homoVUS_0.001': 0, 'homoVUS_0.0001': 0,
-                                              'homoVUS_0.00001':0
-                                              }
-            if not study in countsPerStudy:
-                countsPerStudy[study] = {'homoVUS': 0, 'heteroVUS': 0,
-                                         'homoBen': 0, 'heteroBen': 0,
-                                         'totalHomo': 0, 'totalHetero': 0,
-                                         'homoVUS_0': 0,
-                                         'homoVUS_0.1': 0, 'homoVUS_0.01': 0,
-                                         'homoVUS_0.001': 0, 'homoVUS_0.0001': 0,
-                                         'homoVUS_0.00001': 0
-                                         }
-            if genotype == '3':
-                centersPerHomo[varStr].add(seqCenter)
-                studiesPerHomo[varStr].add(study)
-                countsPerCenter[seqCenter]['homoVUS'] += 1
-                countsPerCenter[seqCenter]['totalHomo'] += 1
-                countsPerStudy[study]['homoVUS'] += 1
-                countsPerStudy[study]['totalHomo'] += 1
-                if varStr in outDict['homozygous vus']:
-                    freq = 0.5 * (outDict['homozygous vus'][varStr]['maxPopFreq'] + outDict['homozygous vus'][varStr]['cohortFreq'])
-                    if freq <= 0.00001:
-                        countsPerCenter[seqCenter]['homoVUS_0.00001'] += 1
-                        countsPerStudy[study]['homoVUS_0.00001'] += 1
-                    elif freq <= 0.0001:
-                        countsPerCenter[seqCenter]['homoVUS_0.0001'] += 1
-                        countsPerStudy[study]['homoVUS_0.0001'] += 1
-                    elif freq <= 0.001:
-                        countsPerCenter[seqCenter]['homoVUS_0.001'] += 1
-                        countsPerStudy[study]['homoVUS_0.001'] += 1
-                    elif freq < 0.01:
-                        countsPerCenter[seqCenter]['homoVUS_0.01'] += 1
-                        countsPerStudy[study]['homoVUS_0.01'] += 1
-                    elif freq < 0.1:
-                        countsPerCenter[seqCenter]['homoVUS_0.1'] += 1
-                        countsPerStudy[study]['homoVUS_0.1'] += 1
-                    else:
-                        countsPerCenter[seqCenter]['homoVUS_0'] += 1
-                        countsPerStudy[study]['homoVUS_0'] += 1
-            else:
-                countsPerCenter[seqCenter]['heteroVUS'] += 1
-                countsPerCenter[seqCenter]['totalHetero'] += 1
-                countsPerStudy[study]['heteroVUS'] += 1
-                countsPerStudy[study]['totalHetero'] += 1
-
-
-        for ben in vpiDict[individual]['benign']:
-            variant = ben[0]
-            genotype = ben[1]
-            seqCenter = ben[2]
-            study = ben[3]
-            varStr = str(tuple(variant))
-            if not seqCenter in countsPerCenter:
-                countsPerCenter[seqCenter] = {'homoVUS': 0, 'heteroVUS': 0,
-                                              'homoBen': 0, 'heteroBen': 0,
-                                              'totalHomo': 0, 'totalHetero': 0,
-                                              'homoVUS_0': 0,
-                                              'homoVUS_0.1': 0, 'homoVUS_0.01': 0,
-                                              'homoVUS_0.001': 0, 'homoVUS_0.0001': 0
-                                              }
-            if not study in countsPerStudy:
-                countsPerStudy[study] = {'homoVUS': 0, 'heteroVUS': 0,
-                                         'homoBen': 0, 'heteroBen': 0,
-                                         'homoVUS_0': 0,
-                                         'totalHomo': 0, 'totalHetero': 0,
-                                         'homoVUS_0.1': 0, 'homoVUS_0.01': 0,
-                                         'homoVUS_0.001': 0, 'homoVUS_0.0001': 0
-                                         }
-            if genotype == '3':
-                centersPerHomo[varStr].add(seqCenter)
-                studiesPerHomo[varStr].add(study)
-                countsPerCenter[seqCenter]['homoBen'] += 1
-                countsPerCenter[seqCenter]['totalHomo'] += 1
-                countsPerStudy[study]['homoBen'] += 1
-                countsPerStudy[study]['totalHomo'] += 1
-            else:
-                countsPerCenter[seqCenter]['heteroBen'] += 1
-                countsPerCenter[seqCenter]['totalHetero'] += 1
-                countsPerStudy[study]['heteroBen'] += 1
-                countsPerStudy[study]['totalHetero'] += 1
+def newBatchCounts():
+    return {'homoVUS': 0, 'heteroVUS': 0,
+            'homoBen': 0, 'heteroBen': 0,
+            'totalHomo': 0, 'totalHetero': 0,
+            'homoVUS_0': 0,
+            'homoVUS_0.1': 0, 'homoVUS_0.01': 0,
+            'homoVUS_0.001': 0, 'homoVUS_0.0001': 0,
+            'homoVUS_0.00001': 0
+            }
+
+def getFrequencyBin(freq):
+    if freq <= 0.00001:
+        return 'homoVUS_0.00001'
+    elif freq <= 0.0001:
+        return 'homoVUS_0.0001'
+    elif freq <= 0.001:
+        return 'homoVUS_0.001'
+    elif freq < 0.01:
+        return 'homoVUS_0.01'
+    elif freq < 0.1:
+        return 'homoVUS_0.1'
+    else:
+        return 'homoVUS_0'
+
+def findBatch(vpiDict, outDict, sampleAnnotations=None):
+    # seqCenter and study come from each individual's calls in vpi, or from sampleAnnotations (a SampleAnnotations
+    # index of the sample annotation file) when one is given. the vus and benign counts per center and study come
+    # from one zygosityCounts pass over vpi; only the homozygous calls are walked one by one
+    counts = zygosityCounts.getZygosityCounts(vpiDict, sampleAnnotations)
+    for countsPerGroup, groupCounts in [(countsPerCenter, counts.countsPerCenter()),
+                                        (countsPerStudy, counts.countsPerStudy())]:
+        for group in groupCounts:
+            vus = groupCounts[group]['vus']
+            ben = groupCounts[group]['benign']
+            if vus['homo'] + vus['hetero'] + ben['homo'] + ben['hetero'] == 0:
+                continue
+            if not group in countsPerGroup:
+                countsPerGroup[group] = newBatchCounts()
+            countsPerGroup[group]['homoVUS'] += vus['homo']
+            countsPerGroup[group]['heteroVUS'] += vus['hetero']
+            countsPerGroup[group]['homoBen'] += ben['homo']
+            countsPerGroup[group]['heteroBen'] += ben['hetero']
+            countsPerGroup[group]['totalHomo'] += vus['homo'] + ben['homo']
+            countsPerGroup[group]['totalHetero'] += vus['hetero'] + ben['hetero']
+
+    for individual, variant, variantClass, seqCenter, study in counts.homozygousCalls():
+        if variantClass == 'pathogenic':
+            continue
+        varStr = str(tuple(variant))
+        centersPerHomo[varStr].add(seqCenter)
+        studiesPerHomo[varStr].add(study)
+        if variantClass == 'vus' and varStr in outDict['homozygous vus']:
+            freq = 0.5 * (outDict['homozygous vus'][varStr]['maxPopFreq'] + outDict['homozygous vus'][varStr]['cohortFreq'])
+            countsPerCenter[seqCenter][getFrequencyBin(freq)] += 1
+            countsPerStudy[study][getFrequencyBin(freq)] += 1
 
     statList = ['homoVUS', 'heteroVUS', 'homoBen', 'heteroBen', 'homoVUS_0', 'totalHomo', 'totalHetero',
                 'homoVUS_0.1', 'homoVUS_0.01', 'homoVUS_0.001', 'homoVUS_0.0001']
@@ -138,8 +102,8 @@ def findBatch(vpiDict, outDict):
 
 def main():
     # read in vpi
-    if len(sys.argv) != 6:
-        print('usage: findBatchEffect 13-vpi.json 13-out.json 17-vpi.json 17-out.json output-dir')
+    if len(sys.argv) != 6 and len(sys.argv) != 7:
+        print('usage: findBatchEffect 13-vpi.json 13-out.json 17-vpi.json 17-out.json output-dir [sample-annotation-file]')
         sys.exit(1)
     vpi13FileName = sys.argv[1]
     out13FileName = sys.argv[2]
@@ -170,8 +134,13 @@ def main():
         out17Dict = json.load(f)
     f.close()
 
-    findBatch(vpi13Dict, out13Dict)
-    findBatch(vpi17Dict, out17Dict)
+    sampleAnnotations = None
+    if len(sys.argv) == 7:
+        logger.info('reading sample annotations from ' + sys.argv[6])
+        sampleAnnotations = SampleAnnotations.fromFile(sys.argv[6])
+
+    findBatch(vpi13Dict, out13Dict, sampleAnnotations)
+    findBatch(vpi17Dict, out17Dict, sampleAnnotations)
 
     with open(centersPerHomoOutputFileName, 'w') as f:
         json.dump(centersPerHomo, f, cls=NpEncoder)
@@ -1,5 +1,7 @@
-import sys
+import sys, os
 import json
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'cooccurrence'))
+import zygosityCounts
 
 def main():
     if len(sys.argv) != 2:
@@ -11,27 +13,12 @@ def main():
         vpiDict = json.load(f)
     f.close()
 
-    for individual in vpiDict:
-        homozygousCount = 0
-        heterozygousCount = 0
-        for b in vpiDict[individual]['benign']:
-            # b = [[13, 32325741, 'C', 'T'], '3']
-            if list(b)[1] == '3':
-                homozygousCount += 1
-            else:
-                heterozygousCount += 1
-
-        for v in vpiDict[individual]['vus']:
-            if list(v)[1] == '3':
-                homozygousCount += 1
-            else:
-                heterozygousCount += 1
-
-        for p in vpiDict[individual]['pathogenic']:
-            if list(p)[1] == '3':
-                homozygousCount += 1
-            else:
-                heterozygousCount += 1
+    # homozygous and heterozygous calls per individual over all classes, from one zygosityCounts pass over vpi
+    counts = zygosityCounts.getZygosityCounts(vpiDict)
+    for i in range(len(counts.matrix.samples)):
+        individual = counts.matrix.samples[i]
+        homozygousCount = int(counts.perSample[i, :, zygosityCounts.homo].sum())
+        heterozygousCount = int(counts.perSample[i, :, zygosityCounts.hetero].sum())
 
         print('individual: ' + str(individual) + ',homo: ' + str(homozygousCount) + ',hetero:' + str(heterozygousCount) +
               ',fraction:' + str(float(homozygousCount)/float(homozygousCount + heterozygousCount)))
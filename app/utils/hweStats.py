@@ -1,12 +1,15 @@
-import subprocess
 import scipy.stats as stats
-import hail
 import argparse
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from cooccurrence import hardyWeinberg
+from cooccurrence import fisherExact
 
 class hweStats():
 
     def hailHWTest(AA, Aa, aa):
-        return hail.eval(hail.hardy_weinberg_test(AA, Aa, aa)).p_value
+        # the mid-p exact test hail.hardy_weinberg_test() does, without hail and its JVM
+        return float(hardyWeinberg.exactTest([AA], [Aa], [aa])['hwe p'][0])
 
     def getFisherExact(a, b, c, d):
         # create 2x2 contingency table
@@ -23,17 +26,8 @@ class hweStats():
         CI95_lower = exp(lowerBound)
         CI95_upper = exp(upperBound)'''
 
-        # use R fisher.test to get confidence interval for LOR
-        row1 = str('c(' + str(a) + ',' + str(b) + ')')
-        row2 = str('c(' + str(c) + ',' + str(d) + ')')
-        CIcmd_1 = str('/usr/bin/Rscript -e "fisher.test(rbind(' + row1 + ',' +  row2 + '))"')
-        CIcmd_2 = str('| grep -A1 confidence | sed -n "2,2 p" | xargs')
-        CIcmd = str(CIcmd_1 + CIcmd_2)
-        lb, ub = subprocess.check_output(CIcmd, shell=True).split()
-
-        # cast result = b'0.002439905 19.594803004\n' to floats
-        lb = float(lb)
-        ub = float(ub)
+        # confidence interval for the odds ratio the way R's fisher.test() computes it
+        estimate, exactPValue, (lb, ub) = fisherExact.fisherTest(a, b, c, d)
 
         # insert OR and p-value into results dict
         roundedOR = round(oddsRatio, 3)
@@ -87,7 +81,7 @@ def main():
     Aa = int(options.Aa)
     aa = int(options.aa)
 
-    print('fisher exact p-value: ' + str(hweStats.hailHWTest(AA, Aa, aa)))
+    print('hwe exact p-value: ' + str(hweStats.hailHWTest(AA, Aa, aa)))
     print('chi-square statistic: ' + str(hweStats.hardyWeinbergChiSquareTest(AA, Aa, aa, 0.5)))
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app', 'cooccurrence'))
+import carrierArchive
+import carrierMatrix
+import cooccurrenceAnalyzer
+import cooccurrenceFinder
+import hardyWeinberg
+import profiling
+import syntheticCohort
+
+logging.basicConfig()
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+goldenDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+hgVersion = 38
+ensemblRelease = 99
+p2 = 0.001
+# the analyzer's continuity correction and F significance
+c = 0.5
+significance = 0.01
+
+# (samples, sites) per benchmark scale; tiny is the one the tests run
+scales = {'tiny': (200, 100),
+          'small': (1000, 100),
+          'medium': (10000, 2000),
+          'large': (50000, 10000),
+          'xlarge': (200000, 50000)}
+
+# summary counts of a run that are checked against its golden results
+countKeys = ['samples', 'benign variants', 'pathogenic variants', 'vus', 'cooccurring vus', 'homozygous vus']
+
+
+def getBenchmarkName(numSamples, numSites, phased, seed):
+    return 's' + str(numSamples) + '-v' + str(numSites) + '-' + ('phased' if phased else 'unphased') + '-seed' + \
+           str(seed)
+
+@contextlib.contextmanager
+def stubGeneModel():
+    # the synthetic gene model in place of the pyensembl release for the run, and whatever was there put back
+    # afterwards, so nothing is downloaded and no pyensembl cache is needed
+    key = (ensemblRelease, syntheticCohort.geneName)
+    release = cooccurrenceFinder.ensemblReleases.get(ensemblRelease)
+    geneIndex = cooccurrenceFinder.geneIndexes.pop(key, None)
+    cooccurrenceFinder.ensemblReleases[ensemblRelease] = syntheticCohort.getGeneModel()
+    try:
+        yield
+    finally:
+        cooccurrenceFinder.geneIndexes.pop(key, None)
+        if geneIndex is not None:
+            cooccurrenceFinder.geneIndexes[key] = geneIndex
+        if release is None:
+            del cooccurrenceFinder.ensemblReleases[ensemblRelease]
+        else:
+            cooccurrenceFinder.ensemblReleases[ensemblRelease] = release
+
+def canonical(obj):
+    # a json-able copy of obj that does not depend on set order (sets are written as lists, so lists of strings or
+    # of lists are sorted) or on float round-off past 10 significant digits; NaN becomes None
+    if isinstance(obj, dict):
+        return {str(k): canonical(obj[k]) for k in obj}
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = [canonical(v) for v in obj]
+        if items and (all(isinstance(v, str) for v in items) or all(isinstance(v, list) for v in items)):
+            items = sorted(items, key=lambda v: json.dumps(v, sort_keys=True))
+        return items
+    elif isinstance(obj, bool) or obj is None or isinstance(obj, str):
+        return obj
+    elif isinstance(obj, float) or hasattr(obj, 'dtype') and obj.dtype.kind == 'f':
+        if math.isnan(obj):
+            return None
+        return float('%.10g' % obj)
+    elif hasattr(obj, 'dtype') and obj.dtype.kind in 'iu':
+        return int(obj)
+    return obj
+
+def digest(obj):
+    return hashlib.sha1(json.dumps(canonical(obj), sort_keys=True).encode('utf-8')).hexdigest()
+
+def readJSON(fileName):
+    with open(fileName, 'r') as f:
+        obj = json.load(f)
+    f.close()
+    return obj
+
+def runBenchmark(directory, numSamples, numSites, phased, seed=0, numProcs=2, engine='vectorized',
+                 splitMode='auto'):
+    # generates a cohort in directory, runs the finder on it and the analyzer's Hardy-Weinberg stages on the
+    # finder's output, every step a profiling stage. returns the run's golden results (counts and digests of every
+    # output); the timings are in profiling.profiler
+    profiling.profiler.reset()
+    with profiling.stage('makeCohort()') as record:
+        fileNames = syntheticCohort.makeCohort(os.path.join(directory, 'cohort'), numSamples, numSites, phased, seed)
+        record.count(samples=numSamples, sites=numSites)
+
+    outputs = {name: os.path.join(directory, name + '.json') for name in ['ipv', 'vpi', 'all', 'out', 'tout']}
+    with stubGeneModel():
+        summary = cooccurrenceFinder.run(hgVersion, ensemblRelease, syntheticCohort.geneChromosome,
+                                         syntheticCohort.geneName, phased, p2, fileNames['vcf'], numProcs,
+                                         fileNames['pathogenicity'], directory, outputs['ipv'], outputs['vpi'],
+                                         outputs['all'], None, outputs['out'], outputs['tout'], True, None, None,
+                                         fileNames['gnomad'], engine, None, None, None, splitMode)
+
+    # the analyzer's Hardy-Weinberg stages, on the vpi file the way its main() reads it
+    with profiling.stage('loadVariantsPerIndividual()') as record:
+        vpiDict = carrierArchive.loadVariantsPerIndividual(outputs['vpi'])
+        record.count(samples=len(vpiDict))
+    with profiling.stage('calculateZygosityFrequenciesPerVariant()') as record:
+        bVars, pVars, vVars = cooccurrenceAnalyzer.calculateZygosityFrequenciesPerVariant(vpiDict)
+        record.count(variants=len(bVars) + len(pVars) + len(vVars))
+    with profiling.stage('hardyWeinbergChiSquareTest()') as record:
+        bVars, pVars, vVars = cooccurrenceAnalyzer.hardyWeinbergChiSquareTest(bVars, pVars, vVars, len(vpiDict), c)
+        record.count(variants=len(bVars) + len(pVars) + len(vVars))
+    with profiling.stage('hardyWeinbergStatistics()') as record:
+        bVars, pVars, vVars = cooccurrenceAnalyzer.hardyWeinbergStatistics(bVars, pVars, vVars, significance)
+        record.count(variants=len(bVars) + len(pVars) + len(vVars))
+    # the engine getHardyWeinbergStats() runs on, on the genotype counts of all variants at once
+    with profiling.stage('hardyWeinbergTest()') as record:
+        matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpiDict)
+        heteroCounts, homoCounts = matrix.genotypeCounts()
+        hardyWeinberg.hardyWeinbergTest(len(vpiDict) - (heteroCounts + homoCounts), heteroCounts, homoCounts,
+                                        len(vpiDict), c, significance)
+        record.count(variants=matrix.shape[1])
+    with profiling.stage('exactTest()') as record:
+        hardyWeinberg.exactTest(len(vpiDict) - (heteroCounts + homoCounts), heteroCounts, homoCounts)
+        record.count(variants=matrix.shape[1], tables=hardyWeinberg.getExactTables.cache_info().currsize)
+    hardyWeinbergStats = {'benign': bVars, 'pathogenic': pVars, 'vus': vVars}
+
+    counts = {key: summary[key] for key in countKeys}
+    for variantClass in hardyWeinbergStats:
+        counts[variantClass + ' rejecting hw'] = len([v for v in hardyWeinbergStats[variantClass].values()
+                                                      if v['accept hw'] is False])
+    digests = {name: digest(readJSON(outputs[name])) for name in ['vpi', 'ipv', 'all', 'out']}
+    digests['hardy weinberg'] = digest(hardyWeinbergStats)
+    return {'name': getBenchmarkName(numSamples, numSites, phased, seed), 'samples': numSamples, 'sites': numSites,
+            'phased': phased, 'seed': seed, 'counts': counts, 'digests': digests}
+
+def getGoldenFileName(name):
+    return os.path.join(goldenDir, name + '.json')
+
+def checkGolden(results):
+    # the names of the counts and digests that differ from the stored golden results, or None if there are no golden
+    # results for this benchmark
+    fileName = getGoldenFileName(results['name'])
+    if not os.path.exists(fileName):
+        logger.warning('no golden results for ' + results['name'] + ' in ' + fileName)
+        return None
+    golden = readJSON(fileName)
+    mismatches = list()
+    for group in ['counts', 'digests']:
+        for key in sorted(set(golden[group]) | set(results[group])):
+            if golden[group].get(key) != results[group].get(key):
+                logger.error(group + ' ' + key + ' is ' + str(results[group].get(key)) + ', golden is ' +
+                             str(golden[group].get(key)))
+                mismatches.append(key)
+    return mismatches
+
+def saveGolden(results):
+    fileName = getGoldenFileName(results['name'])
+    logger.info('saving golden results to ' + fileName)
+    with open(fileName, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+        f.write('\n')
+    f.close()
+
+def logStages(metrics):
+    logger.info('%-45s %10s %10s %10s  %s' % ('stage', 'wall s', 'cpu s', 'rss mb', 'counts'))
+    for record in metrics['stages']:
+        name = record['name'] if record['parent'] is None else '  ' + record['name']
+        logger.info('%-45s %10.3f %10.3f %10.1f  %s' % (name, record['wall time'],
+                                                        record['cpu time'] + record['children cpu time'],
+                                                        record['peak rss mb'] or 0.0, record['counts']))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", dest="scale", help="Benchmark scale: " + ', '.join(
+        name + ' (' + str(scales[name][0]) + ' samples x ' + str(scales[name][1]) + ' sites)' for name in scales) +
+                        ". Default=small", choices=list(scales), default='small')
+    parser.add_argument("--samples", dest="samples", help="Number of samples, in place of the scale's. Default=None",
+                        default=None)
+    parser.add_argument("--sites", dest="sites", help="Number of sites, in place of the scale's. Default=None",
+                        default=None)
+    parser.add_argument("--phased", dest="phased", help="Phased genotypes. Default=True", default='True')
+    parser.add_argument("--seed", dest="seed", help="Random seed of the synthetic cohort. Default=0", default=0)
+    parser.add_argument("--n", dest="n", help="Number of processes. Default=2", default=2)
+    parser.add_argument("--engine", dest="engine", help="Genotype engine (loop or vectorized). Default=vectorized",
+                        choices=['loop', 'vectorized'], default='vectorized')
+    parser.add_argument("--split", dest="split", help="Split work by samples, variants, tiles or auto. Default=auto",
+                        default='auto')
+    parser.add_argument("--out", dest="out", help="Directory for the cohort, outputs and metrics. "
+                                                  "Default=benchmark-output", default='benchmark-output')
+    parser.add_argument("--update", dest="update", help="Save the results as the golden results instead of "
+                                                        "checking them. Default=False", default='False')
+    return parser.parse_args()
+
+def main():
+    options = parse_args()
+    numSamples, numSites = scales[options.scale]
+    if options.samples is not None:
+        numSamples = int(options.samples)
+    if options.sites is not None:
+        numSites = int(options.sites)
+    phased = cooccurrenceFinder.str2bool(options.phased)
+
+    results = runBenchmark(options.out, numSamples, numSites, phased, int(options.seed), int(options.n),
+                           options.engine, options.split)
+    metrics = profiling.profiler.metrics()
+    logStages(metrics)
+
+    if cooccurrenceFinder.str2bool(options.update):
+        saveGolden(results)
+        mismatches = None
+    else:
+        mismatches = checkGolden(results)
+    metrics['benchmark'] = results
+    metrics['golden mismatches'] = mismatches
+    metricsFileName = os.path.join(options.out, results['name'] + '-metrics.json')
+    logger.info('saving metrics to ' + metricsFileName)
+    with open(metricsFileName, 'w') as f:
+        json.dump(metrics, f, indent=4)
+    f.close()
+    if mismatches:
+        logger.error(results['name'] + ' does not match its golden results: ' + ', '.join(mismatches))
+        sys.exit(1)
+    elif mismatches is not None:
+        logger.info(results['name'] + ' matches its golden results')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import logging
+import os
+import numpy as np
+
+logging.basicConfig()
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# a BRCA2-sized gene on chr13 (hg38) with 27 exons. the gene name is made up so a synthetic run is never mistaken
+# for a real one, and the stub ensembl release below is the only gene model it needs
+geneName = 'SYNTH1'
+geneChromosome = '13'
+geneStart = 32315474
+geneEnd = 32400266
+numExons = 27
+exonLength = 300
+
+# share of the cohort's sites in each class of the pathogenicity file; the rest are not in it (unclassified)
+classShares = [('Pathogenic', 0.05), ('Benign', 0.15), ('Uncertain_significance', 0.5)]
+# pathogenic variants are rarer than the rest
+maxPathogenicFrequency = 1e-3
+maxFrequency = 0.5
+# share of the cohort's sites that are gnomad sites, and of gnomad sites that are not in the cohort
+gnomadShare = 0.85
+gnomadExtraShare = 0.1
+gnomadPopulations = ['afr', 'amr', 'asj', 'eas', 'fin', 'nfe', 'sas']
+gnomadAlleleNumber = 152000
+
+bases = np.array(['A', 'C', 'G', 'T'])
+phasedCalls = np.array([b'0|0\t', b'0|1\t', b'1|0\t', b'1|1\t'], dtype='S4')
+unphasedCalls = np.array([b'0/0\t', b'0/1\t', b'0/1\t', b'1/1\t'], dtype='S4')
+
+
+class StubGene(object):
+    def __init__(self, name, contig, start, end):
+        self.gene_name = name
+        self.contig = contig
+        self.start = start
+        self.end = end
+
+
+class StubEnsemblRelease(object):
+    # the two pyensembl.EnsemblRelease queries the finder makes (genes_by_name() for the gene index and
+    # exons_at_locus() for isExonic()), answered from the synthetic gene model without a pyensembl cache or network
+    def __init__(self, genes, exons):
+        self.genes = genes
+        self.exons = exons
+
+    def genes_by_name(self, name):
+        genes = [g for g in self.genes if g.gene_name == name]
+        if not genes:
+            raise ValueError('gene not found: ' + str(name))
+        return genes
+
+    def exons_at_locus(self, contig, position):
+        return [e for e in self.exons if str(e.contig) == str(contig) and e.start <= position <= e.end]
+
+
+def getGeneModel():
+    # the gene and its exons, spread evenly over the gene
+    exonStarts = np.linspace(geneStart, geneEnd - exonLength, numExons).astype(np.int64)
+    exons = [StubGene(geneName, geneChromosome, int(s), int(s) + exonLength - 1) for s in exonStarts]
+    return StubEnsemblRelease([StubGene(geneName, geneChromosome, geneStart, geneEnd)], exons)
+
+def sampleFrequencies(rng, numSites, low, high):
+    # neutral site frequency spectrum: density proportional to 1/f, i.e. log-uniform between low and high, so most
+    # sites are rare and a few are common
+    return np.exp(rng.uniform(np.log(low), np.log(high), numSites))
+
+def sampleCarriers(rng, numSamples, numCarriers):
+    # numCarriers distinct samples; rejection sampling for the rare sites instead of a permutation of the cohort
+    if numCarriers > numSamples // 4:
+        return rng.permutation(numSamples)[:numCarriers]
+    carriers = np.unique(rng.randint(0, numSamples, numCarriers))
+    while len(carriers) < numCarriers:
+        carriers = np.unique(np.concatenate([carriers, rng.randint(0, numSamples, numCarriers - len(carriers))]))
+    return rng.permutation(carriers)
+
+def makeSites(rng, numSamples, numSites):
+    # positions, ref/alt, class and cohort allele frequency of each site
+    if numSites > geneEnd - geneStart + 1:
+        raise ValueError('gene ' + geneName + ' has room for ' + str(geneEnd - geneStart + 1) + ' sites, not ' +
+                         str(numSites))
+    positions = np.sort(geneStart + rng.choice(geneEnd - geneStart + 1, numSites, replace=False))
+    refs = rng.randint(0, 4, numSites)
+    alts = (refs + rng.randint(1, 4, numSites)) % 4
+    shares = np.cumsum([share for name, share in classShares])
+    draws = rng.uniform(0, 1, numSites)
+    classes = np.full(numSites, None, dtype=object)
+    for i in reversed(range(len(classShares))):
+        classes[draws < shares[i]] = classShares[i][0]
+    minFrequency = 1.0 / (2 * numSamples)
+    frequencies = sampleFrequencies(rng, numSites, minFrequency, maxFrequency)
+    pathogenic = classes == 'Pathogenic'
+    frequencies[pathogenic] = sampleFrequencies(rng, int(pathogenic.sum()), minFrequency,
+                                                max(maxPathogenicFrequency, 2 * minFrequency))
+    return {'POS': positions, 'REF': bases[refs], 'ALT': bases[alts], 'class': classes, 'AF': frequencies}
+
+def sampleGenotypes(rng, numSamples, frequency):
+    # genotype codes (0 ref, 1 0|1, 2 1|0, 3 1|1) of one site under Hardy-Weinberg proportions
+    numHomozygous = rng.binomial(numSamples, frequency ** 2)
+    numHeterozygous = rng.binomial(numSamples - numHomozygous, min(1.0, 2 * frequency * (1 - frequency) /
+                                                                   max(1e-300, 1 - frequency ** 2)))
+    carriers = sampleCarriers(rng, numSamples, numHomozygous + numHeterozygous)
+    codes = np.zeros(numSamples, dtype=np.int8)
+    codes[carriers[:numHomozygous]] = 3
+    codes[carriers[numHomozygous:]] = 1 + rng.randint(0, 2, numHeterozygous)
+    return codes
+
+def writeVCF(fileName, rng, samples, sites, phased):
+    # one row at a time, each row a lookup of 4-byte calls, so a 200k-sample cohort never holds more than a row
+    calls = phasedCalls if phased else unphasedCalls
+    with open(fileName, 'wb') as f:
+        f.write(b'##fileformat=VCFv4.2\n')
+        f.write(('##contig=<ID=chr' + geneChromosome + '>\n').encode('ascii'))
+        f.write(b'##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write(('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t' + '\t'.join(samples) +
+                 '\n').encode('ascii'))
+        for i in range(len(sites['POS'])):
+            f.write(('chr' + geneChromosome + '\t' + str(sites['POS'][i]) + '\t.\t' + sites['REF'][i] + '\t' +
+                     sites['ALT'][i] + '\t.\tPASS\t.\tGT\t').encode('ascii'))
+            row = calls[sampleGenotypes(rng, len(samples), sites['AF'][i])].tobytes()
+            f.write(row[:-1] + b'\n')
+    f.close()
+
+def writePathogenicity(fileName, sites):
+    # the BRCA Exchange / ClinVar layout findVariants() reads: class, hg37 and hg38 coordinates
+    with open(fileName, 'w') as f:
+        f.write('Clinical_significance\tGenomic_Coordinate_hg37\tGenomic_Coordinate_hg38\n')
+        for i in range(len(sites['POS'])):
+            if sites['class'][i] is not None:
+                f.write(sites['class'][i] + '\t-\tchr' + geneChromosome + ':' + str(sites['POS'][i]) + ':' +
+                        sites['REF'][i] + '>' + sites['ALT'][i] + '\n')
+    f.close()
+
+def writeGnomadSites(fileName, rng, sites):
+    # a gnomad sites VCF for most of the cohort's sites, plus sites the cohort does not have. gnomad frequencies
+    # scatter around the cohort's
+    inGnomad = rng.uniform(0, 1, len(sites['POS'])) < gnomadShare
+    positions = list(sites['POS'][inGnomad])
+    refs = list(sites['REF'][inGnomad])
+    alts = list(sites['ALT'][inGnomad])
+    # extra sites are at positions the cohort has no site at, so no gnomad site is listed twice
+    extraPositions = geneStart + rng.randint(0, geneEnd - geneStart + 1, int(gnomadExtraShare * len(positions)))
+    extraPositions = np.unique(extraPositions[~np.isin(extraPositions, sites['POS'])])
+    numExtra = len(extraPositions)
+    extraRefs = rng.randint(0, 4, numExtra)
+    positions += list(extraPositions)
+    refs += list(bases[extraRefs])
+    alts += list(bases[(extraRefs + rng.randint(1, 4, numExtra)) % 4])
+    frequencies = np.clip(np.concatenate([sites['AF'][inGnomad], sampleFrequencies(rng, numExtra, 1e-6, 1e-2)]) *
+                          rng.lognormal(0.0, 0.5, len(positions)), 1.0 / gnomadAlleleNumber, 1.0)
+    order = np.argsort(positions, kind='stable')
+    with open(fileName, 'w') as f:
+        f.write('##fileformat=VCFv4.2\n')
+        for key, number, kind, description in [('AC', 'A', 'Integer', 'Alternate allele count'),
+                                               ('AN', '1', 'Integer', 'Total number of alleles'),
+                                               ('AF', 'A', 'Float', 'Alternate allele frequency'),
+                                               ('popmax', 'A', 'String', 'Population with maximum AF'),
+                                               ('faf95_popmax', 'A', 'Float', 'Filtering allele frequency')]:
+            f.write('##INFO=<ID=' + key + ',Number=' + number + ',Type=' + kind + ',Description="' + description +
+                    '">\n')
+        f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        for i in order:
+            ac = max(1, int(round(frequencies[i] * gnomadAlleleNumber)))
+            popmax = gnomadPopulations[rng.randint(0, len(gnomadPopulations))]
+            info = ['AC=' + str(ac), 'AN=' + str(gnomadAlleleNumber), 'AF=' + '%.6g' % (ac / gnomadAlleleNumber),
+                    'popmax=' + popmax, 'faf95_popmax=' + '%.6g' % (0.8 * ac / gnomadAlleleNumber)]
+            for population in gnomadPopulations:
+                an = gnomadAlleleNumber // len(gnomadPopulations)
+                info += ['AC_' + population + '=' + str(rng.binomial(an, min(1.0, ac / gnomadAlleleNumber))),
+                         'AN_' + population + '=' + str(an)]
+            f.write('chr' + geneChromosome + '\t' + str(positions[i]) + '\t.\t' + refs[i] + '\t' + alts[i] +
+                    '\t.\tPASS\t' + ';'.join(info) + '\n')
+    f.close()
+
+def getCohortFileNames(directory):
+    return {'vcf': os.path.join(directory, 'cohort.vcf'),
+            'pathogenicity': os.path.join(directory, 'pathogenicity.tsv'),
+            'gnomad': os.path.join(directory, 'gnomad-sites.vcf')}
+
+def makeCohort(directory, numSamples, numSites, phased, seed=0):
+    # writes a cohort VCF, its pathogenicity file and a gnomad sites file to directory; the same arguments always
+    # give the same files
+    rng = np.random.RandomState(seed)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    fileNames = getCohortFileNames(directory)
+    samples = ['S' + str(i).zfill(7) for i in range(numSamples)]
+    sites = makeSites(rng, numSamples, numSites)
+    logger.info('writing ' + str(numSamples) + ' samples x ' + str(numSites) + ' sites to ' + fileNames['vcf'])
+    writeVCF(fileNames['vcf'], rng, samples, sites, phased)
+    writePathogenicity(fileNames['pathogenicity'], sites)
+    writeGnomadSites(fileNames['gnomad'], rng, sites)
+    return fileNames
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", dest="samples", help="Number of samples. Default=1000", default=1000)
+    parser.add_argument("--sites", dest="sites", help="Number of variant sites. Default=100", default=100)
+    parser.add_argument("--phased", dest="phased", help="Write phased (0|1) or unphased (0/1) genotypes. Default=True",
+                        default='True')
+    parser.add_argument("--seed", dest="seed", help="Random seed. Default=0", default=0)
+    parser.add_argument("--out", dest="out", help="Output directory. Default=synthetic-cohort",
+                        default='synthetic-cohort')
+    return parser.parse_args()
+
+def main():
+    options = parse_args()
+    phased = options.phased.lower() in ['true', 't', 'yes', 'y', '1']
+    makeCohort(options.out, int(options.samples), int(options.sites), phased, int(options.seed))
+
+
+if __name__ == "__main__":
+    main()
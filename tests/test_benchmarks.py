@@ -0,0 +1,70 @@
+import filecmp
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+import cooccurrenceFinder
+import gnomadSites
+import runBenchmarks
+import syntheticCohort
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_makeCohort(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            first = syntheticCohort.makeCohort(os.path.join(tmpDir, 'a'), 300, 200, False, 7)
+            second = syntheticCohort.makeCohort(os.path.join(tmpDir, 'b'), 300, 200, False, 7)
+            for name in first:
+                with self.subTest(name=name):
+                    self.assertTrue(filecmp.cmp(first[name], second[name], shallow=False))
+            with open(first['vcf'], 'r') as f:
+                rows = [line.rstrip('\n').split('\t') for line in f if not line.startswith('##')]
+            f.close()
+            with self.subTest():
+                self.assertEqual(len(rows[0]), 9 + 300)
+            with self.subTest():
+                self.assertEqual(len(rows), 1 + 200)
+            with self.subTest():
+                self.assertEqual(set(call for row in rows[1:] for call in row[9:]), {'0/0', '0/1', '1/1'})
+            # most sites are rare
+            carriers = np.array([sum(call != '0/0' for call in row[9:]) for row in rows[1:]])
+            with self.subTest():
+                self.assertLess(np.median(carriers) / 300.0, 0.1)
+            gnomad = gnomadSites.GnomadSites.fromVCF(first['gnomad'])
+            with self.subTest():
+                self.assertEqual(len(gnomad.duplicates), 0)
+            with self.subTest():
+                self.assertGreater(len(gnomad), 0.8 * 200)
+
+    def test_stubGeneModel(self):
+        release = syntheticCohort.getGeneModel()
+        with self.subTest():
+            self.assertEqual(release.genes_by_name(syntheticCohort.geneName)[0].end, syntheticCohort.geneEnd)
+        with self.subTest():
+            self.assertEqual(len(release.exons_at_locus(13, syntheticCohort.geneStart)), 1)
+        with self.subTest():
+            self.assertEqual(len(release.exons_at_locus(13, syntheticCohort.geneStart + syntheticCohort.exonLength)),
+                             0)
+        with runBenchmarks.stubGeneModel():
+            with self.subTest():
+                self.assertTrue(cooccurrenceFinder.isExonic(runBenchmarks.ensemblRelease, '13',
+                                                            syntheticCohort.geneStart))
+        with self.subTest():
+            self.assertNotIn(runBenchmarks.ensemblRelease, cooccurrenceFinder.ensemblReleases)
+
+    def test_matchesGolden(self):
+        numSamples, numSites = runBenchmarks.scales['tiny']
+        for phased in [True, False]:
+            with tempfile.TemporaryDirectory() as tmpDir:
+                results = runBenchmarks.runBenchmark(tmpDir, numSamples, numSites, phased)
+            with self.subTest(phased=phased):
+                self.assertEqual(runBenchmarks.checkGolden(results), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import math
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import carrierArchive
+import carrierMatrix
+import cooccurrenceFinder
+import jsonWriter
+from tests.test_carrierMatrix import makeVPI
+from tests.test_cooccurrenceFinder import makeRandomVPI
+
+
+def makeIPV():
+    return {"('13', 100, 'A', 'G')": {'heterozygous individuals': {'s1'}, 'homozygous individuals': {'s3'},
+                                      'cohortFreq': 2 / 3, 'maxPop': 'nfe', 'maxFreq': '0.25', 'faf95': float('nan'),
+                                      'exonic': True},
+            "('13', 300, 'G', 'A')": {'heterozygous individuals': {'s3'}, 'homozygous individuals': {'s1'},
+                                      'cohortFreq': 2 / 3, 'maxPop': float('nan'), 'maxFreq': float('nan'),
+                                      'faf95': float('nan'), 'exonic': None},
+            "('13', 200, 'C', 'T')": {'heterozygous individuals': {'s3'}, 'homozygous individuals': set()}}
+
+
+def toJSON(obj):
+    # what json.load() gives back for obj after the finder saved it
+    return json.loads(json.dumps(obj, default=jsonWriter.jsonDefault))
+
+
+class TestCarrierArchive(unittest.TestCase):
+
+    def assertSameJSON(self, first, second):
+        # NaN != NaN, so compare the serialized forms
+        self.assertEqual(json.dumps(first, sort_keys=True), json.dumps(second, sort_keys=True))
+
+    def test_saveAndLoad(self):
+        vpi = makeVPI()
+        ipv = makeIPV()
+        tout = {'benign': {('13', 100, 'A', 'G')}, 'pathogenic': {('13', 200, 'C', 'T')}, 'vus': set()}
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'BRCA2-carriers.npz')
+            carrierArchive.save(fileName, carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpi), ipv, tout)
+            archive = carrierArchive.load(fileName)
+            with self.subTest():
+                self.assertEqual(toJSON(carrierArchive.loadVariantsPerIndividual(fileName)), toJSON(vpi))
+        with self.subTest():
+            self.assertEqual(list(archive.individualsPerVariant()), list(ipv))
+        with self.subTest():
+            self.assertSameJSON(archive.individualsPerVariant(), toJSON(ipv))
+        with self.subTest():
+            self.assertTrue(math.isnan(archive.individualsPerVariant()["('13', 300, 'G', 'A')"]['maxPop']))
+        with self.subTest():
+            self.assertEqual(toJSON(archive.allVariantsPerClass()),
+                             toJSON(cooccurrenceFinder.getAllVariantsPerClass(vpi)))
+        with self.subTest():
+            self.assertEqual(archive.variantsPerClass(), {'benign': [('13', 100, 'A', 'G')],
+                                                          'pathogenic': [('13', 200, 'C', 'T')], 'vus': []})
+
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            vpiFileName = os.path.join(tmpDir, 'BRCA2-vpi.json')
+            ipvFileName = os.path.join(tmpDir, 'BRCA2-ipv.json')
+            outFileName = os.path.join(tmpDir, 'BRCA2-carriers.npz')
+            for fileName, obj in [(vpiFileName, makeVPI()), (ipvFileName, makeIPV())]:
+                with open(fileName, 'w') as f:
+                    json.dump(obj, f, default=jsonWriter.jsonDefault)
+                f.close()
+            carrierArchive.convert(vpiFileName, outFileName, ipvFileName)
+            with self.subTest():
+                self.assertEqual(toJSON(carrierArchive.loadVariantsPerIndividual(outFileName)),
+                                 carrierArchive.loadVariantsPerIndividual(vpiFileName))
+            with self.subTest():
+                self.assertSameJSON(carrierArchive.loadIndividualsPerVariant(outFileName),
+                                    carrierArchive.loadIndividualsPerVariant(ipvFileName))
+            with self.subTest():
+                self.assertIsNone(carrierArchive.load(outFileName).variantsPerClass())
+
+    def test_iterateItems(self):
+        for text in ['{}', ' { } ', '{"a": [1, {"b": 2}], "c":{}}', '\n{\n  "a" : 1 ,\n  "b": "x, }"\n}\n']:
+            with self.subTest(text=text):
+                self.assertEqual(list(carrierArchive.iterateItems(text)), list(json.loads(text).items()))
+        with self.assertRaises(ValueError):
+            list(carrierArchive.iterateItems('[1, 2]'))
+
+    def test_loadCarrierMatrix(self):
+        # the json is read straight into the matrix fromVariantsPerIndividual() builds from its dict
+        for vpi in [makeVPI(), makeRandomVPI(30, 20, 6)]:
+            with tempfile.TemporaryDirectory() as tmpDir:
+                vpiFileName = os.path.join(tmpDir, 'vpi.json')
+                with open(vpiFileName, 'w') as f:
+                    json.dump(vpi, f, default=jsonWriter.jsonDefault)
+                f.close()
+                expected = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(toJSON(vpi))
+                matrix = carrierArchive.loadCarrierMatrix(vpiFileName)
+                archiveFileName = os.path.join(tmpDir, 'vpi.npz')
+                carrierArchive.save(archiveFileName, expected)
+                for loaded in [matrix, carrierArchive.loadCarrierMatrix(archiveFileName)]:
+                    with self.subTest(samples=len(vpi), archive=loaded is not matrix):
+                        self.assertEqual(loaded.samples, expected.samples)
+                        self.assertEqual(loaded.variants, expected.variants)
+                        self.assertEqual(loaded.classes.tolist(), expected.classes.tolist())
+                        self.assertEqual((loaded.csr != expected.csr).nnz, 0)
+                        self.assertEqual((loaded.seqCenters, loaded.studies), (expected.seqCenters, expected.studies))
+
+    def test_readCarrierMatrixDuplicates(self):
+        # a call listed twice for an individual is stored once, with its first code
+        vpi = toJSON(makeVPI())
+        vpi['s1']['vus'].append(vpi['s1']['vus'][0])
+        vpi['s3']['benign'].append([vpi['s3']['benign'][0][0], '1', 'c2', 'st2'])
+        with tempfile.TemporaryDirectory() as tmpDir:
+            vpiFileName = os.path.join(tmpDir, 'vpi.json')
+            with open(vpiFileName, 'w') as f:
+                json.dump(vpi, f)
+            f.close()
+            matrix = carrierArchive.readCarrierMatrix(vpiFileName)
+        expected = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(makeVPI())
+        with self.subTest():
+            self.assertEqual(matrix.csr.toarray().tolist(), expected.csr.toarray().tolist())
+        with self.subTest():
+            self.assertEqual(matrix.csr.nnz, expected.csr.nnz)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import carrierMatrix
+import cooccurrenceFinder
+import jsonWriter
+from tests.test_cooccurrenceFinder import ListQueue, makeVCF, fakeGenesForVariant
+
+
+def makeVPI():
+    return {'s1': {'benign': [(('13', 100, 'A', 'G'), '1', 'c1', 'st1')],
+                   'pathogenic': [],
+                   'vus': [(('13', 300, 'G', 'A'), '3', 'c1', 'st1')]},
+            's2': {'benign': [], 'pathogenic': [], 'vus': []},
+            's3': {'benign': [(('13', 100, 'A', 'G'), '3', 'c2', 'st2')],
+                   'pathogenic': [(('13', 200, 'C', 'T'), '2', 'c2', 'st2')],
+                   'vus': [(('13', 300, 'G', 'A'), '1', 'c2', 'st2')]}}
+
+
+class TestCarrierMatrix(unittest.TestCase):
+
+    def test_viewsMatchDicts(self):
+        vpi = makeVPI()
+        matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpi)
+        with self.subTest():
+            self.assertEqual(matrix.shape, (3, 3))
+        with self.subTest():
+            self.assertEqual(matrix.variantsPerIndividual(), vpi)
+        ipv = matrix.individualsPerVariant()
+        with self.subTest():
+            self.assertEqual(list(ipv), ["('13', 100, 'A', 'G')", "('13', 300, 'G', 'A')", "('13', 200, 'C', 'T')"])
+        with self.subTest():
+            self.assertEqual(ipv["('13', 300, 'G', 'A')"], {'heterozygous individuals': {'s3'},
+                                                            'homozygous individuals': {'s1'}})
+        # entries are built on each lookup and not kept; annotations go through annotate()
+        with self.subTest():
+            self.assertIsNot(ipv["('13', 300, 'G', 'A')"], ipv["('13', 300, 'G', 'A')"])
+        carrierMatrix.annotate(ipv, "('13', 300, 'G', 'A')", {'cohortFreq': 2 / 3})
+        with self.subTest():
+            self.assertRaises(KeyError, carrierMatrix.annotate, ipv, "('13', 400, 'T', 'C')", {'cohortFreq': 0})
+        with self.subTest():
+            self.assertEqual(json.loads(json.dumps(ipv, default=jsonWriter.jsonDefault))
+                             ["('13', 300, 'G', 'A')"]['cohortFreq'], 2 / 3)
+
+    def test_counts(self):
+        matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(makeVPI())
+        hetero, homo = matrix.genotypeCounts()
+        with self.subTest():
+            self.assertEqual((hetero.tolist(), homo.tolist()), ([1, 1, 1], [1, 0, 1]))
+        hetero, homo = matrix.genotypeCountsPerSample('vus')
+        with self.subTest():
+            self.assertEqual((hetero.tolist(), homo.tolist()), ([0, 0, 1], [1, 0, 0]))
+
+    def test_duplicateCalls(self):
+        # a repeated VCF record gives a sample the same variant twice; the first code is kept, not the sum
+        variants = [('13', 100, 'A', 'G'), ('13', 200, 'C', 'T')]
+        matrix = carrierMatrix.CarrierMatrix(['s1', 's2'], variants, [0, 2], [1, 0, 0, 1, 0],
+                                             [0, 1, 0, 0, 1], [3, 1, 3, 3, 2])
+        with self.subTest():
+            self.assertEqual(matrix.csr.toarray().tolist(), [[3, 1], [3, 0]])
+        hetero, homo = matrix.genotypeCounts()
+        with self.subTest():
+            self.assertEqual((hetero.tolist(), homo.tolist()), ([0, 1], [2, 0]))
+        vpi = makeVPI()
+        vpi['s3']['pathogenic'].append((('13', 200, 'C', 'T'), '1', 'c2', 'st2'))
+        with self.subTest():
+            self.assertEqual(carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpi).variantsPerIndividual(),
+                             makeVPI())
+
+    @mock.patch.object(cooccurrenceFinder, 'getGenesForVariant', fakeGenesForVariant)
+    def test_finderIndividualsPerVariant(self):
+        vcf = makeVCF()
+        benign = {('13', 100, 'A', 'G')}
+        pathogenic = {('13', 400, 'T', 'C')}
+        loopQueue = ListQueue()
+        cooccurrenceFinder.findVarsPerIndividual(loopQueue, vcf, benign, pathogenic, '13', 'BRCA2', 99, None, 0, 1)
+        vpi = cooccurrenceFinder.findVarsPerIndividualShared(vcf, benign, pathogenic, '13', 'BRCA2', 99, None, 2)
+        expected = cooccurrenceFinder.findIndividualsPerVariant(loopQueue[0], vcf, '13', None, 38, 99, 4, None)
+        ipv = cooccurrenceFinder.findIndividualsPerVariant(vpi, vcf, '13', None, 38, 99, 4, None)
+        with self.subTest():
+            self.assertEqual(list(ipv), list(expected))
+        with self.subTest():
+            self.assertEqual(ipv, expected)
+        with self.subTest():
+            self.assertEqual(cooccurrenceFinder.countHomozygousPerVus(vpi, None, 38, 99, 'BRCA2', None),
+                             cooccurrenceFinder.countHomozygousPerVus(loopQueue[0], None, 38, 99, 'BRCA2', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
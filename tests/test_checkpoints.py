@@ -0,0 +1,136 @@
+import io
+import os
+import pickle
+import sys
+import tarfile
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import carrierMatrix
+import checkpoints
+from tests.test_carrierMatrix import makeVPI
+
+
+class Counter(object):
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+class TestCheckpoints(unittest.TestCase):
+
+    def test_keys(self):
+        stages = checkpoints.Checkpoints()
+        df = pd.DataFrame({'a': ['1', '2']})
+        first = stages.stage('a', [1, {'x', 'y'}, df], None)
+        with self.subTest():
+            self.assertEqual(first.key, stages.stage('a', [1, {'y', 'x'}, df.copy()], None).key)
+        with self.subTest():
+            self.assertNotEqual(first.key, stages.stage('b', [1, {'x', 'y'}, df], None).key)
+        with self.subTest():
+            self.assertNotEqual(first.key, stages.stage('a', [1, {'x', 'y'}, pd.DataFrame({'a': ['1', '3']})],
+                                                        None).key)
+        with self.subTest():
+            # a stage stands for its key downstream
+            self.assertNotEqual(stages.stage('c', [first], None).key,
+                                stages.stage('c', [stages.stage('a', [2], None)], None).key)
+        with self.subTest():
+            self.assertNotEqual(checkpoints.fingerprint(np.array([1, 2])), checkpoints.fingerprint(np.array([1, 3])))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            directory = os.path.join(tmpDir, 'checkpoints')
+            archive = os.path.join(tmpDir, 'checkpoints.tar')
+            output = os.path.join(tmpDir, 'out.txt')
+            vpi = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(makeVPI()).variantsPerIndividual()
+            compute = Counter(vpi)
+            checkpoints.Checkpoints(directory, False, archive).stage('vpi', [1], compute).get()
+            checkpoints.Checkpoints(directory, True).stage('vpi', [2], compute).get()
+            with self.subTest():
+                # only the latest checkpoint of a stage is kept
+                self.assertEqual(len([f for f in os.listdir(directory) if f.endswith('.pkl')]), 1)
+            value = checkpoints.Checkpoints(directory, True).stage('vpi', [2], compute).get()
+            with self.subTest():
+                self.assertEqual(compute.calls, 2)
+            with self.subTest():
+                self.assertEqual(dict(value), dict(vpi))
+
+            # a checkpoint whose bytes do not match its digest is recomputed
+            stage = checkpoints.Checkpoints(directory, True).stage('vpi', [2], compute)
+            with open(checkpoints.Checkpoints(directory).fileName('vpi', stage.key), 'ab') as f:
+                f.write(b'x')
+            f.close()
+            stage.get()
+            with self.subTest():
+                self.assertEqual(compute.calls, 3)
+
+            # a stage's own output files must exist for its checkpoint to be reused
+            write = Counter('done')
+            checkpoints.Checkpoints(directory, True).stage('write', [], write, outputs=[output]).get()
+            checkpoints.Checkpoints(directory, True).stage('write', [], write, outputs=[output]).get()
+            with self.subTest():
+                self.assertEqual(write.calls, 2)
+            with open(output, 'w') as f:
+                f.write('done')
+            f.close()
+            checkpoints.Checkpoints(directory, True).stage('write', [], write, outputs=[output]).get()
+            with self.subTest():
+                self.assertEqual(write.calls, 2)
+
+            # the archive restores the first checkpoint into an empty directory
+            restored = os.path.join(tmpDir, 'restored')
+            value = checkpoints.Checkpoints(restored, True, archive).stage('vpi', [1], compute).get()
+            with self.subTest():
+                self.assertEqual(compute.calls, 3)
+            with self.subTest():
+                self.assertEqual(pickle.dumps(dict(value)), pickle.dumps(dict(vpi)))
+
+    def test_archive(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            directory = os.path.join(tmpDir, 'checkpoints')
+            archive = os.path.join(tmpDir, 'checkpoints.tar')
+            stages = checkpoints.Checkpoints(directory, False, archive)
+            first = stages.stage('a', [1], Counter(np.arange(10)))
+            first.get()
+            stages.stage('b', [1], Counter('b')).get()
+            with tarfile.open(archive, 'r') as tar:
+                names = tar.getnames()
+            tar.close()
+            with self.subTest():
+                # each checkpoint is appended once, not the whole directory again after every stage
+                self.assertEqual(names, ['a-' + first.key + '.pkl', 'a-' + first.key + '.pkl.sha1',
+                                         'b-' + stages.stage('b', [1], None).key + '.pkl',
+                                         'b-' + stages.stage('b', [1], None).key + '.pkl.sha1'])
+
+            # members that are not plain checkpoint files in the directory itself are not unpacked
+            with tarfile.open(archive, 'a') as tar:
+                for name in ['../escaped.pkl', os.path.join(tmpDir, 'absolute.pkl'), 'other.txt']:
+                    info = tarfile.TarInfo(name)
+                    info.size = 1
+                    tar.addfile(info, io.BytesIO(b'x'))
+                link = tarfile.TarInfo('link.pkl')
+                link.type = tarfile.SYMTYPE
+                link.linkname = '/etc/passwd'
+                tar.addfile(link)
+            tar.close()
+            restored = os.path.join(tmpDir, 'restored', 'checkpoints')
+            compute = Counter(None)
+            value = checkpoints.Checkpoints(restored, True, archive).stage('a', [1], compute).get()
+            with self.subTest():
+                self.assertEqual((compute.calls, value.tolist()), (0, list(range(10))))
+            with self.subTest():
+                self.assertEqual(sorted(os.listdir(restored)), sorted(names))
+            with self.subTest():
+                self.assertFalse(os.path.exists(os.path.join(tmpDir, 'restored', 'escaped.pkl')))
+                self.assertFalse(os.path.exists(os.path.join(tmpDir, 'absolute.pkl')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,334 @@
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import cooccurrenceFinder
+
+
+class ListQueue(list):
+    def put(self, item):
+        self.append(item)
+
+
+def makeVCF():
+    # 5 variants x 4 samples, diploid; variant 4 is on another chromosome
+    gt = np.array([[[0, 0], [0, 1], [1, 1], [0, 0]],
+                   [[1, 0], [0, 0], [0, 0], [-1, -1]],
+                   [[0, 0], [0, 0], [0, 0], [0, 0]],
+                   [[1, 1], [1, 0], [0, 1], [2, 1]],
+                   [[0, 1], [0, 1], [0, 1], [0, 1]]], dtype='i1')
+    return {'samples': np.array(['s1', 's2', 's3', 's4'], dtype=object),
+            'calldata/GT': gt,
+            'variants/CHROM': np.array(['chr13', 'chr13', 'chr13', 'chr13', 'chr17'], dtype=object),
+            'variants/POS': np.array([100, 200, 300, 400, 500]),
+            'variants/REF': np.array(['A', 'C', 'G', 'T', 'A'], dtype=object),
+            'variants/ALT': np.array([['G', ''], ['T', ''], ['A', ''], ['C', ''], ['G', '']], dtype=object)}
+
+
+def writeVCF(fileName, vcf):
+    with open(fileName, 'w') as f:
+        f.write('##fileformat=VCFv4.2\n')
+        f.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t' + '\t'.join(vcf['samples']) + '\n')
+        for v in range(len(vcf['variants/POS'])):
+            calls = ['|'.join('.' if a < 0 else str(a) for a in call) for call in vcf['calldata/GT'][v]]
+            alts = [a for a in vcf['variants/ALT'][v] if a]
+            if max(max(call) for call in vcf['calldata/GT'][v]) > 1:
+                alts.append('N')
+            f.write('\t'.join([vcf['variants/CHROM'][v], str(vcf['variants/POS'][v]), '.', vcf['variants/REF'][v],
+                               ','.join(alts), '.', '.', '.', 'GT'] + calls) + '\n')
+    f.close()
+
+
+def writePathogenicity(fileName):
+    # classes of makeVCF()'s chr13 variants at 100 (benign), 200 (vus) and 400 (pathogenic)
+    with open(fileName, 'w') as f:
+        f.write('Clinical_significance\tGenomic_Coordinate_hg38\n')
+        f.write('Benign\tchr13:g.100:A>G\nUncertain_significance\tchr13:g.200:C>T\n')
+        f.write('Pathogenic\tchr13:g.400:T>C\n')
+    f.close()
+
+
+def fakeGenesForVariant(variant, ensemblRelease, geneOfInterest):
+    return ({geneOfInterest},)
+
+
+def pairwiseCooccurrences(variantsPerIndividual, phased, gene):
+    # reference: every vus x pathogenic pair of every individual through sameGeneSameParent()
+    individualsPerPathogenicCooccurrence = dict()
+    n = dict()
+    k = dict()
+    for individual in variantsPerIndividual:
+        for v in variantsPerIndividual[individual]['vus']:
+            n[tuple(v[0])] = n.get(tuple(v[0]), 0) + 1
+        for vus, path in itertools.product(variantsPerIndividual[individual]['vus'],
+                                           variantsPerIndividual[individual]['pathogenic']):
+            if cooccurrenceFinder.sameGeneSameParent(vus, path, phased, 99, gene):
+                k[tuple(vus[0])] = k.get(tuple(vus[0]), 0) + 1
+                key = (tuple(vus[0]), tuple(path[0]))
+                individualsPerPathogenicCooccurrence[key] = individualsPerPathogenicCooccurrence.get(key, []) + \
+                                                            [individual]
+    return individualsPerPathogenicCooccurrence, n, k
+
+
+def makeRandomVPI(numSamples, numVariants, seed):
+    rng = random.Random(seed)
+    variants = [('13', 100 * (j + 1), 'A', 'G') for j in range(numVariants)]
+    classes = [rng.choice(['benign', 'pathogenic', 'vus', 'vus']) for j in range(numVariants)]
+    vpi = dict()
+    for i in range(numSamples):
+        vpi['s' + str(i)] = {'benign': [], 'pathogenic': [], 'vus': []}
+        for j in range(numVariants):
+            if rng.random() < 0.3:
+                vpi['s' + str(i)][classes[j]].append((variants[j], rng.choice('123'), 'NA', 'NA'))
+    return vpi
+
+
+class TestCooccurrenceFinder(unittest.TestCase):
+
+    def test_classifyGenotypes(self):
+        variants, samples, codes = cooccurrenceFinder.classifyGenotypes(makeVCF()['calldata/GT'])
+        calls = list(zip(samples.tolist(), variants.tolist(), codes.tolist()))
+        self.assertEqual(calls, [(0, 1, 2), (0, 3, 3), (0, 4, 1),
+                                 (1, 0, 1), (1, 3, 2), (1, 4, 1),
+                                 (2, 0, 3), (2, 3, 1), (2, 4, 1),
+                                 (3, 3, 3), (3, 4, 1)])
+
+    @mock.patch.object(cooccurrenceFinder, 'getGenesForVariant', fakeGenesForVariant)
+    def test_sharedMatchesLoop(self):
+        # the vectorized engine (--engine vectorized) against the loop engine, over every split of the work
+        vcf = makeVCF()
+        benign = {('13', 100, 'A', 'G')}
+        pathogenic = {('13', 400, 'T', 'C')}
+        loopQueue = ListQueue()
+        cooccurrenceFinder.findVarsPerIndividual(loopQueue, vcf, benign, pathogenic, '13', 'BRCA2', 99, None, 0, 1)
+        for splitMode in ['auto', 'samples', 'variants', 'tiles']:
+            for numProcesses in [1, 3, 4]:
+                vpi = cooccurrenceFinder.findVarsPerIndividualShared(vcf, benign, pathogenic, '13', 'BRCA2', 99,
+                                                                     None, numProcesses, splitMode)
+                with self.subTest(splitMode=splitMode, numProcesses=numProcesses):
+                    self.assertEqual(vpi, loopQueue[0])
+
+    @mock.patch.object(cooccurrenceFinder, 'getGenesForVariant', fakeGenesForVariant)
+    def test_repeatedRecord(self):
+        # a record repeated in the VCF gives a sample one call, with the first record's code, in every engine
+        vcf = makeVCF()
+        for field in vcf:
+            if field != 'samples':
+                vcf[field] = np.concatenate([vcf[field][:2], vcf[field][1:]])
+        vcf['calldata/GT'][2][0] = [1, 1]
+        expected = [(('13', 200, 'C', 'T'), '2'), (('13', 400, 'T', 'C'), '3')]
+        loopQueue = ListQueue()
+        cooccurrenceFinder.findVarsPerIndividual(loopQueue, vcf, set(), set(), '13', 'BRCA2', 99, None, 0, 1)
+        vpi = cooccurrenceFinder.findVarsPerIndividualShared(vcf, set(), set(), '13', 'BRCA2', 99, None, 2)
+        with tempfile.TemporaryDirectory() as tmpDir:
+            vcfFileName = os.path.join(tmpDir, 'test.vcf')
+            writeVCF(vcfFileName, vcf)
+            chunkedVPI = cooccurrenceFinder.findVarsPerIndividualChunked(vcfFileName, None, 2, set(), set(), '13',
+                                                                         'BRCA2', 99, None)[0]
+        for engine, result in [('loop', loopQueue[0]), ('vectorized', vpi), ('chunked', chunkedVPI)]:
+            with self.subTest(engine=engine):
+                self.assertEqual([call[:2] for call in result['s1']['vus']], expected)
+                self.assertEqual(result, loopQueue[0])
+        ipv = vpi.matrix.individualsPerVariant()
+        with self.subTest():
+            self.assertEqual(list(ipv), list(dict.fromkeys(ipv)))
+        with self.subTest():
+            self.assertEqual(ipv["('13', 200, 'C', 'T')"], {'heterozygous individuals': {'s1'},
+                                                            'homozygous individuals': set()})
+
+    @mock.patch.object(cooccurrenceFinder, 'getGenesForVariant', fakeGenesForVariant)
+    def test_chunkedMatchesLoop(self):
+        benign = {('13', 100, 'A', 'G')}
+        pathogenic = {('13', 400, 'T', 'C')}
+        with tempfile.TemporaryDirectory() as tmpDir:
+            vcfFileName = os.path.join(tmpDir, 'test.vcf')
+            writeVCF(vcfFileName, makeVCF())
+            with self.subTest():
+                self.assertEqual(cooccurrenceFinder.getVCFRegion(vcfFileName, '13', (50, 450)), 'chr13:50-450')
+            vcf = cooccurrenceFinder.readVCFFile(vcfFileName)
+            loopQueue = ListQueue()
+            cooccurrenceFinder.findVarsPerIndividual(loopQueue, vcf, benign, pathogenic, '13', 'BRCA2', 99, None, 0,
+                                                     1)
+            vpi, chunkedVCF = cooccurrenceFinder.findVarsPerIndividualChunked(vcfFileName, None, 2, benign,
+                                                                              pathogenic, '13', 'BRCA2', 99, None)
+        with self.subTest():
+            self.assertEqual(vpi, loopQueue[0])
+        with self.subTest():
+            self.assertEqual(chunkedVCF['variants/POS'].tolist(), [100, 200, 300, 400, 500])
+
+    @mock.patch.object(cooccurrenceFinder, 'getGenesForVariant', fakeGenesForVariant)
+    def test_emptyRegion(self):
+        # a region with no records reads as a callset with no variants, in memory and in chunks
+        with tempfile.TemporaryDirectory() as tmpDir:
+            vcfFileName = os.path.join(tmpDir, 'test.vcf')
+            writeVCF(vcfFileName, makeVCF())
+            vcf = cooccurrenceFinder.parseVCF(vcfFileName, 'chr13:1-50')
+            cachedVCF = cooccurrenceFinder.parseVCF(vcfFileName, 'chr13:1-50', os.path.join(tmpDir, 'cache'))
+            with self.subTest(cached=True):
+                self.assertEqual(cachedVCF['calldata/GT'].shape, (0, 4, 2))
+            vpi, chunkedVCF = cooccurrenceFinder.findVarsPerIndividualChunked(vcfFileName, 'chr13:1-50', 2, set(),
+                                                                              set(), '13', 'BRCA2', 99, None)
+        with self.subTest():
+            self.assertEqual(vcf['calldata/GT'].shape, (0, 4, 2))
+        with self.subTest():
+            self.assertEqual(list(vcf['samples']), ['s1', 's2', 's3', 's4'])
+        for engine in ['loop', 'vectorized']:
+            with self.subTest(engine=engine):
+                self.assertEqual(cooccurrenceFinder.classifyVCF(vcf, set(), set(), '13', 'BRCA2', 99, None, 2,
+                                                                engine),
+                                 {s: {'benign': [], 'pathogenic': [], 'vus': []} for s in ['s1', 's2', 's3', 's4']})
+        with self.subTest():
+            self.assertEqual(vpi, {s: {'benign': [], 'pathogenic': [], 'vus': []} for s in ['s1', 's2', 's3', 's4']})
+        for field in ['variants/CHROM', 'variants/POS', 'variants/REF', 'variants/ALT']:
+            with self.subTest(field=field):
+                self.assertEqual(len(vcf[field]), 0)
+                self.assertEqual(len(chunkedVCF[field]), 0)
+
+    def test_cooccurrencesMatchPairwise(self):
+        # variants past 1000 are outside the gene, so the gene test is exercised as well
+        geneIndex = cooccurrenceFinder.GeneIndex('BRCA2', ['13'], [1], [1000])
+        with mock.patch.dict(cooccurrenceFinder.geneIndexes, {(99, 'BRCA2'): geneIndex}):
+            for seed in range(5):
+                vpi = makeRandomVPI(30, 15, seed)
+                for phased in [True, False]:
+                    ipc, n, k = cooccurrenceFinder.findIndividualsPerCooccurrence(vpi, 99, phased, 'BRCA2')
+                    expectedIPC, expectedN, expectedK = pairwiseCooccurrences(vpi, phased, 'BRCA2')
+                    with self.subTest(seed=seed, phased=phased):
+                        self.assertEqual(list(n.items()), list(expectedN.items()))
+                        self.assertEqual(dict(k), expectedK)
+                        self.assertEqual(list(ipc.items()), list(expectedIPC.items()))
+
+    def test_geneIndex(self):
+        geneIndex = cooccurrenceFinder.GeneIndex('BRCA2', ['13', '13', 'X'], [500, 100, 10], [600, 300, 20])
+        with self.subTest():
+            self.assertTrue(geneIndex.contains('chr13', 100))
+        with self.subTest():
+            self.assertTrue(geneIndex.contains(13, 300))
+        with self.subTest():
+            self.assertFalse(geneIndex.contains('13', 400))
+        with self.subTest():
+            self.assertTrue(geneIndex.contains('13', 600))
+        with self.subTest():
+            self.assertFalse(geneIndex.contains('17', 100))
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'BRCA2-geneindex.npz')
+            geneIndex.save(fileName)
+            loaded = cooccurrenceFinder.GeneIndex.load(fileName)
+        with self.subTest():
+            self.assertEqual(loaded.gene, 'BRCA2')
+        with self.subTest():
+            self.assertEqual([loaded.contains('13', p) for p in [99, 100, 450, 550]], [False, True, False, True])
+
+    def test_findVariants(self):
+        rows = [('Pathogenic', 'chr13:g.32316508:GAC>G'), ('Likely_benign', '13:32338749:AATTAC>A'),
+                ('Uncertain_significance', 'chr13:g.32340836:G>T'), ('-', 'chr13:32355250:T>C'),
+                ('not provided', 'chr13:g.32353470:A>C'), ('Pathogenic', '-'), ('Benign', 'chr13:g.32316508:GAC>G')]
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'variants.tsv')
+            with open(fileName, 'w') as f:
+                f.write('Clinical_significance\tGenomic_Coordinate_hg38\n')
+                for row in rows:
+                    f.write('\t'.join(row) + '\n')
+            f.close()
+            df, pathogenic, benign, vus = cooccurrenceFinder.findVariants(fileName, cooccurrenceFinder.classStrings,
+                                                                          38)
+        with self.subTest():
+            self.assertEqual(pathogenic, {('13', 32316508, 'GAC', 'G')})
+        with self.subTest():
+            self.assertEqual(benign, {('13', 32338749, 'AATTAC', 'A'), ('13', 32316508, 'GAC', 'G')})
+        with self.subTest():
+            self.assertEqual(vus, {('13', 32340836, 'G', 'T'), ('13', 32355250, 'T', 'C')})
+        with self.subTest():
+            self.assertEqual(df.loc[('13', 32316508, 'GAC', 'G')]['Clinical_significance'].tolist(),
+                             ['Pathogenic', 'Benign'])
+        with self.subTest():
+            # the row without a coordinate is dropped
+            self.assertEqual(len(df), len(rows) - 1)
+        with self.subTest():
+            self.assertTrue(df.index.is_monotonic_increasing)
+
+    def test_readTargets(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'targets.bed')
+            with open(fileName, 'w') as f:
+                f.write('track name=genes\n13\tBRCA2\nchr17\t100\t200\tBRCA1\nchr17\t300\t400\tBRCA1\n\n')
+            f.close()
+            with self.subTest():
+                self.assertEqual(cooccurrenceFinder.readTargets(fileName),
+                                 [('13', 'BRCA2', []), ('17', 'BRCA1', [(101, 200), (301, 400)])])
+            with open(fileName, 'a') as f:
+                f.write('chr13\t1\t2\tBRCA1\n')
+            f.close()
+            with self.subTest():
+                self.assertRaises(ValueError, cooccurrenceFinder.readTargets, fileName)
+        with self.subTest():
+            self.assertEqual(cooccurrenceFinder.getOutputFileNames('data', 'BRCA1', 'pathology.tsv'),
+                             ('data/BRCA1-cooccurrences.json', 'data/BRCA1-ipv.json', 'data/BRCA1-vpi.json',
+                              'data/BRCA1-all.json', 'data/BRCA1-tout.json', 'data/BRCA1-carriers.npz',
+                              'data/BRCA1-intersection.json'))
+
+    @mock.patch.object(cooccurrenceFinder, 'getGenesForVariant', fakeGenesForVariant)
+    def test_runBatch(self):
+        # a target with no records in the VCF still gets its outputs and a summary entry
+        targets = [('13', 'BRCA2', [(50, 450)]), ('13', 'EMPTY', [(1000, 2000)])]
+        with tempfile.TemporaryDirectory() as tmpDir:
+            vcfFileName = os.path.join(tmpDir, 'test.vcf')
+            writeVCF(vcfFileName, makeVCF())
+            pathogenicityFileName = os.path.join(tmpDir, 'variants.tsv')
+            writePathogenicity(pathogenicityFileName)
+            for chunkLength in [None, 2]:
+                summaryFileName = os.path.join(tmpDir, 'summary.json')
+                summaries = cooccurrenceFinder.runBatch(38, 99, targets, False, 0.0001, vcfFileName, 1,
+                                                        pathogenicityFileName, tmpDir, tmpDir, None, True, None,
+                                                        None, summaryFileName, chunkLength=chunkLength)
+                with open(summaryFileName, 'r') as f:
+                    summaryFile = json.load(f)
+                f.close()
+                with open(os.path.join(tmpDir, 'EMPTY-cooccurrences.json'), 'r') as f:
+                    emptyOutput = json.load(f)
+                f.close()
+                with self.subTest(chunkLength=chunkLength):
+                    self.assertEqual(sorted(summaryFile), ['BRCA2', 'EMPTY'])
+                    self.assertEqual(summaries['BRCA2']['cooccurring vus'], 1)
+                    self.assertEqual((summaries['EMPTY']['samples'], summaries['EMPTY']['vus']), (4, 0))
+                    self.assertEqual(emptyOutput, {'cooccurring vus': {}, 'homozygous vus': {}})
+                    for suffix in ['-ipv.json', '-vpi.json', '-all.json', '-tout.json']:
+                        self.assertTrue(os.path.exists(os.path.join(tmpDir, 'EMPTY' + suffix)))
+
+    @mock.patch.object(cooccurrenceFinder, 'getGenesForVariant', fakeGenesForVariant)
+    @mock.patch.object(cooccurrenceFinder, 'isExonic', lambda ensemblRelease, chrom, pos: True)
+    def test_gnomadSitesPerRun(self):
+        # a second run in the same process, for another gene region, looks its variants up in the gnomad sites of
+        # its own region and not in those the first run loaded
+        with tempfile.TemporaryDirectory() as tmpDir:
+            vcfFileName = os.path.join(tmpDir, 'test.vcf')
+            writeVCF(vcfFileName, makeVCF())
+            pathogenicityFileName = os.path.join(tmpDir, 'variants.tsv')
+            writePathogenicity(pathogenicityFileName)
+            gnomadFileName = os.path.join(tmpDir, 'sites.vcf')
+            with open(gnomadFileName, 'w') as f:
+                f.write('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+                f.write('chr13\t100\t.\tA\tG\t.\tPASS\tAF=0.1;popmax=nfe;faf95_popmax=0.05\n')
+                f.write('chr13\t200\t.\tC\tT\t.\tPASS\tAF=0.2;popmax=afr;faf95_popmax=0.15\n')
+            f.close()
+            for name, interval in [('FIRST', (50, 150)), ('SECOND', (150, 450))]:
+                cooccurrenceFinder.runBatch(38, 99, [('13', name, [interval])], False, 0.0001, vcfFileName, 1,
+                                            pathogenicityFileName, tmpDir, tmpDir, None, True, None,
+                                            gnomadFileName, os.path.join(tmpDir, 'summary.json'))
+            with open(os.path.join(tmpDir, 'SECOND-cooccurrences.json'), 'r') as f:
+                output = json.load(f)
+            f.close()
+        frequencies = output['cooccurring vus'][str(('13', 200, 'C', 'T'))]['allele frequencies']
+        self.assertEqual((frequencies['maxPop'], frequencies['maxPopFreq']), ('afr', '0.15'))
+
+
+if __name__ == '__main__':
+    unittest.main()
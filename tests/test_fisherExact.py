@@ -0,0 +1,74 @@
+import itertools
+import os
+import sys
+import unittest
+import numpy as np
+import scipy.stats as stats
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import fisherExact
+
+# R's fisher.test() output for the examples in its documentation (?fisher.test), at the digits R prints
+teaTasting = (3, 1, 1, 3)
+convictions = (2, 10, 15, 3)
+
+
+class TestFisherExact(unittest.TestCase):
+
+    def test_matchesR(self):
+        oddsRatio, pValue, (lower, upper) = fisherExact.fisherTest(*convictions)
+        # fisher.test(Convictions, conf.level = 0.95)$conf.int
+        with self.subTest(table=convictions):
+            self.assertAlmostEqual(lower, 0.003325764, places=9)
+            self.assertAlmostEqual(upper, 0.363182271, places=9)
+            self.assertAlmostEqual(oddsRatio, 0.04693661, places=8)
+        # fisher.test(Convictions, alternative = "less"): p-value = 0.0004652, 95 percent CI 0 0.2849601
+        distribution = fisherExact.NoncentralHypergeometric(*convictions)
+        with self.subTest(table=convictions, alternative='less'):
+            self.assertAlmostEqual(distribution.cdf(distribution.x, 1.0), 0.0004652, places=7)
+            self.assertAlmostEqual(distribution.upperLimit(0.05), 0.2849601, places=7)
+        # fisher.test(TeaTasting, alternative = "greater"): p-value = 0.2429, 95 percent CI 0.3135693 Inf,
+        # odds ratio 6.408309
+        oddsRatio, pValue, (lower, upper) = fisherExact.fisherTest(*teaTasting)
+        distribution = fisherExact.NoncentralHypergeometric(*teaTasting)
+        with self.subTest(table=teaTasting, alternative='greater'):
+            self.assertAlmostEqual(distribution.cdf(distribution.x, 1.0, upperTail=True), 0.2429, places=4)
+            self.assertAlmostEqual(distribution.lowerLimit(0.05), 0.3135693, places=7)
+            self.assertAlmostEqual(oddsRatio, 6.408309, places=6)
+
+    def test_pValues(self):
+        # the two-sided p-value is the one scipy (and R) report
+        for table in itertools.product([0, 1, 3, 8], repeat=4):
+            if sum(table) == 0:
+                continue
+            oddsRatio, pValue, (lower, upper) = fisherExact.fisherTest(*table)
+            with self.subTest(table=table):
+                self.assertAlmostEqual(pValue, stats.fisher_exact([table[:2], table[2:]])[1], places=9)
+                self.assertLessEqual(lower, oddsRatio)
+                self.assertLessEqual(oddsRatio, upper)
+
+    def test_limits(self):
+        # a table at the edge of its support has odds ratio 0 or Inf and an open-ended interval
+        with self.subTest():
+            self.assertEqual(fisherExact.fisherTest(0, 5, 4, 2)[0], 0.0)
+            self.assertEqual(fisherExact.fisherTest(0, 5, 4, 2)[2][0], 0.0)
+        with self.subTest():
+            self.assertEqual(fisherExact.fisherTest(5, 0, 2, 4)[0], np.inf)
+            self.assertEqual(fisherExact.fisherTest(5, 0, 2, 4)[2][1], np.inf)
+        with self.subTest(table=(0, 0, 0, 0)):
+            self.assertEqual(fisherExact.fisherTest(0, 0, 0, 0), (0.0, 1.0, (0.0, np.inf)))
+            self.assertEqual(stats.fisher_exact([[0, 0], [0, 0]])[1], 1.0)
+
+    def test_fisherTests(self):
+        tables = [convictions, teaTasting, convictions, (10, 20, 30, 40)]
+        fisherExact.fisherTest.cache_clear()
+        oddsRatios, pValues, intervals = fisherExact.fisherTests(tables)
+        with self.subTest():
+            self.assertEqual(fisherExact.fisherTest.cache_info().currsize, 3)
+        for i in range(len(tables)):
+            with self.subTest(table=tables[i]):
+                self.assertEqual((oddsRatios[i], pValues[i], intervals[i]), fisherExact.fisherTest(*tables[i]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import genotypeCache
+
+testVCF = '''##fileformat=VCFv4.2
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ts1\ts2\ts3
+chr13\t100\t.\tA\tG\t.\t.\t.\tGT\t0|1\t0|0\t1|1
+chr13\t200\t.\tC\tT,A\t.\t.\t.\tGT\t0|0\t1|0\t0|2
+chr13\t300\t.\tG\tA\t.\t.\t.\tGT\t0|0\t0|0\t0|1
+'''
+
+
+class TestGenotypeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.vcfFileName = os.path.join(self.tmpDir.name, 'test.vcf')
+        self.cacheDir = os.path.join(self.tmpDir.name, 'cache')
+        with open(self.vcfFileName, 'w') as f:
+            f.write(testVCF)
+        f.close()
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_buildAndOpen(self):
+        self.assertIsNone(genotypeCache.openCache(self.cacheDir, self.vcfFileName))
+        vcf = genotypeCache.getCachedVCF(self.cacheDir, self.vcfFileName)
+        with self.subTest():
+            self.assertIsInstance(vcf['calldata/GT'], np.memmap)
+        with self.subTest():
+            self.assertEqual(vcf['calldata/GT'][2].tolist(), [[0, 0], [0, 0], [0, 1]])
+        with self.subTest():
+            self.assertEqual(list(vcf['samples']), ['s1', 's2', 's3'])
+        with self.subTest():
+            self.assertEqual(str(vcf['variants/ALT'][1][1]), 'A')
+        with self.subTest():
+            self.assertEqual(vcf['variants/CHROM'][0].replace('chr', ''), '13')
+
+    def test_regionIsPartOfKey(self):
+        genotypeCache.buildCache(self.cacheDir, self.vcfFileName, 'chr13:150-250')
+        with self.subTest():
+            self.assertIsNone(genotypeCache.openCache(self.cacheDir, self.vcfFileName))
+        with self.subTest():
+            vcf = genotypeCache.openCache(self.cacheDir, self.vcfFileName, 'chr13:150-250')
+            self.assertEqual(vcf['variants/POS'].tolist(), [200])
+
+    def test_invalidateStale(self):
+        genotypeCache.buildCache(self.cacheDir, self.vcfFileName)
+        with self.subTest():
+            self.assertEqual(genotypeCache.invalidateCache(self.cacheDir, staleOnly=True), [])
+        mtime = os.path.getmtime(self.vcfFileName)
+        os.utime(self.vcfFileName, (mtime + 10, mtime + 10))
+        entries = genotypeCache.listCache(self.cacheDir)
+        with self.subTest():
+            self.assertEqual([entry['stale'] for entry in entries], [True])
+        with self.subTest():
+            self.assertIsNone(genotypeCache.openCache(self.cacheDir, self.vcfFileName))
+        with self.subTest():
+            self.assertEqual(len(genotypeCache.invalidateCache(self.cacheDir, staleOnly=True)), 1)
+        with self.subTest():
+            self.assertEqual(genotypeCache.listCache(self.cacheDir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
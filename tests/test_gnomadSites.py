@@ -0,0 +1,99 @@
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import gnomadSites
+
+sitesVCF = '''##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO
+chr13\t100\t.\tA\tG\t.\tPASS\tAC=1;AF=0.001;popmax=nfe;faf95_popmax=0.0005;lcr
+chr13\t200\t.\tC\tT\t.\tPASS\tAC=2;AF=0.002
+chr13\t300\t.\tG\tA\t.\tPASS\tAF=0.3
+chr13\t300\t.\tG\tA\t.\tPASS\tAF=0.4
+chr17\t150\t.\tT\tC\t.\tPASS\tAF=0.5
+'''
+
+
+class TestGnomadSites(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'sites.vcf')
+        with open(self.fileName, 'w') as f:
+            f.write(sitesVCF)
+        f.close()
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_getAF(self):
+        sites = gnomadSites.GnomadSites.fromVCF(self.fileName)
+        with self.subTest():
+            self.assertEqual(sites.getAF(('13', 100, 'A', 'G')), ('nfe', '0.0005', '0.001'))
+        with self.subTest():
+            self.assertEqual(sites.getAF(('chr13', '200', 'C', 'T')), (None, None, '0.002'))
+        with self.subTest():
+            # more than one record for the same variant is ambiguous
+            self.assertIsNone(sites.getAF(('13', 300, 'G', 'A')))
+        with self.subTest():
+            self.assertIsNone(sites.getAF(('13', 400, 'G', 'A')))
+
+    def test_regionAndInfoKeys(self):
+        gzFileName = self.fileName + '.gz'
+        with gzip.open(gzFileName, 'wt') as f:
+            f.write(sitesVCF)
+        f.close()
+        sites = gnomadSites.GnomadSites.fromVCF(gzFileName, '13', 150, 250, ['AF', 'popmax', 'AC_*'])
+        with self.subTest():
+            self.assertEqual(len(sites), 1)
+        with self.subTest():
+            self.assertEqual(sites.getInfo(('13', 200, 'C', 'T')), {'AF': '0.002'})
+        with self.subTest():
+            self.assertNotIn(('17', 150, 'T', 'C'), sites)
+        with self.subTest():
+            self.assertEqual(gnomadSites.keepInfoKeys('AC=1;AC_nfe=2;AN_nfe=3;AF=0.1;lcr', ['AF', 'AC_*']),
+                             'AC_nfe=2;AF=0.1')
+
+    def test_fromVCFRegions(self):
+        # the first two regions overlap and are read once, so the record at 200 is not a duplicate
+        sites = gnomadSites.GnomadSites.fromVCFRegions(self.fileName, [('13', 150, 250), ('chr13', 200, 350),
+                                                                       ('17', 100, 200)])
+        with self.subTest():
+            self.assertEqual(len(sites), 3)
+        with self.subTest():
+            self.assertEqual(sites.getAF(('13', 200, 'C', 'T')), (None, None, '0.002'))
+        with self.subTest():
+            self.assertIsNone(sites.getAF(('13', 300, 'G', 'A')))
+        with self.subTest():
+            self.assertEqual(sites.getAF(('17', 150, 'T', 'C')), (None, None, '0.5'))
+        with self.subTest():
+            self.assertNotIn(('13', 100, 'A', 'G'), sites)
+
+    def test_getGnomadSitesIsCached(self):
+        with self.subTest():
+            self.assertIs(gnomadSites.getGnomadSites(self.fileName), gnomadSites.getGnomadSites(self.fileName))
+        # another region or other INFO keys load their own store instead of getting the first one
+        first = gnomadSites.getGnomadSites(self.fileName, '13', 150, 250, gnomadSites.usedInfoKeys)
+        second = gnomadSites.getGnomadSites(self.fileName, '17', 100, 200, gnomadSites.usedInfoKeys)
+        with self.subTest():
+            self.assertEqual((first.getAF(('13', 200, 'C', 'T')), first.getAF(('17', 150, 'T', 'C'))),
+                             ((None, None, '0.002'), None))
+        with self.subTest():
+            self.assertEqual(second.getAF(('17', 150, 'T', 'C')), (None, None, '0.5'))
+        with self.subTest():
+            self.assertIsNot(gnomadSites.getGnomadSites(self.fileName, '13', 150, 250), first)
+        with self.subTest():
+            self.assertIsNot(gnomadSites.getGnomadSitesForRegions(self.fileName, [('17', 100, 200)]),
+                             gnomadSites.getGnomadSitesForRegions(self.fileName, [('13', 150, 250)]))
+        # a changed file is read again
+        os.utime(self.fileName, (0, 0))
+        with self.subTest():
+            self.assertIsNot(gnomadSites.getGnomadSites(self.fileName, '13', 150, 250, gnomadSites.usedInfoKeys),
+                             first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import carrierMatrix
+import haplotypeBitsets
+
+
+def makeMatrix(numSamples, numVariants, seed):
+    rng = random.Random(seed)
+    samples, variants, codes = list(), list(), list()
+    for i in range(numSamples):
+        for j in range(numVariants):
+            if rng.random() < 0.4:
+                samples.append(i)
+                variants.append(j)
+                codes.append(rng.choice([1, 2, 3]))
+    return carrierMatrix.CarrierMatrix(['s' + str(i) for i in range(numSamples)],
+                                       [('13', j + 1, 'A', 'G') for j in range(numVariants)],
+                                       [2] * numVariants, samples, variants, codes)
+
+
+def isPhasedPair(vusCode, pathogenicCode):
+    return vusCode == 3 or (vusCode == 2 and pathogenicCode == 1) or (vusCode == 1 and pathogenicCode == 2)
+
+
+class TestHaplotypeBitsets(unittest.TestCase):
+
+    def test_fromCarrierMatrix(self):
+        matrix = makeMatrix(11, 4, 0)
+        bitsets = haplotypeBitsets.HaplotypeBitsets.fromCarrierMatrix(matrix)
+        dense = matrix.csr.toarray()
+        with self.subTest():
+            self.assertEqual(bitsets.first.shape, (4, 2))
+        with self.subTest():
+            self.assertEqual(np.unpackbits(bitsets.first, axis=1)[:, :11].tolist(), ((dense.T & 2) > 0).tolist())
+        with self.subTest():
+            self.assertEqual(np.unpackbits(bitsets.second, axis=1)[:, :11].tolist(), ((dense.T & 1) > 0).tolist())
+        with self.subTest():
+            self.assertEqual(haplotypeBitsets.popcount(bitsets.carriers(np.arange(4))).tolist(),
+                             (dense > 0).sum(axis=0).tolist())
+
+    def test_cooccurrenceCounts(self):
+        matrix = makeMatrix(21, 6, 1)
+        bitsets = haplotypeBitsets.HaplotypeBitsets.fromCarrierMatrix(matrix)
+        dense = matrix.csr.toarray()
+        vus, pathogenic = [0, 2, 3, 5], [1, 4]
+        expected = [[sum(isPhasedPair(dense[s, v], dense[s, p]) for s in range(21) if dense[s, v] and dense[s, p])
+                     for p in pathogenic] for v in vus]
+        # a tiny block size splits the vus into blocks of one
+        with mock.patch.object(haplotypeBitsets, 'maxBlockBytes', 1):
+            with self.subTest():
+                self.assertEqual(bitsets.cooccurrenceCounts(vus, pathogenic).tolist(), expected)
+        with self.subTest():
+            self.assertEqual(bitsets.cooccurrenceCounts(vus, pathogenic).tolist(), expected)
+        with self.subTest():
+            self.assertEqual(bitsets.pairSamples(0, 1).tolist(),
+                             [s for s in range(21) if dense[s, 0] and dense[s, 1] and
+                              isPhasedPair(dense[s, 0], dense[s, 1])])
+
+
+if __name__ == '__main__':
+    unittest.main()
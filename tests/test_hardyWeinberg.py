@@ -0,0 +1,149 @@
+import math
+import os
+from fractions import Fraction
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import cooccurrenceAnalyzer
+import hardyWeinberg
+from tests.test_cooccurrenceFinder import makeRandomVPI
+
+
+def scalarTest(AA, Aa, aa, n, c, significance):
+    # the per-variant loops hardyWeinbergChiSquareTest() and hardyWeinbergStatistics() had before the engine
+    p = (2 * AA + Aa) / (2 * (AA + Aa + aa))
+    q = 1 - p
+    expAA = n * p ** 2
+    expAa = 2 * p * q * n
+    expaa = n * q ** 2
+    if expAA == 0 or expAa == 0 or expaa == 0:
+        chisquare = 0
+    else:
+        chisquare = (1.0 / expAA) * (abs(AA - expAA) - c) ** 2 + (1.0 / expAa) * (abs(Aa - expAa) - c) ** 2 + \
+                    (1.0 / expaa) * (abs(aa - expaa) - c) ** 2
+    results = {'p': p, 'q': q, 'chisquare': chisquare, 'accept hw': chisquare < 3.84, 'E(f(Aa))': 2 * p * q}
+    try:
+        results['F'] = (results['E(f(Aa))'] - Aa) / results['E(f(Aa))']
+        results['Z'] = ((AA * aa - Aa ** 2) / ((AA + 0.5 * Aa) * (aa + 0.5 * Aa))) * math.sqrt(AA + Aa + aa)
+    except ZeroDivisionError:
+        results['F'] = 0.0
+        results['Z'] = 0.0
+    results['accept F'] = abs(results['F']) <= significance
+    return results
+
+def enumeratedExactTest(AA, Aa, aa):
+    # plain and mid-p exact test p-values from the Levene-Haldane probabilities of every possible het count, in
+    # exact rational arithmetic
+    n = AA + Aa + aa
+    minor = min(2 * AA + Aa, 2 * aa + Aa)
+    probabilities = dict()
+    for hets in range(minor % 2, minor + 1, 2):
+        rare = (minor - hets) // 2
+        probabilities[hets] = Fraction(math.factorial(n) * 2 ** hets, math.factorial(rare) * math.factorial(hets) *
+                                       math.factorial(n - hets - rare))
+    total = sum(probabilities.values())
+    observed = probabilities[Aa]
+    lessLikely = sum(p for p in probabilities.values() if p < observed) / total
+    asLikely = sum(p for p in probabilities.values() if p == observed) / total
+    return float(lessLikely + asLikely), float(lessLikely + asLikely / 2)
+
+
+class TestHardyWeinberg(unittest.TestCase):
+
+    def test_matchesScalarTest(self):
+        rng = np.random.RandomState(3)
+        n = 500
+        aa = np.concatenate([rng.randint(0, 5, 200), [0, n, 0, 250]])
+        Aa = np.concatenate([rng.randint(0, 60, 200), [0, 0, 1, 0]])
+        AA = n - aa - Aa
+        results = hardyWeinberg.hardyWeinbergTest(AA, Aa, aa, n, 0.5, 0.01)
+        for i in range(len(AA)):
+            expected = scalarTest(int(AA[i]), int(Aa[i]), int(aa[i]), n, 0.5, 0.01)
+            statistics = hardyWeinberg.getStatistics(results, i, hardyWeinberg.chiSquareKeys +
+                                                     hardyWeinberg.statisticsKeys)
+            with self.subTest(counts=(AA[i], Aa[i], aa[i])):
+                self.assertEqual(set(statistics), set(expected))
+                for key in expected:
+                    self.assertAlmostEqual(statistics[key], expected[key], places=9)
+
+    def test_monomorphic(self):
+        # no exceptions and no NaN for variants every sample carries the same genotype of
+        results = hardyWeinberg.hardyWeinbergTest([0, 10], [0, 0], [10, 0], 10, 0.5, 0.01)
+        for key in ['chisquare', 'F', 'Z']:
+            with self.subTest(key=key):
+                self.assertEqual(list(results[key]), [0.0, 0.0])
+        with self.subTest():
+            self.assertEqual(list(results['accept hw']), [True, True])
+
+    def test_exactTest(self):
+        counts = [(50, 0, 0), (0, 0, 50), (40, 10, 0), (30, 10, 10), (2, 0, 8), (9, 1, 0), (5, 5, 5), (0, 20, 0),
+                  (57, 14, 9), (120, 3, 1)]
+        AA, Aa, aa = [[count[i] for count in counts] for i in range(3)]
+        plain = hardyWeinberg.exactTest(AA, Aa, aa, midP=False)
+        mid = hardyWeinberg.exactTest(AA, Aa, aa)
+        for i in range(len(counts)):
+            expectedPlain, expectedMid = enumeratedExactTest(*counts[i])
+            with self.subTest(counts=counts[i]):
+                self.assertAlmostEqual(plain['hwe p'][i], expectedPlain, places=12)
+                self.assertAlmostEqual(mid['hwe p'][i], expectedMid, places=12)
+
+    def test_exactTables(self):
+        for numSamples, minorAlleleCount in [(1, 1), (10, 7), (1000, 3), (200000, 5000)]:
+            pValues, midPValues, hetFrequency = hardyWeinberg.getExactTables(numSamples, minorAlleleCount)
+            defined = ~np.isnan(pValues)
+            with self.subTest(n=numSamples, minor=minorAlleleCount):
+                self.assertEqual(list(np.nonzero(defined)[0]), list(range(minorAlleleCount % 2,
+                                                                          minorAlleleCount + 1, 2)))
+                # the most likely het count has p-value 1
+                self.assertAlmostEqual(pValues[defined].max(), 1.0, places=12)
+                self.assertTrue(np.all(midPValues[defined] <= pValues[defined]))
+                self.assertGreater(hetFrequency, 0.0)
+                self.assertLessEqual(hetFrequency, minorAlleleCount / numSamples)
+
+    def test_exactTablesShared(self):
+        # variants with the same (n, minor allele count) share one table, whichever allele is the minor one
+        hardyWeinberg.getExactTables.cache_clear()
+        hardyWeinberg.exactTest([90, 0, 95, 90], [10, 10, 0, 10], [0, 90, 5, 0])
+        info = hardyWeinberg.getExactTables.cache_info()
+        with self.subTest():
+            self.assertEqual(info.misses, 1)
+
+    def test_exactTestAcceptHW(self):
+        # a rare variant in HW proportions accepts HW under the exact test while the chi-square rejects it
+        chiSquare = hardyWeinberg.hardyWeinbergTest([999], [1], [0], 1000, 0.5, 0.01)
+        exact = hardyWeinberg.hardyWeinbergTest([999], [1], [0], 1000, 0.5, 0.01, test='exact')
+        with self.subTest():
+            self.assertFalse(chiSquare['accept hw'][0])
+        with self.subTest():
+            self.assertTrue(exact['accept hw'][0])
+        with self.subTest():
+            self.assertAlmostEqual(exact['hwe p'][0], 0.5, places=12)
+        with self.subTest():
+            self.assertAlmostEqual(exact['het freq hwe'][0], 0.001, places=12)
+        with self.assertRaises(ValueError):
+            hardyWeinberg.hardyWeinbergTest([999], [1], [0], 1000, 0.5, 0.01, test='fisher')
+
+    def test_getHardyWeinbergStats(self):
+        vpi = makeRandomVPI(40, 12, 5)
+        bVars, pVars, vVars = cooccurrenceAnalyzer.calculateZygosityFrequenciesPerVariant(vpi)
+        bVars, pVars, vVars = cooccurrenceAnalyzer.hardyWeinbergChiSquareTest(bVars, pVars, vVars, len(vpi), 0.5)
+        bVars, pVars, vVars = cooccurrenceAnalyzer.hardyWeinbergStatistics(bVars, pVars, vVars, 0.01)
+        ipv = {str(v): dict() for variants in [bVars, pVars, vVars] for v in variants}
+        variantsDict = {'cooccurring vus': {str(v): {} for v in list(vVars)[:2]}, 'homozygous vus': {}}
+        ipv = cooccurrenceAnalyzer.getHardyWeinbergStats(vpi, variantsDict, ipv, 0.5)
+        for variantClass, variants in [('benign', bVars), ('pathogenic', pVars), ('vus', vVars)]:
+            for v in variants:
+                with self.subTest(variant=v):
+                    self.assertEqual(ipv[str(v)]['class'], variantClass)
+                    for key in ['F', 'Z', 'accept F', 'chisquare', 'AA', 'Aa', 'aa']:
+                        self.assertEqual(ipv[str(v)][key], variants[v][key])
+                    expected = scalarTest(variants[v]['AA'], variants[v]['Aa'], variants[v]['aa'], len(vpi), 0.5,
+                                          0.01)
+                    self.assertAlmostEqual(variants[v]['chisquare'], expected['chisquare'], places=9)
+                    self.assertEqual(variants[v]['accept hw'], expected['accept hw'])
+
+
+if __name__ == '__main__':
+    unittest.main()
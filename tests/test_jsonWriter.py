@@ -0,0 +1,45 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import carrierMatrix
+import jsonWriter
+from tests.test_carrierMatrix import makeVPI
+
+
+class TestJsonWriter(unittest.TestCase):
+
+    def test_iterEncode(self):
+        vpi = makeVPI()
+        matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpi)
+        records = {'counts': {'a': np.int64(3), 'b': np.float64(0.5), 'c': np.bool_(True)},
+                   'array': np.arange(3), 1: [np.int32(2)], 'set': {'x'}}
+        for obj in [vpi, records, [1, 2], {}]:
+            with self.subTest(obj=type(obj).__name__):
+                self.assertEqual(''.join(jsonWriter.iterEncode(obj)),
+                                 json.dumps(obj, default=jsonWriter.jsonDefault))
+        with self.subTest():
+            self.assertEqual(json.loads(''.join(jsonWriter.iterEncode(matrix.variantsPerIndividual()))),
+                             json.loads(json.dumps(vpi)))
+        with self.subTest():
+            self.assertRaises(TypeError, lambda: ''.join(jsonWriter.iterEncode({'a': object()})))
+
+    def test_backgroundWriter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = jsonWriter.BackgroundWriter()
+            writer.write(os.path.join(tmp, 'a.json'), {'a': [np.int64(1)]})
+            writer.write(os.path.join(tmp, 'b.json'), {'b': object()})
+            writer.write(os.path.join(tmp, 'c.json'), {'c': 2})
+            self.assertRaises(TypeError, writer.close)
+            for name, expected in [('a.json', {'a': [1]}), ('c.json', {'c': 2})]:
+                with self.subTest(name=name):
+                    with open(os.path.join(tmp, name)) as f:
+                        self.assertEqual(json.load(f), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
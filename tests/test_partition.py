@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import partition
+
+
+def cells(tiles):
+    covered = list()
+    for sampleStart, sampleEnd, variantStart, variantEnd in tiles:
+        for s in range(sampleStart, sampleEnd):
+            for v in range(variantStart, variantEnd):
+                covered.append((s, v))
+    return sorted(covered)
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_planTilesCoversEveryCellOnce(self):
+        expected = [(s, v) for s in range(7) for v in range(11)]
+        for mode in partition.splitModes:
+            for numProcesses in [1, 2, 4, 5, 6]:
+                tiles = partition.planTiles(7, 11, numProcesses, mode)
+                with self.subTest(mode=mode, numProcesses=numProcesses):
+                    self.assertEqual(len(tiles), numProcesses)
+                    self.assertEqual(cells(tiles), expected)
+
+    def test_planTilesShape(self):
+        with self.subTest():
+            self.assertEqual(partition.planTiles(4, 10, 2, 'samples'), [(0, 2, 0, 10), (2, 4, 0, 10)])
+        with self.subTest():
+            self.assertEqual(partition.planTiles(4, 10, 2, 'variants'), [(0, 4, 0, 5), (0, 4, 5, 10)])
+        with self.subTest():
+            self.assertEqual(len(set((t[0], t[1]) for t in partition.planTiles(8, 8, 4, 'tiles'))), 2)
+        # few samples over many variants splits the variants
+        with self.subTest():
+            self.assertEqual(partition.planTiles(3, 1000, 4, 'auto')[0], (0, 3, 0, 250))
+        # many samples over few variants splits the samples
+        with self.subTest():
+            self.assertEqual(partition.planTiles(1000, 3, 4, 'auto')[0], (0, 250, 0, 3))
+        with self.subTest():
+            self.assertRaises(ValueError, partition.planTiles, 4, 4, 2, 'rows')
+
+    def test_addCounts(self):
+        total = {'s1': {'benign': {'homo': 1, 'hetero': 0}, 'ethnicity': 'nfe'}}
+        partition.addCounts(total, {'s1': {'benign': {'homo': 2, 'hetero': 1}, 'ethnicity': 'nfe'},
+                                    's2': {'benign': {'homo': 0, 'hetero': 1}, 'ethnicity': 'afr'}})
+        self.assertEqual(total, {'s1': {'benign': {'homo': 3, 'hetero': 1}, 'ethnicity': 'nfe'},
+                                 's2': {'benign': {'homo': 0, 'hetero': 1}, 'ethnicity': 'afr'}})
+
+
+if __name__ == '__main__':
+    unittest.main()
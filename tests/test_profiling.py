@@ -0,0 +1,84 @@
+import json
+import os
+import pstats
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import checkpoints
+import profiling
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        profiling.profiler.reset()
+
+    def test_stages(self):
+        with profiling.stage('outer') as outer:
+            with profiling.stage('inner') as inner:
+                sum(range(10000))
+                inner.count(variants=3, samples=2.0)
+            outer.count(pairs=1)
+        metrics = profiling.profiler.metrics()
+        names = [record['name'] for record in metrics['stages']]
+        with self.subTest():
+            # stages are listed as they finish
+            self.assertEqual(names, ['inner', 'outer'])
+        with self.subTest():
+            self.assertEqual(profiling.profiler.get('inner').parent, 'outer')
+        with self.subTest():
+            self.assertIsNone(profiling.profiler.get('outer').parent)
+        with self.subTest():
+            self.assertEqual(metrics['stages'][0]['counts'], {'variants': 3, 'samples': 2})
+        with self.subTest():
+            self.assertGreaterEqual(outer.wallTime, inner.wallTime)
+        with self.subTest():
+            self.assertIsNone(profiling.profiler.get('missing'))
+
+    def test_failedStage(self):
+        # a stage that raises is still recorded
+        try:
+            with profiling.stage('fails'):
+                raise ValueError('x')
+        except ValueError:
+            pass
+        with self.subTest():
+            self.assertIsNotNone(profiling.profiler.get('fails').wallTime)
+        with self.subTest():
+            self.assertEqual(profiling.profiler.open, [])
+
+    def test_checkpointStage(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            checkpoints.Checkpoints(tmpDir).stage('vpi', [1], lambda: 1).get()
+            checkpoints.Checkpoints(tmpDir, True).stage('vpi', [1], lambda: 2).get()
+        with self.subTest():
+            self.assertEqual([(r.name, r.resumed) for r in profiling.profiler.stages],
+                             [('vpi', False), ('vpi', True)])
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            metricsFileName = os.path.join(tmpDir, 'metrics.json')
+            profileFileName = os.path.join(tmpDir, 'run.prof')
+            profiling.profiler.startProfile(profileFileName)
+            with profiling.stage('a'):
+                sorted(range(1000), reverse=True)
+            profiling.profiler.stopProfile()
+            profiling.profiler.save(metricsFileName)
+            with open(metricsFileName, 'r') as f:
+                metrics = json.load(f)
+            f.close()
+            with self.subTest():
+                self.assertEqual([record['name'] for record in metrics['stages']], ['a'])
+            with self.subTest():
+                self.assertIn('wall time', metrics['run'])
+            with self.subTest():
+                self.assertGreater(pstats.Stats(profileFileName).total_calls, 0)
+            with self.subTest():
+                # stopping again is a no-op
+                self.assertIsNone(profiling.profiler.stopProfile())
+
+
+if __name__ == '__main__':
+    unittest.main()
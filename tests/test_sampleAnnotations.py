@@ -0,0 +1,73 @@
+import math
+import os
+import sys
+import unittest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import cooccurrenceFinder
+from sampleAnnotations import SampleAnnotations
+from app.report import findBatchEffect
+
+
+def makeAnnoDF(centerColumn):
+    return pd.DataFrame({'sample.id': ['s1', 's2', 's3', 's1'],
+                         centerColumn: ['broad', 'uw', np.nan, 'baylor'],
+                         'study': ['FHS', 'JHS', 'FHS', 'GeneSTAR']})
+
+
+def scanSeqCenterAndStudy(annoDF, individual):
+    # the frame scan the finder did before the index
+    seqCenter = "NA"
+    study = "NA"
+    try:
+        if 'CENTER' in annoDF.columns:
+            seqCenter = annoDF[annoDF['sample.id'] == individual]['CENTER'].iloc[0]
+        elif 'seq_center' in annoDF.columns:
+            seqCenter = annoDF[annoDF['sample.id'] == individual]['seq_center'].iloc[0]
+    except Exception as e:
+        seqCenter = "NA"
+    try:
+        if 'study' in annoDF.columns:
+            study = annoDF[annoDF['sample.id'] == individual]['study'].iloc[0]
+    except Exception as e:
+        study = "NA"
+    return seqCenter, study
+
+
+def sameValue(first, second):
+    return first == second or (isinstance(first, float) and isinstance(second, float) and
+                               math.isnan(first) and math.isnan(second))
+
+
+class TestSampleAnnotations(unittest.TestCase):
+
+    def test_matchesFrameScan(self):
+        for centerColumn in ['CENTER', 'seq_center', 'other']:
+            annoDF = makeAnnoDF(centerColumn)
+            annotations = SampleAnnotations.fromDataFrame(annoDF)
+            samples = ['s1', 's2', 's3', 's4']
+            centers, studies = annotations.join(samples)
+            for i in range(len(samples)):
+                expected = scanSeqCenterAndStudy(annoDF, samples[i])
+                with self.subTest(centerColumn=centerColumn, sample=samples[i]):
+                    self.assertTrue(all(sameValue(a, b) for a, b in zip(annotations.get(samples[i]), expected)))
+                    self.assertTrue(all(sameValue(a, b) for a, b in zip((centers[i], studies[i]), expected)))
+                    self.assertTrue(all(sameValue(a, b) for a, b in
+                                        zip(cooccurrenceFinder.getSeqCenterAndStudy(annoDF, samples[i]), expected)))
+
+    def test_findBatch(self):
+        vpi = {'s1': {'vus': [(('13', 100, 'A', 'G'), '3', 'NA', 'NA')], 'benign': [], 'pathogenic': []},
+               's2': {'vus': [(('13', 100, 'A', 'G'), '1', 'NA', 'NA')], 'benign': [], 'pathogenic': []}}
+        findBatchEffect.countsPerCenter.clear()
+        findBatchEffect.centersPerHomo.clear()
+        findBatchEffect.findBatch(vpi, {'homozygous vus': {}}, SampleAnnotations.fromDataFrame(makeAnnoDF('CENTER')))
+        with self.subTest():
+            self.assertEqual(sorted(findBatchEffect.countsPerCenter), ['broad', 'uw'])
+        with self.subTest():
+            self.assertEqual(findBatchEffect.centersPerHomo["('13', 100, 'A', 'G')"], {'broad'})
+
+
+if __name__ == '__main__':
+    unittest.main()
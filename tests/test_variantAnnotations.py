@@ -0,0 +1,97 @@
+import math
+import os
+import sys
+import unittest
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import cooccurrenceAnalyzer
+import cooccurrenceFinder
+import variantAnnotations
+
+populations = ['Allele_frequency_genome_AFR_GnomAD', 'Allele_frequency_genome_NFE_GnomAD',
+               'Allele_frequency_exome_NFE_GnomAD', 'Allele_frequency_AFR_GnomAD']
+
+
+def makeDF():
+    rows = [['chr13:g.100:A>G', '0.1', '0.3', '0.3', '-'],
+            ['chr13:g.200:C>T', '0', '0', '-', None],
+            ['chr13:g.300:G>A', '0.002', None, '0.001', '0.004'],
+            ['chr13:g.300:G>A', '0.5', '0.5', '0.5', '0.5'],
+            ['-', '0.9', '0.9', '0.9', '0.9']]
+    df = pd.DataFrame(rows, columns=['Genomic_Coordinate_hg38'] + populations)
+    df['Allele_count_genome_AFR_GnomAD'] = '7'
+    return df
+
+
+def scanMax(df, hgString):
+    # the frame scan getMaxGnomad() did before the table
+    maxData = {'frequency': 0.0, 'population': None}
+    for af in populations:
+        alleleFreqList = df[df['Genomic_Coordinate_hg38'] == hgString][af].tolist()
+        if alleleFreqList:
+            try:
+                freq = float(alleleFreqList[0])
+            except (ValueError, TypeError):
+                continue
+            if freq > maxData['frequency']:
+                maxData['frequency'] = freq
+                maxData['population'] = af
+    return maxData
+
+
+def scanMin(df, hgString):
+    minData = {'frequency': 1.1, 'population': None}
+    for af in populations:
+        alleleFreqList = df[df['Genomic_Coordinate_hg38'] == hgString][af].tolist()
+        if alleleFreqList:
+            try:
+                freq = float(alleleFreqList[0])
+            except (ValueError, TypeError):
+                continue
+            if freq < minData['frequency'] and freq != 0.0:
+                minData['frequency'] = freq
+                minData['population'] = af
+    if minData['frequency'] == 1.1:
+        minData['population'] = 0.0
+    return minData
+
+
+class TestVariantAnnotations(unittest.TestCase):
+
+    def test_matchesFrameScan(self):
+        df = makeDF()
+        for variant in [('13', 100, 'A', 'G'), ('13', 200, 'C', 'T'), ('13', 300, 'G', 'A'), ('13', 400, 'T', 'C')]:
+            hgString = 'chr13:g.' + str(variant[1]) + ':' + variant[2] + '>' + variant[3]
+            with self.subTest(variant=variant):
+                self.assertEqual(cooccurrenceAnalyzer.getMaxGnomad(df, str(variant), 38), scanMax(df, hgString))
+                self.assertEqual(cooccurrenceAnalyzer.getMinGnomad(df, variant, 38), scanMin(df, hgString))
+
+    def test_lookups(self):
+        df = makeDF()
+        annotations = variantAnnotations.getVariantAnnotations(df, 38)
+        with self.subTest():
+            self.assertIs(annotations, variantAnnotations.getVariantAnnotations(df, 38))
+        with self.subTest():
+            self.assertEqual(len(annotations), 3)
+        with self.subTest():
+            self.assertEqual(annotations.populations, populations)
+        with self.subTest():
+            self.assertEqual(annotations.getFrequencies(('chr13', '300', 'G', 'A')),
+                             {populations[0]: 0.002, populations[2]: 0.001, populations[3]: 0.004})
+        with self.subTest():
+            self.assertEqual(cooccurrenceFinder.getGnomadData(df, ('13', 100, 'A', 'G'), 38),
+                             (populations[1], 0.3, {populations[0]: 0.1, populations[1]: 0.3, populations[2]: 0.3}))
+        with self.subTest():
+            self.assertEqual(cooccurrenceAnalyzer.getGnomadData(df, ('13', 300, 'G', 'A'), 38, 'NFE')['NFE'], 0.0)
+        with self.subTest():
+            self.assertEqual(cooccurrenceAnalyzer.getGnomadData(df, ('13', 100, 'A', 'G'), 38, 'NFE')['NFE'], 0.3)
+        table = annotations.table()
+        with self.subTest():
+            self.assertEqual(table.loc[('13', 300, 'G', 'A'), 'maxPopulation'], populations[3])
+        with self.subTest():
+            self.assertTrue(math.isnan(table.loc[('13', 200, 'C', 'T'), populations[2]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
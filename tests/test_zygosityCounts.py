@@ -0,0 +1,93 @@
+import os
+import pickle
+import sys
+import unittest
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'cooccurrence'))
+import carrierMatrix
+import partition
+import zygosityCounts
+from tests.test_carrierMatrix import makeVPI
+from tests.test_cooccurrenceFinder import makeRandomVPI
+
+
+def walkVPI(vpi):
+    # the per-individual and per-center walks of the vpi dict the analyzer and report scripts each made
+    perIndividual = dict()
+    perCenter = dict()
+    for individual in vpi:
+        perIndividual[individual] = {c: {'homo': 0, 'hetero': 0} for c in ['benign', 'pathogenic', 'vus']}
+        for variantClass in ['benign', 'pathogenic', 'vus']:
+            for call in vpi[individual][variantClass]:
+                zygosity = 'homo' if call[1] == '3' else 'hetero'
+                perIndividual[individual][variantClass][zygosity] += 1
+                if call[2] not in perCenter:
+                    perCenter[call[2]] = {c: {'homo': 0, 'hetero': 0} for c in ['benign', 'pathogenic', 'vus']}
+                perCenter[call[2]][variantClass][zygosity] += 1
+    return perIndividual, perCenter
+
+
+class TestZygosityCounts(unittest.TestCase):
+
+    def test_matchesWalk(self):
+        vpi = makeVPI()
+        counts = zygosityCounts.getZygosityCounts(vpi)
+        perIndividual, perCenter = walkVPI(vpi)
+        fpi = counts.frequenciesPerIndividual({'s1': 'nfe'})
+        for individual in vpi:
+            with self.subTest(individual=individual):
+                self.assertEqual({c: fpi[individual][c] for c in perIndividual[individual]},
+                                 perIndividual[individual])
+        with self.subTest():
+            self.assertEqual([fpi[i]['ethnicity'] for i in ['s1', 's2', 's3']], ['nfe', None, None])
+        with self.subTest():
+            self.assertEqual(counts.countsPerCenter(), perCenter)
+        with self.subTest():
+            self.assertEqual(counts.genotypeCounts(), {'benign': {'homo': 1, 'hetero': 1},
+                                                       'pathogenic': {'homo': 0, 'hetero': 1},
+                                                       'vus': {'homo': 1, 'hetero': 1}})
+        bVars, pVars, vVars = counts.variantsPerClass()
+        with self.subTest():
+            self.assertEqual(vVars, {('13', 300, 'G', 'A'): {'aa': 1, 'Aa': 1, 'AA': 1}})
+        with self.subTest():
+            self.assertEqual(counts.variantSets()['pathogenic'], {('13', 200, 'C', 'T')})
+        with self.subTest():
+            self.assertEqual([call[:3] for call in counts.homozygousCalls()],
+                             [('s1', ('13', 300, 'G', 'A'), 'vus'), ('s3', ('13', 100, 'A', 'G'), 'benign')])
+
+    def test_tilesAddUp(self):
+        vpi = makeRandomVPI(30, 17, 4)
+        matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpi)
+        whole = zygosityCounts.ZygosityCounts(matrix)
+        for mode in partition.splitModes:
+            counts = zygosityCounts.ZygosityCounts(matrix, (0, 0, 0, 0))
+            for tile in partition.planTiles(matrix.shape[0], matrix.shape[1], 4, mode):
+                # the way the counts come back from a worker process, without the matrix
+                counts.add(pickle.loads(pickle.dumps(zygosityCounts.ZygosityCounts(matrix, tile))))
+            with self.subTest(mode=mode):
+                self.assertEqual(counts.frequenciesPerIndividual(), whole.frequenciesPerIndividual())
+                self.assertEqual(counts.variantsPerClass(), whole.variantsPerClass())
+                self.assertEqual(sorted(counts.homozygousCalls()), sorted(whole.homozygousCalls()))
+
+    def test_sampleAnnotations(self):
+        # seqCenters and studies given per sample replace the ones from the calls
+        vpi = makeRandomVPI(20, 9, 2)
+        matrix = carrierMatrix.CarrierMatrix.fromVariantsPerIndividual(vpi)
+        studies = ['even' if i % 2 == 0 else 'odd' for i in range(len(matrix.samples))]
+        counts = zygosityCounts.ZygosityCounts(matrix, studies=studies)
+        expected = defaultdict(lambda: {c: {'homo': 0, 'hetero': 0} for c in ['benign', 'pathogenic', 'vus']})
+        perIndividual, perCenter = walkVPI(vpi)
+        for i in range(len(matrix.samples)):
+            for variantClass in perIndividual[matrix.samples[i]]:
+                for zygosity in ['homo', 'hetero']:
+                    expected[studies[i]][variantClass][zygosity] += \
+                        perIndividual[matrix.samples[i]][variantClass][zygosity]
+        with self.subTest():
+            self.assertEqual(counts.countsPerStudy(), dict(expected))
+        with self.subTest():
+            self.assertEqual(counts.countsPerCenter(), perCenter)
+
+
+if __name__ == '__main__':
+    unittest.main()
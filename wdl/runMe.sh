@@ -11,9 +11,21 @@ GNOMAD_FILE=/private/groups/patenlab/jcasalet/federated-analysis/data/gnomad_gen
 
 TOP_DIR=/private/groups/patenlab/jcasalet/federated-analysis
 PYTHON_SCRIPT=${TOP_DIR}/app/cooccurrence/cooccurrenceFinder.py
+MODULE_DIR=${TOP_DIR}/app/cooccurrence
 
 miniwdl cromwell /private/groups/patenlab/jcasalet/WDL/myVusCooccur.wdl \
 PYTHON_SCRIPT=${PYTHON_SCRIPT} \
+PYTHON_MODULES=${MODULE_DIR}/gnomadSites.py \
+PYTHON_MODULES=${MODULE_DIR}/genotypeCache.py \
+PYTHON_MODULES=${MODULE_DIR}/partition.py \
+PYTHON_MODULES=${MODULE_DIR}/carrierMatrix.py \
+PYTHON_MODULES=${MODULE_DIR}/carrierArchive.py \
+PYTHON_MODULES=${MODULE_DIR}/haplotypeBitsets.py \
+PYTHON_MODULES=${MODULE_DIR}/sampleAnnotations.py \
+PYTHON_MODULES=${MODULE_DIR}/variantAnnotations.py \
+PYTHON_MODULES=${MODULE_DIR}/jsonWriter.py \
+PYTHON_MODULES=${MODULE_DIR}/checkpoints.py \
+PYTHON_MODULES=${MODULE_DIR}/profiling.py \
 VCF_FILE=${DATA_DIR}/$VCF_FILENAME \
 ANNO_FILE=${DATA_DIR}/freeze8_sample_annot_2020-07-07.txt \
 VARIANT_PATHOGENICITY_FILE=${TOP_DIR}/data/brca-variants.tsv \